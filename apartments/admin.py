@@ -1,15 +1,61 @@
 # apartments/admin.py
 from django.contrib import admin
-from .models import Apartment, Amenity, Review # Импортируем наши модели
+from django.db.models import Q
+from .models import Apartment, Amenity, Review, Booking, ApartmentPhoto # Импортируем наши модели
+from .pagination import EstimatedCountPaginator
+
+# Общие настройки для больших таблиц (миллионы строк):
+# - paginator: оценка количества строк из pg_class вместо COUNT(*) по всей таблице;
+# - show_full_result_count = False: без второго COUNT(*) при поиске/фильтрации;
+# - list_select_related: связанные объекты одним JOIN, а не запросом на строку;
+# - raw_id_fields / autocomplete_fields: без выпадающих списков на всю таблицу;
+# - поиск только по индексам (IndexedSearchMixin), а не через icontains по всему тексту.
+
+
+class IndexedSearchMixin:
+    """
+    Поиск, который не читает таблицу целиком. '=id' в search_fields Django
+    превращает в UPPER("id"::text) = UPPER(%s) - такое выражение индексом не
+    покрыто. Поэтому число ищется точным равенством по search_id_fields
+    (первичный ключ, внешние ключи), имя пользователя - точным (с учётом
+    регистра) равенством по search_username_field через уникальный индекс,
+    остальное - по search_fields с индексами на UPPER(...).
+    """
+    search_id_fields = ('pk',)
+    search_username_field = None
+
+    def get_search_fields(self, request):
+        # Строка поиска показывается и без текстовых полей
+        return self.search_fields or ('pk',)
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.isascii() and term.isdigit() and int(term) < 2 ** 63:
+            condition = Q()
+            for field in self.search_id_fields:
+                condition |= Q(**{field: int(term)})
+            return queryset.filter(condition), False
+        if self.search_username_field:
+            return queryset.filter(**{self.search_username_field: term}), False
+        if self.search_fields:
+            return super().get_search_results(request, queryset, term)
+        return queryset.none(), False
+
 
 # Регистрируем модель Apartment для отображения в админке
 @admin.register(Apartment)
-class ApartmentAdmin(admin.ModelAdmin):
+class ApartmentAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('title', 'city', 'owner', 'price', 'is_active', 'created_at') # Колонки в списке
-    list_filter = ('city', 'is_active', 'apartment_type') # Фильтры справа
-    search_fields = ('title', 'description', 'city', 'address') # Поля для поиска
+    list_filter = ('is_active', 'apartment_type') # Фильтры справа (city убран: SELECT DISTINCT по всей таблице)
+    search_fields = ('^title', '=city') # Текст (индексы apartment_title_upper_idx, apartment_city_upper_idx), число - по id
     list_editable = ('price', 'is_active') # Поля, которые можно редактировать прямо в списке
-    date_hierarchy = 'created_at' # Навигация по дате создания
+    list_select_related = ('owner',)
+    raw_id_fields = ('owner',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # date_hierarchy убран: он строит навигацию запросом по датам всей таблицы
 
 # Регистрируем модель Amenity для отображения в админке
 @admin.register(Amenity)
@@ -18,14 +64,43 @@ class AmenityAdmin(admin.ModelAdmin):
     search_fields = ('name',)
     
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
-    list_display = ('id', 'apartment', 'author', 'text_preview', 'created_at')
-    list_filter = ('created_at', 'author')
-    search_fields = ('text', 'apartment__title', 'author__username')
-    autocomplete_fields = ['apartment'] 
+class ReviewAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ('id', 'apartment', 'author', 'rating', 'text_preview', 'created_at')
+    list_filter = ('created_at', 'rating')
+    search_fields = ()
+    search_id_fields = ('pk', 'apartment_id')
+    search_username_field = 'author__username'
+    autocomplete_fields = ['apartment']
+    raw_id_fields = ('author',)
+    list_select_related = ('apartment', 'author')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     @admin.display(description='Текст отзыва')
     def text_preview(self, obj):
         # Функция для отображения короткой версии текста в списке
         from django.utils.html import escape
         return escape(obj.text[:50]) + '...' if len(obj.text) > 50 else escape(obj.text)
+
+@admin.register(Booking)
+class BookingAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ('id', 'apartment', 'user', 'check_in_date', 'check_out_date', 'total_price', 'status', 'created_at')
+    list_filter = ('status',)
+    search_fields = ()
+    search_id_fields = ('pk', 'apartment_id')
+    search_username_field = 'user__username'
+    raw_id_fields = ('apartment', 'user')
+    list_select_related = ('apartment', 'user')
+    readonly_fields = ('created_at', 'updated_at')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+@admin.register(ApartmentPhoto)
+class ApartmentPhotoAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ('id', 'apartment', 'image')
+    search_fields = ()
+    search_id_fields = ('pk', 'apartment_id')
+    raw_id_fields = ('apartment',)
+    list_select_related = ('apartment',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
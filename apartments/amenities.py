@@ -0,0 +1,30 @@
+# apartments/amenities.py
+"""
+Справочник удобств из двухуровневого кэша (uibar_project_new/tiered_cache.py).
+
+Удобства меняются редко (через админку), а читаются на каждом /api/amenities/,
+при проверке amenity_ids в создании/изменении квартиры и в импорте. Весь
+справочник - одна запись кэша; после сохранения или удаления удобства версия
+сбрасывается (signals.py), другие воркеры видят изменение не позже чем через
+CACHE_VERSION_CHECK_SECONDS.
+"""
+from uibar_project_new.tiered_cache import TieredCache
+
+from .models import Amenity
+
+NAMESPACE = 'amenities'
+
+cache = TieredCache('amenities')
+
+
+def all_amenities():
+    """Все удобства (экземпляры Amenity) в порядке Amenity.Meta.ordering."""
+    return cache.get_or_set('all', lambda: list(Amenity.objects.all()), namespace=NAMESPACE)
+
+
+def by_id():
+    return {amenity.pk: amenity for amenity in all_amenities()}
+
+
+def invalidate():
+    cache.invalidate(NAMESPACE)
@@ -0,0 +1,161 @@
+# apartments/analytics.py
+"""
+Помесячная статистика квартир (ApartmentMonthlyStats) для аналитики владельца.
+
+Бронирование раскладывается по месяцам, в которые попадают его ночи; выручка
+делится пропорционально ночам. При изменении бронирования пересчитываются
+только затронутые месяцы этой квартиры (refresh_apartment_months), а команда
+rebuild_monthly_stats пересобирает таблицу целиком одним проходом по броням.
+"""
+import calendar
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import BOOKING_MAX_NIGHTS, ApartmentMonthlyStats, Booking
+
+# Статусы, которые считаются занятыми ночами и выручкой
+COUNTED_STATUSES = (Booking.BookingStatus.CONFIRMED, Booking.BookingStatus.COMPLETED)
+
+CENT = Decimal('0.01')
+BATCH_SIZE = 1000
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(month):
+    return (month + datetime.timedelta(days=32)).replace(day=1)
+
+
+def days_in_month(month):
+    return calendar.monthrange(month.year, month.month)[1]
+
+
+def split_by_month(check_in, check_out, total_price):
+    """
+    Раскладывает проживание [check_in, check_out) по месяцам.
+    Возвращает список (месяц, ночей, выручка); сумма выручки равна total_price.
+    """
+    total_nights = (check_out - check_in).days
+    if total_nights <= 0:
+        return []
+    parts = []
+    start = check_in
+    allocated = Decimal('0')
+    while start < check_out:
+        month = month_start(start)
+        end = min(next_month(month), check_out)
+        nights = (end - start).days
+        if end == check_out:
+            # Остаток - в последний месяц, чтобы копейки не терялись при округлении
+            revenue = total_price - allocated
+        else:
+            revenue = (total_price * nights / total_nights).quantize(CENT)
+            allocated += revenue
+        parts.append((month, nights, revenue))
+        start = end
+    return parts
+
+
+def months_of_stay(check_in, check_out):
+    """Множество месяцев, в которые попадают ночи проживания."""
+    return {month for month, _, _ in split_by_month(check_in, check_out, Decimal('0'))}
+
+
+def _accumulate(totals, apartment_id, check_in, check_out, total_price, months=None):
+    for index, (month, nights, revenue) in enumerate(split_by_month(check_in, check_out, total_price)):
+        if months is not None and month not in months:
+            continue
+        row = totals[(apartment_id, month)]
+        row['nights_booked'] += nights
+        row['revenue'] += revenue
+        if index == 0:
+            row['bookings_count'] += 1
+
+
+def _new_totals():
+    return defaultdict(lambda: {'nights_booked': 0, 'bookings_count': 0, 'revenue': Decimal('0')})
+
+
+def _stats_objects(totals):
+    return [
+        ApartmentMonthlyStats(apartment_id=apartment_id, month=month, **values)
+        for (apartment_id, month), values in totals.items()
+    ]
+
+
+def refresh_apartment_months(apartment_id, months):
+    """
+    Пересчитывает статистику квартиры за указанные месяцы по текущим броням.
+    Операция идемпотентна: результат зависит только от состояния броней.
+    """
+    months = set(months)
+    if not months:
+        return
+    period_start = min(months)
+    period_end = next_month(max(months))
+
+    bookings = Booking.objects.filter(
+        apartment_id=apartment_id,
+        status__in=COUNTED_STATUSES,
+        check_in_date__lt=period_end,
+        # Длиннее BOOKING_MAX_NIGHTS проживаний нет - читаются только секции нужных месяцев
+        check_in_date__gt=period_start - datetime.timedelta(days=BOOKING_MAX_NIGHTS),
+        check_out_date__gt=period_start,
+    ).values_list('check_in_date', 'check_out_date', 'total_price')
+
+    totals = _new_totals()
+    for check_in, check_out, total_price in bookings:
+        _accumulate(totals, apartment_id, check_in, check_out, total_price, months)
+
+    with transaction.atomic():
+        ApartmentMonthlyStats.objects.filter(apartment_id=apartment_id, month__in=months).exclude(
+            month__in=[month for _, month in totals]
+        ).delete()
+        ApartmentMonthlyStats.objects.bulk_create(
+            _stats_objects(totals),
+            update_conflicts=True,
+            unique_fields=['apartment', 'month'],
+            update_fields=['nights_booked', 'bookings_count', 'revenue', 'updated_at'],
+        )
+
+
+def rebuild_all():
+    """
+    Полностью пересобирает таблицу статистики. Возвращает количество строк.
+    Статистика месяцев раньше самой старой оставшейся секции бронирований
+    сохраняется: брони этих месяцев выгружены в архив (archive_booking_partitions).
+    Граница - секции, а не самая ранняя бронь: после архивации таблица может
+    быть пустой, и тогда удалилась бы вся статистика архивных месяцев.
+    """
+    from .partitioning import oldest_partition_month  # partitioning импортирует analytics
+
+    archived_before = oldest_partition_month()
+    first = Booking.objects.order_by('check_in_date').values_list('check_in_date', flat=True).first()
+    if archived_before is not None and first is not None:
+        # Брони старых месяцев, попавшие в секцию по умолчанию, тоже пересчитываются
+        archived_before = min(archived_before, month_start(first))
+    bookings = Booking.objects.filter(status__in=COUNTED_STATUSES).values_list(
+        'apartment_id', 'check_in_date', 'check_out_date', 'total_price'
+    ).iterator(chunk_size=BATCH_SIZE)
+
+    totals = _new_totals()
+    for apartment_id, check_in, check_out, total_price in bookings:
+        _accumulate(totals, apartment_id, check_in, check_out, total_price)
+
+    objects = _stats_objects(totals)
+    with transaction.atomic():
+        stale = ApartmentMonthlyStats.objects.all()
+        if archived_before is not None:
+            stale = stale.filter(month__gte=archived_before)
+        stale.delete()
+        ApartmentMonthlyStats.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+    return len(objects)
+
+
+def occupancy_rate(month, nights_booked):
+    return round(nights_booked / days_in_month(month), 4)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ApartmentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apartments'
+
+    def ready(self):
+        # Подключаем обработчики сигналов (статистика и т.д.)
+        from . import signals  # noqa: F401
@@ -0,0 +1,92 @@
+# apartments/availability.py
+"""
+Доступность и стоимость многих квартир на одни даты (POST /api/apartments/availability/):
+карточки поисковой выдачи с выбранными датами - одним запросом вместо запроса
+на карточку.
+
+На промахе кэша три запроса к БД на любое число квартир: цены активных квартир,
+одна проверка пересечения с актуальными бронями (частичный индекс
+booking_active_dates_idx, только секции последних месяцев) и правила цен для pricing.quote_many.
+
+Результат по квартире кэшируется на диапазон дат по ключу с версией квартиры:
+availability:<версия>:<id>:<заезд>:<выезд>. Версия меняется после коммита
+изменений броней, правил цен и самой квартиры (signals.py) - прежние записи
+перестают читаться и истекают через AVAILABILITY_CACHE_SECONDS. Запрос,
+полностью попавший в кэш, к БД не обращается. Новая версия сразу действует во
+всех воркерах, если CACHES['default'] - Redis (CACHE_REDIS_URL, settings.py);
+с LocMemCache (разработка) у каждого процесса свой кэш, и изменения из другого
+воркера видны не позже чем через AVAILABILITY_CACHE_SECONDS.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from uibar_project_new.metrics import record_cache_access
+
+from . import partitioning, pricing
+from .models import Apartment, Booking
+
+# Брони, которые занимают даты (как в частичном индексе booking_active_dates_idx)
+ACTIVE_STATUSES = [Booking.BookingStatus.PENDING, Booking.BookingStatus.CONFIRMED]
+
+# Отметка в кэше (пустой словарь) для неактивной или несуществующей квартиры - повтор тоже без БД
+MISSING = {}
+
+
+def _version_key(apartment_id):
+    return f'availability:version:{apartment_id}'
+
+
+def _versions(ids):
+    """Текущие версии квартир; отсутствующую (вытеснена из кэша) заменяем новой."""
+    keys = {pk: _version_key(pk) for pk in ids}
+    stored = cache.get_many(keys.values())
+    versions = {pk: stored[key] for pk, key in keys.items() if key in stored}
+    missing = {keys[pk]: time.time_ns() for pk in ids if pk not in versions}
+    if missing:
+        # Новая версия, а не 0: иначе после вытеснения ключа версии читались бы старые записи
+        cache.set_many(missing, timeout=None)
+        versions.update({pk: missing[keys[pk]] for pk in ids if pk not in versions})
+    return versions
+
+
+def invalidate(apartment_ids):
+    """Сбросить закэшированную доступность квартир после коммита текущей транзакции."""
+    keys = [_version_key(pk) for pk in set(apartment_ids)]
+    transaction.on_commit(lambda: cache.set_many({key: time.time_ns() for key in keys}, timeout=None))
+
+
+def _compute(ids, check_in, check_out):
+    prices = dict(Apartment.objects.filter(pk__in=ids, is_active=True).values_list('id', 'price'))
+    active = Booking.objects.filter(apartment_id__in=list(prices), status__in=ACTIVE_STATUSES)
+    booked = set(
+        partitioning.overlapping_bookings(active, check_in, check_out)
+        .order_by().values_list('apartment_id', flat=True).distinct()
+    )
+    quotes = pricing.quote_many({pk: prices[pk] for pk in ids if pk in prices}, check_in, check_out)
+    results = {pk: MISSING for pk in ids}
+    for pk, quote in quotes.items():
+        results[pk] = {**quote.as_dict(), 'available': pk not in booked}
+    return results
+
+
+def check_availability(ids, check_in, check_out):
+    """Доступность и стоимость квартир ids (в том же порядке, неактивные пропускаются)."""
+    versions = _versions(ids)
+    keys = {pk: f'availability:{versions[pk]}:{pk}:{check_in}:{check_out}' for pk in ids}
+    cached = cache.get_many(keys.values())
+    results = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    for pk in ids:
+        record_cache_access('availability', pk in results)
+
+    missing = [pk for pk in ids if pk not in results]
+    if missing:
+        fresh = _compute(missing, check_in, check_out)
+        cache.set_many(
+            {keys[pk]: value for pk, value in fresh.items()},
+            timeout=getattr(settings, 'AVAILABILITY_CACHE_SECONDS', 60),
+        )
+        results.update(fresh)
+    return [results[pk] for pk in ids if results[pk]]
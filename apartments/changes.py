@@ -0,0 +1,139 @@
+# apartments/changes.py
+"""
+Лента изменений каталога для инкрементальной синхронизации (GET /api/apartments/changes/).
+
+Клиент хранит курсор - позицию (время изменения, id) последней полученной
+записи - и на следующем опросе получает только то, что изменилось после неё:
+
+* changes - созданные и изменённые активные квартиры (в формате списка квартир);
+* tombstones - квартиры, которые нужно убрать: снятые с публикации
+  (is_active=False, reason='deactivated') и удалённые (reason='deleted').
+
+Карточки содержат названия удобств, поэтому переименование или удаление
+удобства обновляет updated_at его квартир (signals.py) - они снова попадают в ленту.
+
+Оба источника читаются по индексу с условием (время, id) > курсор и сливаются
+по этому же ключу, поэтому страница всегда продолжает предыдущую без пропусков
+и повторов. Записи моложе CHANGES_FEED_LAG_SECONDS не отдаются: updated_at
+проставляется до коммита транзакции, и строка, закоммиченная чуть позже
+соседней, иначе могла бы оказаться позади уже выданного курсора. Последняя
+(в том числе пустая) страница сдвигает курсор до этой границы, так что курсор
+клиента, который регулярно опрашивает ленту, не стареет и при неизменном каталоге.
+
+Курсор устаревает (410), только если следы удалений после него уже вычищены:
+purge_apartment_tombstones оставляет отметку TombstonePurge, и курсор раньше
+последней отметки мог пропустить удаления.
+"""
+import base64
+import binascii
+import datetime
+import heapq
+
+from django.conf import settings
+from django.db.models import F, Max
+from django.db.models.fields.tuple_lookups import Tuple, TupleGreaterThan
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+
+from .fastpath import build_plan, represent_ids
+from .models import Apartment, ApartmentTombstone, TombstonePurge
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 1000
+
+
+class CursorExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = "Deletions after this cursor have been purged, a full resync is required."
+    default_code = 'cursor_expired'
+
+
+def encode_cursor(changed_at, pk):
+    raw = f'{changed_at.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode()
+        changed_at, pk = raw.split('|')
+        changed_at = datetime.datetime.fromisoformat(changed_at)
+        pk = int(pk)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise serializers.ValidationError({'since': "Invalid cursor."})
+    if timezone.is_naive(changed_at):
+        raise serializers.ValidationError({'since': "Invalid cursor."})
+    return changed_at, pk
+
+
+def _after(queryset, time_field, id_field, cursor, until):
+    queryset = queryset.filter(**{f'{time_field}__lt': until})
+    if cursor is not None:
+        queryset = queryset.filter(TupleGreaterThan(Tuple(F(time_field), F(id_field)), cursor))
+    return queryset.order_by(time_field, id_field)
+
+
+class ChangesFeed:
+    """Одна страница ленты после курсора since (None - с самого начала)."""
+
+    def __init__(self, serializer, since=None, limit=DEFAULT_LIMIT):
+        self.serializer = serializer
+        self.cursor = decode_cursor(since) if since else None
+        self.limit = limit
+        if self.cursor is not None:
+            purged_before = TombstonePurge.objects.aggregate(value=Max('purged_before'))['value']
+            if purged_before is not None and self.cursor[0] < purged_before:
+                # Следы удалённых после курсора квартир могли быть уже вычищены - догнать по ленте нельзя
+                raise CursorExpired()
+        self.until = timezone.now() - datetime.timedelta(seconds=getattr(settings, 'CHANGES_FEED_LAG_SECONDS', 5))
+
+    def _apartment_rows(self, plan):
+        queryset = _after(Apartment.objects.all(), 'updated_at', 'id', self.cursor, self.until)
+        columns = {'id', 'is_active', 'updated_at'} | (plan.columns if plan else set())
+        for row in queryset.select_related(None).values(*sorted(columns))[:self.limit + 1]:
+            yield (row['updated_at'], row['id'], row)
+
+    def _tombstone_rows(self):
+        queryset = _after(ApartmentTombstone.objects.all(), 'deleted_at', 'apartment_id', self.cursor, self.until)
+        for changed_at, pk in queryset.values_list('deleted_at', 'apartment_id')[:self.limit + 1]:
+            yield (changed_at, pk, None)
+
+    def page(self):
+        plan = build_plan(self.serializer)
+        merged = heapq.merge(self._apartment_rows(plan), self._tombstone_rows(), key=lambda item: item[:2])
+        items = []
+        for item in merged:
+            items.append(item)
+            if len(items) > self.limit:
+                break
+        has_more = len(items) > self.limit
+        items = items[:self.limit]
+
+        active, tombstones = [], []
+        for changed_at, pk, row in items:
+            if row is None:
+                tombstones.append({'id': pk, 'reason': 'deleted', 'changed_at': changed_at})
+            elif not row['is_active']:
+                tombstones.append({'id': pk, 'reason': 'deactivated', 'changed_at': changed_at})
+            else:
+                active.append(row)
+
+        if has_more:
+            next_cursor = encode_cursor(*items[-1][:2])
+        else:
+            # Всё до until уже выдано (в том числе пустая страница) - следующая начнётся с этой границы
+            next_cursor = encode_cursor(self.until, 0)
+        return {
+            'changes': self._represent(plan, active),
+            'tombstones': tombstones,
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+        }
+
+    def _represent(self, plan, rows):
+        if plan is not None:
+            return plan.represent(rows)
+        # Сериализатор не поддерживается быстрым путём - обычная сериализация моделей
+        apartments = Apartment.objects.select_related('owner').prefetch_related('amenities', 'photos')
+        return represent_ids(self.serializer, apartments, [row['id'] for row in rows])
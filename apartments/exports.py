@@ -0,0 +1,105 @@
+# apartments/exports.py
+"""
+Потоковая выгрузка бронирований и объявлений владельца в CSV/JSONL.
+
+Строки читаются серверным курсором (.iterator(chunk_size=...)) в виде
+кортежей values_list() - без создания моделей и сериализаторов,
+и сразу отдаются клиенту, поэтому потребление памяти не зависит от
+размера выгрузки.
+"""
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Apartment, Booking
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# Сколько строк забирать из курсора за один раз
+CHUNK_SIZE = 2000
+# Примерный размер куска ответа: склеиваем строки, чтобы не отдавать их по одной
+BUFFER_SIZE = 64 * 1024
+
+# (поле для values_list, имя колонки в выгрузке)
+BOOKING_COLUMNS = [
+    ('id', 'id'),
+    ('apartment_id', 'apartment_id'),
+    ('apartment__title', 'apartment_title'),
+    ('user__username', 'guest'),
+    ('check_in_date', 'check_in_date'),
+    ('check_out_date', 'check_out_date'),
+    ('total_price', 'total_price'),
+    ('status', 'status'),
+    ('created_at', 'created_at'),
+]
+
+APARTMENT_COLUMNS = [
+    ('id', 'id'),
+    ('title', 'title'),
+    ('city', 'city'),
+    ('address', 'address'),
+    ('price', 'price'),
+    ('apartment_type', 'apartment_type'),
+    ('max_guests', 'max_guests'),
+    ('beds', 'beds'),
+    ('is_active', 'is_active'),
+    ('latitude', 'latitude'),
+    ('longitude', 'longitude'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+]
+
+
+def owner_bookings(user):
+    """Бронирования всех квартир владельца."""
+    return Booking.objects.filter(apartment__owner=user).order_by('id'), BOOKING_COLUMNS
+
+
+def owner_apartments(user):
+    """Все объявления владельца, включая неактивные."""
+    return Apartment.objects.filter(owner=user).order_by('id'), APARTMENT_COLUMNS
+
+
+RESOURCES = {
+    'bookings': owner_bookings,
+    'apartments': owner_apartments,
+}
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: возвращает записанную строку вместо буферизации."""
+
+    def write(self, value):
+        return value
+
+
+def _iter_lines(queryset, columns, fmt):
+    rows = queryset.values_list(*(field for field, _ in columns)).iterator(chunk_size=CHUNK_SIZE)
+    names = [name for _, name in columns]
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(names)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+        for row in rows:
+            yield encoder.encode(dict(zip(names, row))) + '\n'
+
+
+def stream_export(queryset, columns, fmt):
+    """Генератор кусков ответа (bytes) размером около BUFFER_SIZE."""
+    buffer = []
+    size = 0
+    for line in _iter_lines(queryset, columns, fmt):
+        buffer.append(line)
+        size += len(line)
+        if size >= BUFFER_SIZE:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
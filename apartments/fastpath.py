@@ -0,0 +1,206 @@
+# apartments/fastpath.py
+"""
+Быстрое чтение списков через values() вместо экземпляров моделей.
+
+Обычный путь DRF для каждой строки создаёт экземпляр модели, а затем для каждого
+поля сериализатора вызывает get_attribute/to_representation. ValuesPlan один раз
+разбирает сериализатор и строит план: какие колонки взять через values(), как
+собрать вложенные объекты (ForeignKey - из тех же строк через JOIN, списки
+many=True - одним запросом на страницу) и каким полем DRF отформатировать значение.
+Форматирование делают те же поля сериализатора, поэтому ответ совпадает с
+обычным путём байт в байт.
+
+Поддерживаются простые поля модели, вложенные ModelSerializer по ForeignKey,
+вложенные списки (ManyToMany и обратный ForeignKey) и PrimaryKeyRelatedField.
+Если в сериализаторе есть что-то другое (SerializerMethodField, source через
+точку и т.п.), план не строится и ViewSet работает обычным путём.
+"""
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from rest_framework import relations, serializers
+from rest_framework.response import Response
+
+
+class Unsupported(Exception):
+    pass
+
+
+class _Column:
+    """Простое поле: значение из колонки values(), форматирование - полем DRF."""
+
+    def __init__(self, field, key, model_field):
+        self.name = field.field_name
+        self.key = key
+        self.to_representation = field.to_representation
+        self.wrap = None
+        if isinstance(model_field, models.FileField):
+            # ImageField/FileField сериализатора ждут FieldFile (ему нужен .url)
+            self.wrap = lambda name: model_field.attr_class(None, model_field, name)
+        elif isinstance(field, relations.RelatedField):
+            self.wrap = lambda pk: relations.PKOnlyObject(pk=pk)
+
+    def represent(self, row, related):
+        value = row[self.key]
+        if value is None:
+            return None
+        if self.wrap is not None:
+            value = self.wrap(value)
+        return self.to_representation(value)
+
+
+class _Nested:
+    """Вложенный сериализатор по ForeignKey: колонки с префиксом из той же строки."""
+
+    def __init__(self, field, plan):
+        self.name = field.field_name
+        self.plan = plan
+
+    def represent(self, row, related):
+        if row[self.plan.pk_key] is None:
+            return None
+        return self.plan.represent_row(row, related)
+
+
+class _RelatedList:
+    """Вложенный список (many=True): строки загружаются отдельно для всей страницы."""
+
+    def __init__(self, field, plan, link, parent_pk_key):
+        self.name = field.field_name
+        self.plan = plan
+        self.link = link # Имя колонки со ссылкой на родителя в запросе связанной модели
+        self.parent_pk_key = parent_pk_key
+
+    def represent(self, row, related):
+        rows = related[self.name].get(row[self.parent_pk_key], ())
+        return [self.plan.represent_row(item, {}) for item in rows]
+
+
+class ValuesPlan:
+    """План чтения для сериализатора модели; prefix - путь до вложенной модели ('owner__')."""
+
+    def __init__(self, serializer, prefix=''):
+        if not isinstance(serializer, serializers.ModelSerializer):
+            raise Unsupported(type(serializer).__name__)
+        self.model = serializer.Meta.model
+        self.prefix = prefix
+        self.pk_key = prefix + self.model._meta.pk.attname
+        self.columns = {self.pk_key}
+        self.items = []
+        self.lists = []
+        for field in serializer._readable_fields:
+            self.items.append(self._compile(field))
+
+    def _model_field(self, source):
+        if '.' in source or source == '*':
+            raise Unsupported(source)
+        try:
+            return self.model._meta.get_field(source)
+        except FieldDoesNotExist:
+            raise Unsupported(source)
+
+    def _compile(self, field):
+        if isinstance(field, serializers.ListSerializer):
+            return self._compile_list(field)
+        model_field = self._model_field(field.source)
+        if isinstance(field, serializers.BaseSerializer):
+            if not (model_field.many_to_one or model_field.one_to_one) or not model_field.concrete:
+                raise Unsupported(field.source)
+            nested = ValuesPlan(field, prefix=f'{self.prefix}{field.source}__')
+            if nested.lists:
+                raise Unsupported(field.source)
+            self.columns |= nested.columns
+            return _Nested(field, nested)
+        if isinstance(field, (serializers.SerializerMethodField, serializers.HiddenField)):
+            raise Unsupported(field.field_name)
+        if isinstance(field, relations.RelatedField) and not isinstance(field, relations.PrimaryKeyRelatedField):
+            raise Unsupported(field.field_name)
+        if model_field.is_relation and not (model_field.many_to_one or model_field.one_to_one):
+            raise Unsupported(field.source)
+        if not model_field.concrete:
+            raise Unsupported(field.source)
+        key = self.prefix + model_field.name
+        self.columns.add(key)
+        return _Column(field, key, model_field)
+
+    def _compile_list(self, field):
+        if self.prefix:
+            raise Unsupported(field.source)
+        model_field = self._model_field(field.source)
+        if model_field.many_to_many and model_field.concrete:
+            link = model_field.related_query_name() # Прямой ManyToMany: путь от связанной модели
+        elif model_field.one_to_many or (model_field.many_to_many and not model_field.concrete):
+            link = model_field.field.name # Обратная связь: имя ForeignKey/ManyToMany на той стороне
+        else:
+            raise Unsupported(field.source)
+        plan = ValuesPlan(field.child)
+        if plan.lists:
+            raise Unsupported(field.source)
+        item = _RelatedList(field, plan, link, self.pk_key)
+        self.lists.append(item)
+        return item
+
+    def values_queryset(self, queryset):
+        """values() по фильтрам, сортировке и JOIN исходного queryset (prefetch не нужен)."""
+        return queryset.prefetch_related(None).values(*sorted(self.columns))
+
+    def fetch_related(self, rows):
+        """Один запрос на каждый вложенный список для всех строк страницы."""
+        related = {}
+        if not rows:
+            return {item.name: {} for item in self.lists}
+        ids = [row[self.pk_key] for row in rows]
+        for item in self.lists:
+            grouped = {}
+            queryset = item.plan.model._default_manager.filter(**{f'{item.link}__in': ids})
+            # Порядок - сортировка связанной модели по умолчанию, как у prefetch_related
+            for child in queryset.values(item.link, *sorted(item.plan.columns)):
+                grouped.setdefault(child[item.link], []).append(child)
+            related[item.name] = grouped
+        return related
+
+    def represent_row(self, row, related):
+        return {item.name: item.represent(row, related) for item in self.items}
+
+    def represent(self, rows):
+        related = self.fetch_related(rows)
+        return [self.represent_row(row, related) for row in rows]
+
+
+def build_plan(serializer):
+    """ValuesPlan для сериализатора или None, если он не поддерживается."""
+    try:
+        return ValuesPlan(serializer)
+    except Unsupported:
+        return None
+
+
+def represent_ids(serializer, queryset, ids):
+    """Объекты queryset с первичными ключами ids в порядке ids (быстрым путём, если он поддерживается)."""
+    plan = build_plan(serializer)
+    if plan is not None:
+        rows = {row[plan.pk_key]: row for row in plan.values_queryset(queryset.filter(pk__in=ids))}
+        return plan.represent([rows[pk] for pk in ids if pk in rows])
+    objects = {obj.pk: obj for obj in queryset.filter(pk__in=ids)}
+    return type(serializer)([objects[pk] for pk in ids if pk in objects], many=True, context=serializer.context).data
+
+
+class ValuesListMixin:
+    """
+    ViewSet: list() через ValuesPlan. Фильтры, сортировка и пагинация - обычные,
+    меняется только способ чтения и сериализации строк. Отключается настройкой
+    FAST_LIST_ENABLED = False или атрибутом fast_list = False.
+    """
+    fast_list = True
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_serializer()
+        plan = build_plan(serializer) if self.fast_list and getattr(settings, 'FAST_LIST_ENABLED', True) else None
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = plan.values_queryset(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(plan.represent(list(page)))
+        return Response(plan.represent(list(queryset)))
@@ -0,0 +1,135 @@
+# apartments/filters.py
+from functools import reduce
+import math
+import operator
+
+from django.conf import settings
+from django.contrib.postgres.fields import ArrayField
+from django.db.models import BigIntegerField, F, FloatField, Func, IntegerField, Q, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+from rest_framework import filters, serializers, status
+from rest_framework.exceptions import APIException
+from rest_framework.settings import api_settings
+
+from . import geo, search
+
+MAX_RADIUS_KM = 500 # Больше - это уже не "рядом", а весь регион
+MAX_QUERY_LENGTH = 200
+
+
+class SearchIndexUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Search index is not built yet."
+    default_code = 'search_index_unavailable'
+
+
+def parse_bbox(value):
+    """
+    Разбирает параметр bbox=min_lat,min_lng,max_lat,max_lng.
+    Бросает ValidationError при некорректном значении.
+    """
+    try:
+        min_lat, min_lng, max_lat, max_lng = (float(part) for part in value.split(','))
+    except ValueError:
+        raise serializers.ValidationError({'bbox': "Expected 'min_lat,min_lng,max_lat,max_lng'."})
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lng <= max_lng <= 180):
+        raise serializers.ValidationError({'bbox': "Invalid bounding box coordinates."})
+    return min_lat, min_lng, max_lat, max_lng
+
+
+def _parse_float(params, name, low, high):
+    try:
+        value = float(params[name])
+    except (KeyError, ValueError):
+        raise serializers.ValidationError({name: "A number is required."})
+    if not low <= value <= high:
+        raise serializers.ValidationError({name: f"Must be between {low} and {high}."})
+    return value
+
+
+def haversine_expression(latitude, longitude):
+    """SQL-выражение расстояния (км) от точки до координат квартиры."""
+    phi = Radians(F('latitude'))
+    phi0 = Value(math.radians(latitude), output_field=FloatField())
+    lmb0 = Value(math.radians(longitude), output_field=FloatField())
+    a = (
+        Power(Sin((phi - phi0) / 2), 2)
+        + Cos(phi0) * Cos(phi) * Power(Sin((Radians(F('longitude')) - lmb0) / 2), 2)
+    )
+    # Least защищает asin от погрешности округления (аргумент чуть больше 1)
+    return Value(2 * geo.EARTH_RADIUS_KM, output_field=FloatField()) * ASin(
+        Least(Sqrt(a), Value(1.0, output_field=FloatField()))
+    )
+
+
+def filter_bbox(queryset, bbox):
+    """
+    Оставляет квартиры внутри прямоугольника.
+    Сначала отсекаем по префиксам geohash (использует индекс), затем точное
+    сравнение координат.
+    """
+    min_lat, min_lng, max_lat, max_lng = bbox
+    prefixes = geo.cover_bbox(bbox)
+    cells = reduce(operator.or_, (Q(geohash__startswith=prefix) for prefix in prefixes))
+    return queryset.filter(cells).filter(
+        latitude__gte=min_lat, latitude__lte=max_lat,
+        longitude__gte=min_lng, longitude__lte=max_lng,
+    )
+
+
+class GeoFilterBackend(filters.BaseFilterBackend):
+    """
+    Гео-фильтрация списка квартир:
+    - ?bbox=min_lat,min_lng,max_lat,max_lng - квартиры в прямоугольнике карты;
+    - ?lat=..&lng=..&radius=.. (км) - квартиры в радиусе от точки,
+      к каждой добавляется distance_km.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        if 'bbox' in params:
+            queryset = filter_bbox(queryset, parse_bbox(params['bbox']))
+
+        if 'radius' in params or 'lat' in params or 'lng' in params:
+            latitude = _parse_float(params, 'lat', -90, 90)
+            longitude = _parse_float(params, 'lng', -180, 180)
+            radius = _parse_float(params, 'radius', 0, MAX_RADIUS_KM)
+            queryset = filter_bbox(queryset, geo.bbox_around(latitude, longitude, radius))
+            queryset = queryset.annotate(
+                distance_km=haversine_expression(latitude, longitude)
+            ).filter(distance_km__lte=radius)
+
+        return queryset
+
+
+class TextSearchFilterBackend(filters.BaseFilterBackend):
+    """
+    Текстовый поиск ?q=... по названию и описанию (TF-IDF, см. search.py).
+    Остальные фильтры применяются к SEARCH_MAX_RESULTS лучшим совпадениям;
+    без явного ?ordering= результаты идут по убыванию релевантности, поэтому
+    бэкенд подключается после OrderingFilter.
+    """
+    search_param = 'q'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        if len(query) > MAX_QUERY_LENGTH:
+            raise serializers.ValidationError({self.search_param: f"At most {MAX_QUERY_LENGTH} characters."})
+        index = search.get_index()
+        if index is None:
+            raise SearchIndexUnavailable()
+        ids = [pk for pk, _ in index.search(query, getattr(settings, 'SEARCH_MAX_RESULTS', 1000))]
+        if not ids:
+            return queryset.none()
+        queryset = queryset.filter(pk__in=ids)
+        if api_settings.ORDERING_PARAM in request.query_params:
+            return queryset
+        # Порядок выдачи индекса: позиция id в массиве, переданном параметром запроса
+        rank = Func(
+            Value(ids, output_field=ArrayField(BigIntegerField())), F('pk'),
+            function='array_position', output_field=IntegerField(),
+        )
+        return queryset.order_by(rank)
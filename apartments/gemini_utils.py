@@ -4,6 +4,8 @@ import google.generativeai as genai
 from django.conf import settings # Для доступа к ключу из настроек
 import logging # Для логгирования ошибок
 
+from uibar_project_new.metrics import GEMINI_FAILURES, track_gemini
+
 # Получаем логгер
 logger = logging.getLogger(__name__)
 
@@ -45,6 +47,7 @@ def generate_apartment_description(apartment):
     """
     if not model:
         logger.warning("Gemini model not configured. Cannot generate description.")
+        GEMINI_FAILURES.labels('generate_description', 'not_configured').inc()
         return None # Возвращаем None, если модель не настроена
 
     # Форматируем данные для промпта
@@ -63,10 +66,11 @@ def generate_apartment_description(apartment):
     logger.debug(f"Generating description for apartment {apartment.id} with prompt:\n{prompt}")
 
     try:
-        # Отправляем запрос к API
-        response = model.generate_content(prompt)
-        # Извлекаем текст из ответа
-        generated_text = response.text
+        # Отправляем запрос к API (время и отказы попадают в метрики)
+        with track_gemini('generate_description'):
+            response = model.generate_content(prompt)
+            # Извлекаем текст из ответа
+            generated_text = response.text
         logger.info(f"Successfully generated description for apartment {apartment.id}")
         return generated_text
     except Exception as e:
@@ -0,0 +1,152 @@
+# apartments/geo.py
+"""
+Гео-утилиты без PostGIS: geohash, покрытие прямоугольника ячейками
+и формула гаверсинуса.
+
+Geohash хранится в Apartment.geohash, поэтому поиск "в прямоугольнике" или
+"в радиусе" сначала отсекает кандидатов по префиксам geohash (индекс),
+а уже потом применяет точный фильтр по расстоянию.
+"""
+import math
+
+# Алфавит geohash (base32 без a, i, l, o)
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+GEOHASH_PRECISION = 9 # ~5 м, храним в базе с таким запасом
+EARTH_RADIUS_KM = 6371.0088
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Кодирует координаты в строку geohash заданной длины."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bit = 0
+    ch = 0
+    even = True # Чётные биты кодируют долготу, нечётные - широту
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if longitude >= mid:
+                ch = (ch << 1) | 1
+                lng_lo = mid
+            else:
+                ch <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if latitude >= mid:
+                ch = (ch << 1) | 1
+                lat_lo = mid
+            else:
+                ch <<= 1
+                lat_hi = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(_BASE32[ch])
+            bit = 0
+            ch = 0
+    return ''.join(chars)
+
+
+def decode(geohash):
+    """Границы ячейки geohash: (min_lat, min_lng, max_lat, max_lng)."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    even = True
+    for char in geohash:
+        value = _BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                lng_lo, lng_hi = (mid, lng_hi) if bit else (lng_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return lat_lo, lng_lo, lat_hi, lng_hi
+
+
+def cell_size(precision):
+    """Возвращает размер ячейки (высота, ширина) в градусах для данной точности."""
+    bits = precision * 5
+    lng_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def _cells_count(bbox, precision):
+    min_lat, min_lng, max_lat, max_lng = bbox
+    height, width = cell_size(precision)
+    rows = math.floor((max_lat + 90) / height) - math.floor((min_lat + 90) / height) + 1
+    cols = math.floor((max_lng + 180) / width) - math.floor((min_lng + 180) / width) + 1
+    return rows * cols
+
+
+def precision_for_bbox(bbox, max_cells):
+    """
+    Подбирает максимальную точность geohash, при которой прямоугольник
+    покрывается не более чем max_cells ячейками.
+    """
+    precision = 1
+    for candidate in range(1, GEOHASH_PRECISION + 1):
+        if _cells_count(bbox, candidate) > max_cells:
+            break
+        precision = candidate
+    return precision
+
+
+def cover_bbox(bbox, max_cells=32):
+    """
+    Возвращает список префиксов geohash, ячейки которых полностью покрывают
+    прямоугольник bbox = (min_lat, min_lng, max_lat, max_lng).
+    """
+    min_lat, min_lng, max_lat, max_lng = bbox
+    precision = precision_for_bbox(bbox, max_cells)
+    height, width = cell_size(precision)
+
+    first_row = math.floor((min_lat + 90) / height)
+    last_row = math.floor((max_lat + 90) / height)
+    first_col = math.floor((min_lng + 180) / width)
+    last_col = math.floor((max_lng + 180) / width)
+
+    cells = set()
+    for row in range(first_row, last_row + 1):
+        # Берём центр ячейки, чтобы не зависеть от граничных округлений
+        lat = min(-90 + (row + 0.5) * height, 90.0)
+        for col in range(first_col, last_col + 1):
+            lng = min(-180 + (col + 0.5) * width, 180.0)
+            cells.add(encode(lat, lng, precision))
+    return sorted(cells)
+
+
+def bbox_around(latitude, longitude, radius_km):
+    """
+    Прямоугольник, гарантированно содержащий круг радиуса radius_km (на сфере
+    EARTH_RADIUS_KM, как haversine_km). Крайняя долгота круга - не на широте
+    центра, а в точке касания меридиана: asin(sin(r) / cos(широты)).
+    """
+    angular = radius_km / EARTH_RADIUS_KM
+    dlat = math.degrees(angular)
+    if latitude + dlat >= 90.0 or latitude - dlat <= -90.0:
+        # Круг захватывает полюс - все долготы
+        return (max(latitude - dlat, -90.0), -180.0, min(latitude + dlat, 90.0), 180.0)
+    dlng = math.degrees(math.asin(math.sin(angular) / math.cos(math.radians(latitude))))
+    return (
+        latitude - dlat,
+        max(longitude - dlng, -180.0),
+        latitude + dlat,
+        min(longitude + dlng, 180.0),
+    )
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Расстояние по большому кругу между двумя точками в километрах."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
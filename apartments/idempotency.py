@@ -0,0 +1,135 @@
+# apartments/idempotency.py
+"""
+Заголовок Idempotency-Key для POST, которые создают объекты (бронирования, фото).
+
+Мобильный клиент при обрыве связи повторяет запрос с тем же ключом. Первый
+успешный (2xx) ответ сохраняется в IdempotencyRecord на IDEMPOTENCY_KEY_TTL_HOURS
+по (пользователь, маршрут, ключ); повтор получает его с заголовком
+Idempotent-Replayed: true, а валидация, запись в базу и сохранение файла не
+выполняются. Ошибочный ответ не сохраняется - исправленный запрос можно
+отправить с тем же ключом. Тот же ключ с другим телом запроса - 422.
+
+Одновременные запросы с одним ключом сериализуются рекомендательной
+блокировкой PostgreSQL на время транзакции: второй ждёт, пока первый
+закоммитит ответ, и затем получает его копию. Ожидание ограничено
+IDEMPOTENCY_LOCK_TIMEOUT_SECONDS (дальше - 409).
+"""
+import datetime
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import OperationalError, connection, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+
+from uibar_project_new.renderers import ORJSONRenderer
+
+from .models import IdempotencyRecord
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "This Idempotency-Key was already used with a different request."
+    default_code = 'idempotency_key_reused'
+
+
+class IdempotencyKeyInProgress(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "A request with this Idempotency-Key is still being processed."
+    default_code = 'idempotency_key_in_progress'
+
+
+def fingerprint(request):
+    """sha256 разобранного тела запроса; файлы учитываются по содержимому."""
+    digest = hashlib.sha256()
+    data = request.data
+    if hasattr(data, 'getlist'):
+        items = [(name, data.getlist(name)) for name in sorted(data)]
+    else:
+        items = [('', [data])]
+    for name, values in items:
+        digest.update(name.encode())
+        for value in values:
+            if isinstance(value, UploadedFile):
+                for chunk in value.chunks():
+                    digest.update(chunk)
+                value.seek(0)
+            else:
+                digest.update(json.dumps(value, sort_keys=True, default=str).encode())
+            digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _lock(user_id, route, key):
+    """Рекомендательная блокировка ключа до конца транзакции (только PostgreSQL)."""
+    if connection.vendor != 'postgresql':
+        return
+    raw = hashlib.sha256(f'{user_id}\0{route}\0{key}'.encode()).digest()
+    lock_id = int.from_bytes(raw[:8], 'big', signed=True)
+    timeout = getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT_SECONDS', 30)
+    try:
+        with connection.cursor() as cursor:
+            # Один запрос: запомнить lock_timeout, ограничить ожидание блокировки и сразу
+            # вернуть прежнее значение - иначе ограничение действовало бы на все блокировки
+            # handler() до конца транзакции. LATERAL с ссылкой на config задаёт порядок.
+            cursor.execute(
+                "SELECT set_config('lock_timeout', config.previous, true) "
+                "FROM (SELECT current_setting('lock_timeout') AS previous, set_config('lock_timeout', %s, true)) AS config, "
+                "LATERAL (SELECT pg_advisory_xact_lock(%s) WHERE config.previous IS NOT NULL) AS locked",
+                [f'{timeout * 1000}ms', lock_id],
+            )
+    except OperationalError:
+        raise IdempotencyKeyInProgress()
+
+
+def replay(record):
+    # Сохранённые байты как есть - повтор побайтно совпадает с первым JSON-ответом
+    response = HttpResponse(bytes(record.response_body), content_type='application/json', status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def run_idempotent(request, handler):
+    """Выполняет handler() (возвращает Response) не более одного раза на ключ из заголовка."""
+    key = request.headers.get(HEADER)
+    if not key:
+        return handler()
+    if len(key) > MAX_KEY_LENGTH:
+        raise serializers.ValidationError({HEADER: f"At most {MAX_KEY_LENGTH} characters."})
+    route = request.resolver_match.view_name
+    request_fingerprint = fingerprint(request)
+    with transaction.atomic():
+        _lock(request.user.pk, route, key)
+        record = IdempotencyRecord.objects.filter(user=request.user, route=route, key=key).first()
+        if record is not None and record.expires_at <= timezone.now():
+            record.delete()
+            record = None
+        if record is not None:
+            if record.fingerprint != request_fingerprint:
+                raise IdempotencyKeyReused()
+            return replay(record)
+
+        response = handler()
+        if status.is_success(response.status_code):
+            ttl = datetime.timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24))
+            IdempotencyRecord.objects.create(
+                user=request.user, route=route, key=key, fingerprint=request_fingerprint,
+                status_code=response.status_code, response_body=ORJSONRenderer().render(response.data),
+                expires_at=timezone.now() + ttl,
+            )
+        return response
+
+
+class IdempotentCreateMixin:
+    """create() представления с поддержкой Idempotency-Key (пользователь должен быть аутентифицирован)."""
+
+    def create(self, request, *args, **kwargs):
+        create = super().create
+        return run_idempotent(request, lambda: create(request, *args, **kwargs))
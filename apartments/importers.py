@@ -0,0 +1,212 @@
+# apartments/importers.py
+"""
+Потоковый массовый импорт квартир из CSV/JSONL.
+
+Файл читается построчно, строки валидируются пачками (справочник удобств
+загружается один раз, а не запросом на каждую строку), а запись идёт через
+bulk_create квартир и bulk_create промежуточной таблицы удобств -
+одна транзакция на пачку. Если файл нельзя дочитать (не UTF-8, ошибка
+разбора CSV), импорт останавливается: уже записанные пачки остаются,
+номер строки, на которой остановились, - в ApartmentImporter.stopped.
+"""
+import codecs
+import csv
+import json
+import time
+
+from django.db import transaction
+from rest_framework import serializers
+
+from . import amenities, indexing
+from .models import Apartment
+from .serializers import ApartmentSerializer
+
+FORMATS = ('csv', 'jsonl')
+DEFAULT_BATCH_SIZE = 500
+
+# Разделитель списка удобств в CSV-колонке amenity_ids: "1;4;7"
+CSV_LIST_SEPARATOR = ';'
+
+
+def detect_format(filename):
+    """Определяет формат по расширению файла (None, если не удалось)."""
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return None
+
+
+class ImportStreamError(Exception):
+    """Файл нельзя дочитать с строки row: не UTF-8 или ошибка разбора CSV."""
+
+    def __init__(self, row, message):
+        super().__init__(message)
+        self.row = row
+        self.message = message
+
+
+def _decode_lines(stream):
+    """Строки бинарного потока в UTF-8 (BOM из Excel отбрасывается); ошибка - с номером строки."""
+    for line_number, raw in enumerate(stream, start=1):
+        if line_number == 1 and raw.startswith(codecs.BOM_UTF8):
+            raw = raw[len(codecs.BOM_UTF8):]
+        try:
+            yield raw.decode('utf-8')
+        except UnicodeDecodeError as e:
+            raise ImportStreamError(line_number, f"File is not valid UTF-8 (byte {e.start} of the line).")
+
+
+def iter_rows(stream, fmt):
+    """
+    Построчно читает бинарный поток и выдаёт пары (номер_строки, данные).
+    Для строк, которые не удалось разобрать, вместо данных выдаётся
+    текст ошибки (str). Если дальше читать нельзя - ImportStreamError.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(_decode_lines(stream))
+        rows = iter(reader)
+        while True:
+            try:
+                row = next(rows)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                # Например, поле длиннее csv.field_size_limit(); DictReader.line_num
+                # обновляется только после успешной строки - номер берём у csv.reader
+                raise ImportStreamError(reader.reader.line_num, f"CSV parse error: {e}")
+            # Пустые ячейки считаем отсутствующими значениями
+            data = {key: value for key, value in row.items() if key and value not in (None, '')}
+            if 'amenity_ids' in data:
+                data['amenity_ids'] = [
+                    part.strip() for part in data['amenity_ids'].split(CSV_LIST_SEPARATOR) if part.strip()
+                ]
+            yield reader.line_num, data
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(_decode_lines(stream), start=1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError as e:
+                yield line_number, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(data, dict):
+                yield line_number, "Each line must be a JSON object."
+                continue
+            yield line_number, data
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+
+class ApartmentImportSerializer(ApartmentSerializer):
+    """
+    Валидация одной строки импорта. Наследует проверки ApartmentSerializer,
+    но удобства проверяются по заранее загруженному множеству ID
+    (context['amenity_ids']), без запроса к базе на каждую строку.
+    """
+    amenity_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    class Meta(ApartmentSerializer.Meta):
+        fields = [
+            'title',
+            'description',
+            'price',
+            'address',
+            'city',
+            'latitude',
+            'longitude',
+            'apartment_type',
+            'max_guests',
+            'beds',
+            'is_active',
+            'amenity_ids',
+        ]
+        read_only_fields = []
+
+    def validate_amenity_ids(self, value):
+        unknown = set(value) - self.context['amenity_ids']
+        if unknown:
+            raise serializers.ValidationError(f"Unknown amenity ids: {sorted(unknown)}")
+        return value
+
+
+class ApartmentImporter:
+    """
+    Импортирует строки пачками для одного владельца.
+    После run() доступны created, errors (список {'row', 'errors'}), rows_per_second
+    и stopped - {'row', 'errors'}, если файл не удалось дочитать (иначе None).
+    """
+
+    def __init__(self, owner, batch_size=DEFAULT_BATCH_SIZE):
+        self.owner = owner
+        self.batch_size = batch_size
+        self.created = 0
+        self.processed = 0
+        self.errors = []
+        self.stopped = None
+        self.elapsed = 0.0
+        self._amenity_ids = set(amenities.by_id())
+
+    @property
+    def rows_per_second(self):
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    def run(self, rows):
+        started = time.perf_counter()
+        batch = []
+        try:
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    self._import_batch(batch)
+                    batch = []
+        except ImportStreamError as e:
+            # Строки до места ошибки импортируются, дальше файл не читаем
+            self.stopped = {'row': e.row, 'errors': [e.message]}
+            self.errors.append(self.stopped)
+        if batch:
+            self._import_batch(batch)
+        self.elapsed = time.perf_counter() - started
+        return self
+
+    def _import_batch(self, batch):
+        # Один экземпляр сериализатора на пачку: поля строятся один раз,
+        # как это делает ListSerializer, но ошибки собираются по каждой строке
+        validator = ApartmentImportSerializer(context={'amenity_ids': self._amenity_ids})
+        valid = []
+        for line_number, data in batch:
+            self.processed += 1
+            if isinstance(data, str):
+                self.errors.append({'row': line_number, 'errors': [data]})
+                continue
+            try:
+                valid.append(validator.run_validation(data))
+            except serializers.ValidationError as e:
+                self.errors.append({'row': line_number, 'errors': e.detail})
+
+        if not valid:
+            return
+
+        apartments = []
+        amenity_lists = []
+        for fields in valid:
+            fields = dict(fields)
+            amenity_lists.append(fields.pop('amenity_ids', []))
+            apartment = Apartment(owner=self.owner, **fields)
+            apartment.fill_geohash() # bulk_create не вызывает save()
+            apartments.append(apartment)
+
+        Through = Apartment.amenities.through
+        with transaction.atomic():
+            # PostgreSQL возвращает id созданных строк, поэтому связи можно вставить сразу
+            Apartment.objects.bulk_create(apartments)
+            Through.objects.bulk_create([
+                Through(apartment_id=apartment.id, amenity_id=amenity_id)
+                for apartment, amenity_ids in zip(apartments, amenity_lists)
+                for amenity_id in set(amenity_ids)
+            ])
+            # bulk_create не отправляет сигналы - индексы похожих и поиска обновляем явно
+            indexing.schedule_update(apartment.id for apartment in apartments)
+        self.created += len(apartments)
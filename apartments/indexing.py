@@ -0,0 +1,106 @@
+# apartments/indexing.py
+"""
+Общее для файловых индексов квартир (similarity.py - похожие, search.py - текстовый
+поиск): межпроцессная блокировка записи, атомарная запись meta.json, отметка
+о необходимости пересборки и обновление индексов после коммита транзакции,
+изменившей квартиры.
+
+Инкрементальное обновление выполняется в запросе, изменившем квартиру, поэтому
+полную пересборку оно не запускает: если запас индекса исчерпан, индекс
+помечается устаревшим (mark_stale), а пересобирает его build_*_index --if-stale
+по cron.
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def lock(directory):
+    """Межпроцессная блокировка записи индекса (сборка и инкрементальные обновления)."""
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / 'lock', 'w') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+STALE_MARKER = 'stale'
+
+
+def mark_stale(directory, reason):
+    """Индекс нужно пересобрать (build_*_index); вызывается под lock()."""
+    marker = directory / STALE_MARKER
+    if not marker.exists():
+        logger.warning("Индекс %s требует пересборки: %s", directory, reason)
+    marker.write_text(reason)
+
+
+def is_stale(directory):
+    return (directory / STALE_MARKER).exists()
+
+
+def clear_stale(directory):
+    """После полной сборки: она прочитала все изменения, которые не поместились в индекс."""
+    (directory / STALE_MARKER).unlink(missing_ok=True)
+
+
+def write_json(path, data):
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, path)
+
+
+def _updaters():
+    from . import search, similarity
+    return similarity.update_apartments, search.update_apartments
+
+
+def update_apartments_safely(ids):
+    """Для сигналов: ошибка обновления индекса не должна ломать запрос, который изменил квартиру."""
+    for update in _updaters():
+        try:
+            update(ids)
+        except Exception:
+            logger.exception("Не удалось обновить индекс %s для %s", update.__module__, sorted(ids))
+
+
+_deferred = threading.local()
+
+
+def schedule_update(apartment_ids):
+    """Обновить индексы для квартир после коммита текущей транзакции (или в конце deferred_updates)."""
+    apartment_ids = set(apartment_ids)
+    pending = getattr(_deferred, 'ids', None)
+    if pending is not None:
+        pending |= apartment_ids
+        return
+    transaction.on_commit(lambda: update_apartments_safely(apartment_ids))
+
+
+@contextmanager
+def deferred_updates():
+    """
+    Для массовых операций (удаление тысяч квартир): обновления индексов копятся
+    и применяются одним вызовом при выходе. Индексы читают актуальное состояние
+    из БД, поэтому откат транзакции внутри блока их не портит.
+    """
+    if getattr(_deferred, 'ids', None) is not None:
+        yield
+        return
+    _deferred.ids = set()
+    try:
+        yield
+    finally:
+        ids, _deferred.ids = _deferred.ids, None
+        if ids:
+            update_apartments_safely(ids)
@@ -0,0 +1,52 @@
+# apartments/management/commands/archive_booking_partitions.py
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apartments import analytics, partitioning
+
+
+class Command(BaseCommand):
+    help = (
+        "Отсоединяет секции бронирований с заездами старше --older-than-months месяцев, "
+        "выгружает каждую в <каталог>/apartments_booking_pГГГГ_ММ.csv.gz и удаляет таблицу. "
+        "Помесячная статистика владельцев (ApartmentMonthlyStats) остаётся. "
+        "Восстановление: распаковать и загрузить через COPY ... FROM (FORMAT csv, HEADER)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-months', type=int, default=settings.BOOKING_ARCHIVE_AFTER_MONTHS,
+            help="Архивировать месяцы, закончившиеся больше стольких месяцев назад",
+        )
+        parser.add_argument('--output-dir', default=settings.BOOKING_ARCHIVE_DIR, help="Каталог для архивов")
+        parser.add_argument('--dry-run', action='store_true', help="Только показать, какие секции будут архивированы")
+
+    def handle(self, *args, **options):
+        if not partitioning.is_partitioned():
+            raise CommandError("Таблица бронирований не секционирована (нужен PostgreSQL и миграция 0015).")
+        if options['older_than_months'] < partitioning.MIN_ARCHIVE_AGE_MONTHS:
+            # Проживание длится до BOOKING_MAX_NIGHTS - в более молодых секциях бывают текущие брони
+            raise CommandError(f"--older-than-months должно быть не меньше {partitioning.MIN_ARCHIVE_AGE_MONTHS}.")
+        # Граница - первое число месяца: секции целиком раньше неё уходят в архив
+        cutoff = analytics.month_start(datetime.date.today())
+        for _ in range(options['older_than_months']):
+            cutoff = analytics.month_start(cutoff - datetime.timedelta(days=1))
+
+        months = sorted(month for month in partitioning.partitions() if month < cutoff)
+        archived = 0
+        for month in months:
+            if options['dry_run']:
+                self.stdout.write(f"Будет архивирована секция {partitioning.partition_name(month)}")
+                archived += 1
+                continue
+            try:
+                path = partitioning.archive_partition(month, options['output_dir'])
+            except partitioning.OpenBookingsError as error:
+                # Брони после выезда завершает complete_bookings - секция уйдёт в архив при следующем запуске
+                self.stderr.write(self.style.WARNING(f"Пропущена {error}"))
+                continue
+            archived += 1
+            self.stdout.write(f"{partitioning.partition_name(month)} -> {path}")
+        self.stdout.write(self.style.SUCCESS(f"Секций {'к архивации' if options['dry_run'] else 'архивировано'}: {archived}"))
@@ -0,0 +1,100 @@
+# apartments/management/commands/benchmark_geo.py
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from apartments import geo
+from apartments.filters import filter_bbox, haversine_expression
+from apartments.models import Apartment
+
+User = get_user_model()
+
+# Примерные границы Казахстана - синтетические точки генерируем здесь
+LAT_RANGE = (40.5, 55.4)
+LNG_RANGE = (46.5, 87.3)
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает поиск по радиусу через geohash-индекс с наивным перебором "
+        "расстояний на синтетических данных. Все данные создаются в транзакции "
+        "и откатываются в конце."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--points', type=int, default=1_000_000, help="Количество синтетических квартир")
+        parser.add_argument('--queries', type=int, default=20, help="Количество поисковых запросов")
+        parser.add_argument('--radius', type=float, default=5.0, help="Радиус поиска в км")
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            self._populate(rng, options['points'], options['batch_size'])
+            centers = [
+                (rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE))
+                for _ in range(options['queries'])
+            ]
+            naive = self._run(centers, options['radius'], indexed=False)
+            indexed = self._run(centers, options['radius'], indexed=True)
+
+            if naive['results'] != indexed['results']:
+                self.stderr.write(self.style.ERROR("Результаты поиска различаются!"))
+            self._report('naive scan', naive)
+            self._report('geohash index', indexed)
+            speedup = naive['median'] / indexed['median'] if indexed['median'] else float('inf')
+            self.stdout.write(self.style.SUCCESS(f"Ускорение (медиана): x{speedup:.1f}"))
+
+            # Ничего из синтетики не оставляем в базе
+            transaction.set_rollback(True)
+
+    def _populate(self, rng, points, batch_size):
+        owner = User.objects.create(username='geo-benchmark', email='geo-benchmark@example.invalid')
+        started = time.perf_counter()
+        created = 0
+        while created < points:
+            batch = []
+            for _ in range(min(batch_size, points - created)):
+                apartment = Apartment(
+                    owner=owner, title='bench', price=10000, address='-', city='-',
+                    latitude=rng.uniform(*LAT_RANGE), longitude=rng.uniform(*LNG_RANGE),
+                )
+                apartment.fill_geohash() # bulk_create не вызывает save()
+                batch.append(apartment)
+            Apartment.objects.bulk_create(batch)
+            created += len(batch)
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Apartment._meta.db_table}')
+        self.stdout.write(f"Создано {created} точек за {time.perf_counter() - started:.1f} с")
+
+    def _run(self, centers, radius, indexed):
+        timings = []
+        results = []
+        for latitude, longitude in centers:
+            queryset = Apartment.objects.all()
+            if indexed:
+                queryset = filter_bbox(queryset, geo.bbox_around(latitude, longitude, radius))
+            queryset = queryset.annotate(
+                distance_km=haversine_expression(latitude, longitude)
+            ).filter(distance_km__lte=radius)
+
+            started = time.perf_counter()
+            ids = list(queryset.order_by('id').values_list('id', flat=True))
+            timings.append(time.perf_counter() - started)
+            results.append(ids)
+        return {
+            'results': results,
+            'median': statistics.median(timings),
+            'p95': sorted(timings)[max(0, int(len(timings) * 0.95) - 1)],
+        }
+
+    def _report(self, name, result):
+        self.stdout.write(
+            f"{name:>14}: median {result['median'] * 1000:.2f} ms, "
+            f"p95 {result['p95'] * 1000:.2f} ms"
+        )
@@ -0,0 +1,73 @@
+# apartments/management/commands/benchmark_serializers.py
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from apartments.models import Apartment, Review
+from apartments.views import ApartmentViewSet, ReviewViewSet
+from uibar_project_new.renderers import ORJSONRenderer
+
+
+class Command(BaseCommand):
+    help = (
+        "Микробенчмарк списков квартир и отзывов: обычный путь DRF (ModelSerializer + "
+        "JSONRenderer) против values() + ORJSONRenderer. Проверяет, что ответы совпадают "
+        "байт в байт, и печатает медиану времени запроса и строк в секунду. "
+        "Нужны данные в базе (seed_perf_data)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--iterations', type=int, default=30)
+
+    def handle(self, *args, **options):
+        if not Apartment.objects.exists() or not Review.objects.exists():
+            raise CommandError("Нет данных - сначала запустите seed_perf_data")
+        page_size = options['page_size']
+        for name, viewset, path in (
+            ('apartments', ApartmentViewSet, '/api/apartments/'),
+            ('reviews', ReviewViewSet, '/api/reviews/'),
+        ):
+            self._compare(name, viewset, f'{path}?page_size={page_size}', options['iterations'])
+
+    def _compare(self, name, viewset, url, iterations):
+        regular = self._view(viewset, fast_list=False, renderer=JSONRenderer)
+        fast = self._view(viewset, fast_list=True, renderer=ORJSONRenderer)
+
+        regular_content, rows = self._request(regular, url)
+        fast_content, _ = self._request(fast, url)
+        if regular_content != fast_content:
+            raise CommandError(f"{name}: ответы обычного и быстрого пути различаются")
+
+        regular_time = self._measure(regular, url, iterations)
+        fast_time = self._measure(fast, url, iterations)
+        self.stdout.write(
+            f"{name}: {rows} строк, {len(fast_content)} байт\n"
+            f"  DRF + json:         {regular_time * 1000:8.2f} ms ({rows / regular_time:8.0f} строк/с)\n"
+            f"  values() + orjson:  {fast_time * 1000:8.2f} ms ({rows / fast_time:8.0f} строк/с)"
+        )
+        self.stdout.write(self.style.SUCCESS(f"  ускорение x{regular_time / fast_time:.2f}, ответы совпадают"))
+
+    def _view(self, viewset, fast_list, renderer):
+        variant = type(f'Benchmark{viewset.__name__}', (viewset,), {
+            'fast_list': fast_list,
+            'renderer_classes': [renderer],
+        })
+        return variant.as_view({'get': 'list'})
+
+    def _request(self, view, url):
+        request = APIRequestFactory().get(url, HTTP_HOST='localhost')
+        response = view(request)
+        response.render()
+        return response.content, len(response.data['results'])
+
+    def _measure(self, view, url, iterations):
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            self._request(view, url)
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings)
@@ -0,0 +1,56 @@
+# apartments/management/commands/build_search_index.py
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from apartments import indexing, search
+from apartments.models import Apartment
+
+
+class Command(BaseCommand):
+    help = (
+        "Полностью пересобирает индекс текстового поиска (SEARCH_INDEX_DIR). "
+        "Между пересборками изменённые квартиры попадают в дельта-сегмент; периодический "
+        "запуск (cron) сливает его с основной сборкой и обновляет idf. С --if-stale "
+        "пересобирает, только если дельта переполнена. С --benchmark замеряет время запросов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--benchmark', type=int, default=0, metavar='N', help="Выполнить N поисковых запросов")
+        parser.add_argument('--limit', type=int, default=1000, help="Сколько лучших совпадений возвращать")
+        parser.add_argument(
+            '--if-stale', action='store_true',
+            help="Пересобрать, только если индекса нет или дельта превысила SEARCH_DELTA_CAPACITY",
+        )
+
+    def handle(self, *args, **options):
+        directory = search.index_dir()
+        if options['if_stale'] and (directory / 'meta.json').exists() and not indexing.is_stale(directory):
+            self.stdout.write("Индекс актуален - пересборка не нужна")
+            return
+        started = time.perf_counter()
+        count = search.build_index()
+        self.stdout.write(self.style.SUCCESS(
+            f"Индекс собран: {count} квартир за {time.perf_counter() - started:.1f} с"
+        ))
+        if options['benchmark'] and count:
+            self._benchmark(options['benchmark'], options['limit'])
+
+    def _benchmark(self, queries, limit):
+        index = search.get_index()
+        # Запросы - пары слов из названий и описаний случайных квартир
+        texts = Apartment.objects.filter(is_active=True).order_by('?').values_list('title', 'description')[:200]
+        words = [word for text in texts for word in search.WORD_RE.findall(' '.join(text).lower())]
+        timings = []
+        for _ in range(queries):
+            query = ' '.join(random.sample(words, min(2, len(words))))
+            started = time.perf_counter()
+            index.search(query, limit)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        self.stdout.write(
+            f"{queries} запросов, limit={limit}: медиана {statistics.median(timings) * 1000:.3f} ms, "
+            f"p99 {timings[int(len(timings) * 0.99) - 1] * 1000:.3f} ms"
+        )
@@ -0,0 +1,53 @@
+# apartments/management/commands/build_similarity_index.py
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from apartments import indexing, similarity
+
+
+class Command(BaseCommand):
+    help = (
+        "Полностью пересобирает индекс похожих квартир (SIMILARITY_INDEX_DIR). "
+        "Между пересборками индекс обновляется инкрементально; периодический запуск (cron) "
+        "обновляет нормировку цен и набор удобств. С --if-stale пересобирает, только если "
+        "хвост для дописывания заполнен. С --benchmark замеряет время запросов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--benchmark', type=int, default=0, metavar='N', help="Выполнить N запросов похожих")
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument(
+            '--if-stale', action='store_true',
+            help="Пересобрать, только если индекса нет или инкрементальное обновление в него не поместилось",
+        )
+
+    def handle(self, *args, **options):
+        directory = similarity.index_dir()
+        if options['if_stale'] and (directory / 'meta.json').exists() and not indexing.is_stale(directory):
+            self.stdout.write("Индекс актуален - пересборка не нужна")
+            return
+        started = time.perf_counter()
+        count = similarity.build_index()
+        self.stdout.write(self.style.SUCCESS(
+            f"Индекс собран: {count} квартир за {time.perf_counter() - started:.1f} с"
+        ))
+        if options['benchmark'] and count:
+            self._benchmark(options['benchmark'], options['k'])
+
+    def _benchmark(self, queries, k):
+        index = similarity.get_index()
+        ids = index.ids[:index.count]
+        timings = []
+        for _ in range(queries):
+            apartment_id = int(ids[random.randrange(len(ids))])
+            started = time.perf_counter()
+            index.similar(apartment_id, k)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        self.stdout.write(
+            f"{queries} запросов, k={k}: медиана {statistics.median(timings) * 1000:.3f} ms, "
+            f"p99 {timings[int(len(timings) * 0.99) - 1] * 1000:.3f} ms"
+        )
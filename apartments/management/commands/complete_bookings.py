@@ -0,0 +1,55 @@
+# apartments/management/commands/complete_bookings.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from apartments.models import Booking
+
+
+class Command(BaseCommand):
+    help = (
+        "Переводит подтверждённые бронирования с прошедшей датой выезда в статус COMPLETED. "
+        "Рассчитана на периодический запуск (cron): идемпотентна и безопасна "
+        "при одновременном запуске нескольких копий."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Строк в одной транзакции")
+        parser.add_argument('--pause', type=float, default=0.0, help="Пауза между пачками, секунд")
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+        total = 0
+        while True:
+            updated = self._complete_batch(today, options['batch_size'])
+            if not updated:
+                break
+            total += updated
+            if options['pause']:
+                time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(f"Завершено бронирований: {total}"))
+
+    def _complete_batch(self, today, batch_size):
+        """
+        Одна короткая транзакция на пачку: блокируем до batch_size строк
+        (SKIP LOCKED - параллельный запуск возьмёт другие строки, а не будет ждать)
+        и обновляем их одним UPDATE. Повторный запуск ничего не меняет -
+        выбираются только брони в статусе CONFIRMED.
+        Статистика (analytics) не пересчитывается: CONFIRMED и COMPLETED
+        учитываются в ней одинаково.
+        """
+        with transaction.atomic():
+            ids = list(
+                Booking.objects.select_for_update(skip_locked=True)
+                # Условие на заезд следует из условия на выезд и отсекает секции будущих месяцев
+                .filter(status=Booking.BookingStatus.CONFIRMED, check_out_date__lt=today, check_in_date__lt=today)
+                .order_by()
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                return 0
+            return Booking.objects.filter(id__in=ids, status=Booking.BookingStatus.CONFIRMED).update(
+                status=Booking.BookingStatus.COMPLETED, updated_at=timezone.now()
+            )
@@ -0,0 +1,23 @@
+# apartments/management/commands/ensure_booking_partitions.py
+from django.core.management.base import BaseCommand, CommandError
+
+from apartments import partitioning
+
+
+class Command(BaseCommand):
+    help = (
+        "Создаёт помесячные секции таблицы бронирований на BOOKING_PARTITION_MONTHS_AHEAD "
+        "месяцев вперёд (то же делается после каждого migrate). Брони, осевшие в секции "
+        "по умолчанию, переносятся в новые секции. Рассчитана на периодический запуск (cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=None, help="Сколько месяцев вперёд (по умолчанию из настроек)")
+
+    def handle(self, *args, **options):
+        if not partitioning.is_partitioned():
+            raise CommandError("Таблица бронирований не секционирована (нужен PostgreSQL и миграция 0015).")
+        created = partitioning.ensure_partitions(months_ahead=options['months_ahead'])
+        for name in created:
+            self.stdout.write(f"Создана секция {name}")
+        self.stdout.write(self.style.SUCCESS(f"Создано секций: {len(created)}"))
@@ -0,0 +1,47 @@
+# apartments/management/commands/import_apartments.py
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from apartments.importers import DEFAULT_BATCH_SIZE, FORMATS, ApartmentImporter, detect_format, iter_rows
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Массовый импорт квартир владельца из CSV или JSONL файла."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Путь к файлу (.csv или .jsonl)")
+        parser.add_argument('--owner', required=True, help="Username или email владельца")
+        parser.add_argument('--format', choices=FORMATS, help="Формат файла (по умолчанию - по расширению)")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or detect_format(options['path'])
+        if fmt is None:
+            raise CommandError("Cannot detect file format, use --format.")
+
+        try:
+            owner = User.objects.get(Q(username=options['owner']) | Q(email=options['owner']))
+        except User.DoesNotExist:
+            raise CommandError(f"Owner '{options['owner']}' not found.")
+        except User.MultipleObjectsReturned:
+            # username одного пользователя совпал с email другого
+            raise CommandError(f"Several users match '{options['owner']}', use the username.")
+
+        # Файл декодируется построчно (iter_rows) - ошибка кодировки указывает на строку
+        with open(options['path'], 'rb') as stream:
+            importer = ApartmentImporter(owner, batch_size=options['batch_size'])
+            importer.run(iter_rows(stream, fmt))
+
+        for error in importer.errors:
+            self.stderr.write(f"Строка {error['row']}: {error['errors']}")
+
+        summary = (
+            f"Импортировано: {importer.created}, с ошибками: {len(importer.errors)}, "
+            f"{importer.rows_per_second:.0f} строк/с"
+        )
+        if importer.stopped:
+            raise CommandError(f"Файл не дочитан, остановка на строке {importer.stopped['row']}. {summary}")
+        self.stdout.write(self.style.SUCCESS(summary))
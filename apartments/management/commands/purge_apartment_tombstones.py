@@ -0,0 +1,32 @@
+# apartments/management/commands/purge_apartment_tombstones.py
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from apartments.models import ApartmentTombstone, TombstonePurge
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет следы удалённых квартир старше CHANGES_TOMBSTONE_RETENTION_DAYS. "
+        "Клиенты с курсором старше вычищенных следов получают 410 и синхронизируются заново. "
+        "Рассчитана на периодический запуск (cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help="Срок хранения, дней (по умолчанию CHANGES_TOMBSTONE_RETENTION_DAYS)",
+        )
+
+    def handle(self, *args, **options):
+        days = options['days'] or getattr(settings, 'CHANGES_TOMBSTONE_RETENTION_DAYS', 90)
+        purged_before = timezone.now() - datetime.timedelta(days=days)
+        with transaction.atomic():
+            deleted, _ = ApartmentTombstone.objects.filter(deleted_at__lt=purged_before).delete()
+            # Отметка для ленты изменений: курсоры раньше неё могли пропустить удаления
+            TombstonePurge.objects.create(purged_before=purged_before)
+        self.stdout.write(self.style.SUCCESS(f"Удалено записей: {deleted}"))
@@ -0,0 +1,16 @@
+# apartments/management/commands/purge_idempotency_keys.py
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apartments.models import IdempotencyRecord
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет сохранённые ответы для Idempotency-Key с истёкшим сроком "
+        "(IDEMPOTENCY_KEY_TTL_HOURS). Рассчитана на периодический запуск (cron)."
+    )
+
+    def handle(self, *args, **options):
+        deleted, _ = IdempotencyRecord.objects.filter(expires_at__lte=timezone.now()).delete()
+        self.stdout.write(self.style.SUCCESS(f"Удалено записей: {deleted}"))
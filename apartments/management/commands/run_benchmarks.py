@@ -0,0 +1,249 @@
+# apartments/management/commands/run_benchmarks.py
+import datetime
+import json
+import math
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apartments import seeding
+from apartments.models import Apartment
+
+User = get_user_model()
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+SCENARIOS = ('apartment_list', 'apartment_detail', 'review_list', 'booking_create', 'login')
+
+# Количество SQL-запросов берём из Server-Timing (PerformanceMiddleware):
+# на сервере должен быть PERF_SERVER_TIMING=True (по умолчанию включён только при DEBUG)
+QUERIES_RE = re.compile(r'queries=(\d+)')
+
+
+def percentile(sorted_values, p):
+    """Перцентиль методом ближайшего ранга."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный бенчмарк ключевых эндпоинтов на запущенном сервере с фиксированной "
+        "конкурентностью: p50/p95/p99 и SQL-запросы на запрос. Данные - seed_perf_data. "
+        "С --save-baseline сохраняет результат как базовый; иначе сравнивает с базовым "
+        "и завершается с ошибкой при регрессии. Базовый файл зависит от машины - "
+        "снимайте его в том же окружении, где проверяете. Для подсчёта SQL-запросов "
+        "сервер запускается с PERF_SERVER_TIMING=True."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help="Адрес запущенного сервера")
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+        parser.add_argument('--requests', type=int, default=200, help="Запросов на сценарий")
+        parser.add_argument('--warmup', type=int, default=20, help="Прогревочных запросов (не учитываются)")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--prefix', default=seeding.DEFAULT_PREFIX, help="Префикс пользователей seed_perf_data")
+        parser.add_argument('--password', default=seeding.DEFAULT_PASSWORD)
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help="Файл базовых результатов")
+        parser.add_argument('--save-baseline', action='store_true', help="Сохранить результаты как базовые")
+        parser.add_argument(
+            '--require-baseline', action='store_true',
+            help="Ошибка, если базового файла нет (для CI: иначе сравнение молча пропускается)",
+        )
+        parser.add_argument('--tolerance', type=float, default=0.2, help="Допустимый рост p95, доля")
+        parser.add_argument('--min-slack-ms', type=float, default=5.0, help="Рост p95 меньше этого - шум")
+        parser.add_argument('--output', help="Сохранить результаты прогона в JSON")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        baseline_path = Path(options['baseline'])
+        if options['require_baseline'] and not options['save_baseline'] and not baseline_path.exists():
+            # Проверяем до прогона, чтобы не гонять нагрузку впустую
+            raise CommandError(f"Базовый файл {baseline_path} не найден - снимите его с --save-baseline")
+
+        self.base_url = options['base_url'].rstrip('/')
+        self.rng = random.Random(options['seed'])
+        self.rng_lock = threading.Lock()
+        self._load_fixtures(options)
+
+        results = {}
+        for name in options['scenarios']:
+            scenario = getattr(self, f'_request_{name}')
+            self._run(scenario, options['warmup'], options['concurrency'])
+            results[name] = self._summarize(*self._run(scenario, options['requests'], options['concurrency']))
+            self._report(name, results[name])
+        if all(result['queries_avg'] is None for result in results.values()):
+            self.stdout.write(self.style.WARNING(
+                "В ответах нет Server-Timing - SQL-запросы не считаются; запустите сервер с PERF_SERVER_TIMING=True"
+            ))
+
+        if options['output']:
+            self._write(options['output'], results, options)
+
+        if options['save_baseline']:
+            self._write(baseline_path, results, options)
+            self.stdout.write(self.style.SUCCESS(f"Базовые результаты сохранены: {baseline_path}"))
+            return
+
+        problems = [f"{name}: ошибок {result['errors']}" for name, result in results.items() if result['errors']]
+        if baseline_path.exists():
+            baseline = json.loads(baseline_path.read_text())['results']
+            problems += self._compare(results, baseline, options['tolerance'], options['min_slack_ms'])
+        else:
+            self.stdout.write(self.style.WARNING(f"Базовый файл {baseline_path} не найден - сравнение пропущено"))
+
+        if problems:
+            raise CommandError("Регрессия производительности:\n  " + "\n  ".join(problems))
+        self.stdout.write(self.style.SUCCESS("Регрессий нет"))
+
+    # --- Данные для запросов ---
+
+    def _load_fixtures(self, options):
+        self.usernames = list(
+            User.objects.filter(username__startswith=f"{options['prefix']}_")
+            .order_by('id').values_list('username', flat=True)[:1000]
+        )
+        apartments = list(
+            Apartment.objects.filter(is_active=True, owner__username__startswith=f"{options['prefix']}_")
+            .values_list('id', 'city', 'max_guests')[:5000]
+        )
+        if not self.usernames or not apartments:
+            raise CommandError("Нет синтетических данных - сначала запустите seed_perf_data")
+        self.apartment_ids = [row[0] for row in apartments]
+        self.filters = sorted({(city, max_guests) for _, city, max_guests in apartments})
+        self.password = options['password']
+
+        # Токены заранее: логин сам по себе отдельный сценарий и не должен влиять на остальные
+        self.tokens = []
+        for username in self.usernames[:max(1, options['concurrency'])]:
+            status, body, _ = self._http('POST', '/api/auth/login/', {'username': username, 'password': self.password})
+            if status != 200:
+                raise CommandError(f"Не удалось войти как {username}: HTTP {status}")
+            self.tokens.append(json.loads(body)['access'])
+
+    def _pick(self, values):
+        with self.rng_lock:
+            return self.rng.choice(values)
+
+    def _randint(self, low, high):
+        with self.rng_lock:
+            return self.rng.randint(low, high)
+
+    # --- Сценарии: возвращают (метод, путь, тело, токен) ---
+
+    def _request_apartment_list(self):
+        city, max_guests = self._pick(self.filters)
+        query = urllib.parse.urlencode({'city': city, 'max_guests': max_guests, 'ordering': 'price'})
+        return 'GET', f'/api/apartments/?{query}', None, None
+
+    def _request_apartment_detail(self):
+        return 'GET', f'/api/apartments/{self._pick(self.apartment_ids)}/', None, None
+
+    def _request_review_list(self):
+        return 'GET', f'/api/reviews/?apartment={self._pick(self.apartment_ids)}', None, None
+
+    def _request_booking_create(self):
+        # Далеко в будущем и вразброс, чтобы брони почти не пересекались
+        check_in = timezone.now().date() + datetime.timedelta(days=self._randint(400, 3000))
+        body = {
+            'apartment': self._pick(self.apartment_ids),
+            'check_in_date': check_in.isoformat(),
+            'check_out_date': (check_in + datetime.timedelta(days=self._randint(1, 5))).isoformat(),
+        }
+        return 'POST', '/api/bookings/', body, self._pick(self.tokens)
+
+    def _request_login(self):
+        body = {'username': self._pick(self.usernames), 'password': self.password}
+        return 'POST', '/api/auth/login/', body, None
+
+    # --- Выполнение ---
+
+    def _http(self, method, path, body=None, token=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method)
+        request.add_header('Accept', 'application/json')
+        if data is not None:
+            request.add_header('Content-Type', 'application/json')
+        if token:
+            request.add_header('Authorization', f'Bearer {token}')
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return response.status, response.read(), response.headers
+        except urllib.error.HTTPError as error:
+            return error.code, error.read(), error.headers
+
+    def _one(self, scenario):
+        method, path, body, token = scenario()
+        started = time.perf_counter()
+        try:
+            status, _, headers = self._http(method, path, body, token)
+        except OSError:
+            return time.perf_counter() - started, None, None
+        elapsed = time.perf_counter() - started
+        match = QUERIES_RE.search(headers.get('Server-Timing', ''))
+        return elapsed, status, int(match.group(1)) if match else None
+
+    def _run(self, scenario, count, concurrency):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = list(executor.map(lambda _: self._one(scenario), range(count)))
+        return samples, time.perf_counter() - started
+
+    def _summarize(self, samples, wall_time):
+        latencies = sorted(elapsed * 1000 for elapsed, _, _ in samples)
+        queries = [count for _, status, count in samples if count is not None and status and status < 400]
+        return {
+            'requests': len(samples),
+            'errors': sum(1 for _, status, _ in samples if status is None or status >= 400),
+            'rps': round(len(samples) / wall_time, 1) if samples else 0.0,
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'queries_avg': round(sum(queries) / len(queries), 2) if queries else None,
+            'queries_max': max(queries) if queries else None,
+        }
+
+    def _report(self, name, result):
+        queries = f"{result['queries_avg']} (max {result['queries_max']})" if result['queries_max'] is not None else '-'
+        self.stdout.write(
+            f"{name:>16}: p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, "
+            f"p99 {result['p99_ms']:.1f} ms, {result['rps']} rps, SQL {queries}, "
+            f"ошибок {result['errors']}/{result['requests']}"
+        )
+
+    def _compare(self, results, baseline, tolerance, min_slack_ms):
+        problems = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if not base:
+                continue
+            limit = max(base['p95_ms'] * (1 + tolerance), base['p95_ms'] + min_slack_ms)
+            if result['p95_ms'] > limit:
+                problems.append(f"{name}: p95 {result['p95_ms']} ms > {limit:.2f} ms (база {base['p95_ms']} ms)")
+            # Число запросов детерминировано - любой рост означает новый N+1 или лишний запрос
+            if (result['queries_max'] or 0) > (base.get('queries_max') or 0):
+                problems.append(f"{name}: SQL-запросов {result['queries_max']} > {base['queries_max']}")
+        return problems
+
+    def _write(self, path, results, options):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            'created_at': timezone.now().isoformat(),
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'results': results,
+        }
+        path.write_text(json.dumps(payload, ensure_ascii=False, indent=2))
@@ -0,0 +1,56 @@
+# apartments/management/commands/seed_perf_data.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from apartments import seeding
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет базу синтетическими пользователями, квартирами, удобствами, фото, "
+        "отзывами и бронированиями для нагрузочного тестирования (bulk_create пачками). "
+        "В среднем ~21 строка на квартиру: --apartments 500 ~ 10 тыс. строк, "
+        "--apartments 500000 ~ 10 млн."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apartments', type=int, default=500, help="Количество квартир (масштаб)")
+        parser.add_argument('--photos', type=int, default=3, help="Фото на квартиру (в среднем)")
+        parser.add_argument('--reviews', type=int, default=4, help="Отзывов на квартиру (в среднем)")
+        parser.add_argument('--bookings', type=int, default=8, help="Бронирований на квартиру (в среднем)")
+        parser.add_argument('--users-ratio', type=float, default=0.2, help="Пользователей на квартиру")
+        parser.add_argument('--prefix', default=seeding.DEFAULT_PREFIX, help="Префикс имён пользователей")
+        parser.add_argument('--password', default=seeding.DEFAULT_PASSWORD, help="Пароль всех пользователей")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--flush', action='store_true', help="Сначала удалить данные с этим префиксом")
+        parser.add_argument('--skip-stats', action='store_true', help="Не пересобирать помесячную статистику и индексы похожих квартир и поиска")
+
+    def handle(self, *args, **options):
+        seeder = seeding.PerfDataSeeder(
+            options['apartments'],
+            prefix=options['prefix'],
+            password=options['password'],
+            seed=options['seed'],
+            photos_per_apartment=options['photos'],
+            reviews_per_apartment=options['reviews'],
+            bookings_per_apartment=options['bookings'],
+            users_ratio=options['users_ratio'],
+            batch_size=options['batch_size'],
+            stdout=self.stdout,
+        )
+        if options['flush']:
+            self.stdout.write(f"Удалено объектов: {seeder.flush()}")
+
+        started = time.perf_counter()
+        counts = seeder.run(rebuild_stats=not options['skip_stats'])
+        elapsed = time.perf_counter() - started
+
+        total = sum(counts.values())
+        for name, count in counts.items():
+            self.stdout.write(f"{name:>20}: {count}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано строк: {total} за {elapsed:.1f} с ({total / elapsed:.0f} строк/с). "
+            f"Пароль пользователей {options['prefix']}_*: {options['password']}"
+        ))
@@ -0,0 +1,40 @@
+# apartments/media.py
+"""
+Права доступа к медиафайлам (settings.MEDIA_ACCESS_CHECK, см. uibar_project_new/media.py).
+
+Фото активных объявлений доступны всем. Фото скрытых (is_active=False) - только
+владельцу квартиры и персоналу: пользователь определяется по сессии (админка)
+или по JWT в заголовке Authorization. Файлы, не привязанные к фото, не отдаются.
+"""
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from uibar_project_new.media import PRIVATE, PUBLIC
+
+from .models import ApartmentPhoto
+
+
+def _user(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user
+    try:
+        authenticated = JWTAuthentication().authenticate(request)
+    except (InvalidToken, TokenError):
+        return None
+    return authenticated[0] if authenticated else None
+
+
+def media_access(request, name):
+    """PUBLIC, PRIVATE (отдать, но не кэшировать в общих кэшах) или None - отказать."""
+    photo = ApartmentPhoto.objects.filter(image=name).values(
+        'apartment__is_active', 'apartment__owner_id'
+    ).order_by('-apartment__is_active').first()
+    if photo is None:
+        return None
+    if photo['apartment__is_active']:
+        return PUBLIC
+    user = _user(request)
+    if user is not None and (user.is_staff or user.pk == photo['apartment__owner_id']):
+        return PRIVATE
+    return None
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apartments', '0006_apartment_geo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApartmentMonthlyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Месяц')),
+                ('nights_booked', models.PositiveIntegerField(default=0, verbose_name='Забронировано ночей')),
+                ('bookings_count', models.PositiveIntegerField(default=0, verbose_name='Заездов')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('apartment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_stats', to='apartments.apartment', verbose_name='Квартира')),
+            ],
+            options={
+                'verbose_name': 'Статистика за месяц',
+                'verbose_name_plural': 'Статистика по месяцам',
+                'ordering': ['apartment', 'month'],
+                'unique_together': {('apartment', 'month')},
+            },
+        ),
+    ]
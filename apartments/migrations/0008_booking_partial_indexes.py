@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apartments', '0007_apartmentmonthlystats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('status__in', ['PE', 'CO'])), fields=['apartment', 'check_in_date', 'check_out_date'], name='booking_active_dates_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('status', 'CO')), fields=['check_out_date'], name='booking_confirmed_checkout_idx'),
+        ),
+    ]
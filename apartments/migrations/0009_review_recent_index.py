@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apartments', '0008_booking_partial_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['apartment', '-created_at', '-id'], name='review_apartment_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:15
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apartments', '0009_review_recent_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='apartment',
+            index=models.Index(fields=['-created_at', '-id'], name='apartment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='apartment',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('title'), name='text_pattern_ops'), name='apartment_title_upper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='apartment',
+            index=models.Index(django.db.models.functions.text.Upper('city'), name='apartment_city_upper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['-created_at', '-id'], name='booking_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['-created_at', '-id'], name='review_created_idx'),
+        ),
+    ]
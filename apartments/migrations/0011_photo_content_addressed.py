@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:31
+
+import apartments.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apartments', '0010_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='apartmentphoto',
+            name='image',
+            field=models.ImageField(db_index=True, upload_to=apartments.models.photo_upload_to, verbose_name='Фото'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:34
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apartments', '0011_photo_content_addressed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApartmentTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('apartment_id', models.BigIntegerField(unique=True, verbose_name='ID квартиры')),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Удалена')),
+            ],
+            options={
+                'verbose_name': 'Удалённая квартира',
+                'verbose_name_plural': 'Удалённые квартиры',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='apartment',
+            index=models.Index(fields=['updated_at', 'id'], name='apartment_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='apartmenttombstone',
+            index=models.Index(fields=['deleted_at', 'apartment_id'], name='tombstone_deleted_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:51
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apartments', '0013_idempotency_record'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField(blank=True, null=True, verbose_name='С даты')),
+                ('end_date', models.DateField(blank=True, null=True, verbose_name='По дату')),
+                ('weekdays', models.PositiveSmallIntegerField(default=127, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(127)], verbose_name='Дни недели')),
+                ('price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Цена за ночь')),
+                ('min_nights', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Минимум ночей')),
+                ('priority', models.SmallIntegerField(default=0, verbose_name='Приоритет')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('apartment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_rules', to='apartments.apartment', verbose_name='Квартира')),
+            ],
+            options={
+                'verbose_name': 'Правило цены',
+                'verbose_name_plural': 'Правила цен',
+                'ordering': ['apartment', 'priority', 'id'],
+                'constraints': [models.CheckConstraint(condition=models.Q(('price__isnull', False), ('min_nights__isnull', False), _connector='OR'), name='price_rule_price_or_min_nights'), models.CheckConstraint(condition=models.Q(('start_date__isnull', True), ('end_date__isnull', True), ('start_date__lte', models.F('end_date')), _connector='OR'), name='price_rule_dates_ordered')],
+            },
+        ),
+    ]
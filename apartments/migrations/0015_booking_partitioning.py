@@ -0,0 +1,136 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:20
+"""
+Секционирование apartments_booking по месяцу заезда (PARTITION BY RANGE (check_in_date)).
+
+Таблица пересоздаётся: данные копируются в секционированную, индексы и
+внешние ключи пересоздаются с прежними именами (индексы на родительской
+таблице - секционированные, PostgreSQL сам создаёт их в каждой секции).
+Первичный ключ секционированной таблицы обязан включать ключ секционирования -
+(id, check_in_date); id по-прежнему уникален, его выдаёт последовательность.
+Identity-столбцы на секционированных таблицах появились только в PostgreSQL 17,
+поэтому id берётся из обычной последовательности с тем же именем.
+
+Миграция держит ACCESS EXCLUSIVE на время копирования - на большой таблице
+её нужно выполнять в окно обслуживания.
+"""
+import datetime
+
+from django.db import migrations, models
+
+TABLE = 'apartments_booking'
+OLD_TABLE = 'apartments_booking_unpartitioned'
+SEQUENCE = 'apartments_booking_id_seq'
+# Секции создаются с месяца самой ранней брони до этого числа месяцев вперёд;
+# дальше их поддерживает apartments.partitioning.ensure_partitions
+MONTHS_AHEAD = 12
+
+
+def _months(first, last):
+    month = first.replace(day=1)
+    while month <= last:
+        following = (month + datetime.timedelta(days=32)).replace(day=1)
+        yield month, following
+        month = following
+
+
+def _copy_table_objects(cursor, table):
+    """Определения индексов (кроме первичного ключа) и внешних ключей таблицы."""
+    cursor.execute(
+        "SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = %s::regclass AND NOT indisprimary",
+        [table],
+    )
+    # У индекса секционированной таблицы определение вида "ON ONLY <таблица>" -
+    # без ONLY такой же индекс создаётся и на обычной, и на секционированной
+    indexes = [row[0].replace(' ON ONLY ', ' ON ', 1) for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table],
+    )
+    return indexes, cursor.fetchall()
+
+
+def _restore_table_objects(cursor, indexes, foreign_keys):
+    for definition in indexes:
+        cursor.execute(definition)
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}')
+
+
+def partition_bookings(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        indexes, foreign_keys = _copy_table_objects(cursor, TABLE)
+        cursor.execute(f'SELECT min(check_in_date), max(check_in_date) FROM {TABLE}')
+        first, last = cursor.fetchone()
+        cursor.execute(f"SELECT nextval(pg_get_serial_sequence('{TABLE}', 'id'))")
+        next_id = cursor.fetchone()[0]
+
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}')
+        # Освобождаем имя последовательности: identity удаляется вместе со своей
+        cursor.execute(f'ALTER TABLE {OLD_TABLE} ALTER COLUMN id DROP IDENTITY')
+        cursor.execute(
+            f'CREATE TABLE {TABLE} (LIKE {OLD_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+            f'PARTITION BY RANGE (check_in_date)'
+        )
+        cursor.execute(f'CREATE SEQUENCE {SEQUENCE} AS bigint OWNED BY {TABLE}.id')
+        cursor.execute(f'ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval(%s)', [SEQUENCE])
+        cursor.execute('SELECT setval(%s, %s, false)', [SEQUENCE, next_id])
+
+        today = datetime.date.today()
+        horizon = today
+        for _ in range(MONTHS_AHEAD):
+            horizon = (horizon + datetime.timedelta(days=32)).replace(day=1)
+        for start, end in _months(min(first or today, today), max(last or today, horizon)):
+            cursor.execute(
+                f'CREATE TABLE {TABLE}_p{start:%Y_%m} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)',
+                [start, end],
+            )
+        cursor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {OLD_TABLE}')
+        cursor.execute(f'DROP TABLE {OLD_TABLE}')
+        # Индексы строятся после загрузки данных - быстрее, чем обновлять их при вставке
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, check_in_date)')
+        _restore_table_objects(cursor, indexes, foreign_keys)
+        cursor.execute(f'ANALYZE {TABLE}')
+
+
+def unpartition_bookings(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        indexes, foreign_keys = _copy_table_objects(cursor, TABLE)
+        cursor.execute(f"SELECT nextval('{SEQUENCE}')")
+        next_id = cursor.fetchone()[0]
+
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}')
+        cursor.execute(f'ALTER TABLE {OLD_TABLE} ALTER COLUMN id DROP DEFAULT')
+        cursor.execute(f'DROP SEQUENCE {SEQUENCE}')
+        cursor.execute(f'CREATE TABLE {TABLE} (LIKE {OLD_TABLE} INCLUDING CONSTRAINTS)')
+        cursor.execute(f'ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+        cursor.execute(f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), %s, false)", [next_id])
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {OLD_TABLE}')
+        # Вместе с родительской таблицей удаляются все секции
+        cursor.execute(f'DROP TABLE {OLD_TABLE}')
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id)')
+        _restore_table_objects(cursor, indexes, foreign_keys)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apartments', '0014_price_rule'),
+    ]
+
+    operations = [
+        # До секционирования: LIKE ... INCLUDING CONSTRAINTS переносит ограничение в новую таблицу
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.CheckConstraint(
+                condition=models.Q(check_out_date__lte=models.F('check_in_date') + datetime.timedelta(days=365)),
+                name='booking_max_stay',
+            ),
+        ),
+        migrations.RunPython(partition_bookings, unpartition_bookings),
+    ]
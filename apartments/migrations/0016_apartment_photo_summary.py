@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:03
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_photo_summary(apps, schema_editor):
+    """Обложка и количество фото для существующих квартир - один UPDATE с подзапросами."""
+    Apartment = apps.get_model('apartments', 'Apartment')
+    ApartmentPhoto = apps.get_model('apartments', 'ApartmentPhoto')
+    photos = ApartmentPhoto.objects.filter(apartment=models.OuterRef('pk')).order_by()
+    # updated_at не трогаем: полные данные квартир в ленте изменений те же
+    Apartment.objects.filter(pk__in=ApartmentPhoto.objects.values('apartment')).update(
+        cover_photo=Coalesce(models.Subquery(photos.order_by('pk').values('image')[:1]), models.Value('')),
+        photo_count=Coalesce(
+            models.Subquery(photos.values('apartment').annotate(count=models.Count('pk')).values('count')), 0,
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apartments', '0015_booking_partitioning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apartment',
+            name='cover_photo',
+            field=models.ImageField(blank=True, editable=False, upload_to='', verbose_name='Обложка'),
+        ),
+        migrations.AddField(
+            model_name='apartment',
+            name='photo_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество фото'),
+        ),
+        migrations.RunPython(backfill_photo_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:16
+import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_watermark(apps, schema_editor):
+    """
+    Раньше отметок не было, и purge_apartment_tombstones мог уже вычистить
+    следы старше срока хранения - для существующего каталога считаем их вычищенными.
+    """
+    Apartment = apps.get_model('apartments', 'Apartment')
+    ApartmentTombstone = apps.get_model('apartments', 'ApartmentTombstone')
+    TombstonePurge = apps.get_model('apartments', 'TombstonePurge')
+    if Apartment.objects.exists() or ApartmentTombstone.objects.exists():
+        retention = getattr(settings, 'CHANGES_TOMBSTONE_RETENTION_DAYS', 90)
+        TombstonePurge.objects.create(purged_before=timezone.now() - datetime.timedelta(days=retention))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apartments', '0016_apartment_photo_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TombstonePurge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('purged_before', models.DateTimeField(db_index=True, verbose_name='Вычищены следы до')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата запуска')),
+            ],
+            options={
+                'verbose_name': 'Очистка следов удалённых квартир',
+                'verbose_name_plural': 'Очистки следов удалённых квартир',
+            },
+        ),
+        migrations.RunPython(backfill_watermark, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,19 @@
 # apartments/models.py
+import datetime
+import hashlib
+import os
+
 from django.db import models
 from django.conf import settings # Для ссылки на модель User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError # Для валидации в модели
 from django.utils import timezone # Для работы со временем
+from django.db.models.functions import Coalesce, RowNumber, Upper
+from django.contrib.postgres.indexes import OpClass
+from . import geo # geohash для гео-поиска без PostGIS
+
+# Каталог фото с адресацией по содержимому (имя файла = хэш)
+PHOTO_CONTENT_ADDRESSED_PREFIX = 'apartments/ca/'
 
 class Amenity(models.Model):
     """Модель для удобств (WiFi, Парковка и т.д.)"""
@@ -19,6 +29,24 @@ class Amenity(models.Model):
     def __str__(self):
          return self.name
 
+
+class ApartmentQuerySet(models.QuerySet):
+    def refresh_photo_summary(self):
+        """
+        Пересчитывает обложку (первое фото по pk, как в галерее) и количество
+        фото квартир queryset по фактическим строкам ApartmentPhoto - одним
+        UPDATE с подзапросами. updated_at меняется: карточка в ленте изменений другая.
+        """
+        photos = ApartmentPhoto.objects.filter(apartment=models.OuterRef('pk')).order_by()
+        return self.update(
+            cover_photo=Coalesce(models.Subquery(photos.order_by('pk').values('image')[:1]), models.Value('')),
+            photo_count=Coalesce(
+                models.Subquery(photos.values('apartment').annotate(count=models.Count('pk')).values('count')), 0,
+            ),
+            updated_at=timezone.now(),
+        )
+
+
 class Apartment(models.Model):
     class ApartmentType(models.TextChoices):
         STUDIO = 'ST', 'Студия'
@@ -37,6 +65,21 @@ class Apartment(models.Model):
     city = models.CharField(max_length=100, verbose_name="Город")
     # --------------------------------------------------------
 
+    # Координаты для карты
+    latitude = models.FloatField(
+        blank=True, null=True,
+        validators=[MinValueValidator(-90), MaxValueValidator(90)],
+        verbose_name="Широта"
+    )
+    longitude = models.FloatField(
+        blank=True, null=True,
+        validators=[MinValueValidator(-180), MaxValueValidator(180)],
+        verbose_name="Долгота"
+    )
+    # Geohash координат - индексируется и используется для отсечения кандидатов
+    # при поиске по прямоугольнику/радиусу (заполняется автоматически в save())
+    geohash = models.CharField(max_length=12, blank=True, editable=False, verbose_name="Geohash")
+
     apartment_type = models.CharField(
         max_length=2,
         choices=ApartmentType.choices,
@@ -49,6 +92,11 @@ class Apartment(models.Model):
     # Удобства
     amenities = models.ManyToManyField(Amenity, blank=True, verbose_name="Удобства")
 
+    # Для карточек списка - копия данных ApartmentPhoto (первое фото и количество),
+    # поддерживается сигналами при загрузке и удалении фото (refresh_photo_summary)
+    cover_photo = models.ImageField(blank=True, editable=False, verbose_name="Обложка")
+    photo_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество фото")
+
     # Статус объявления
     is_active = models.BooleanField(default=True, verbose_name="Активно") # По умолчанию активно
 
@@ -56,15 +104,57 @@ class Apartment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ApartmentQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at'] # Сортировка по умолчанию - сначала новые
         verbose_name = "Квартира"
         verbose_name_plural = "Квартиры"
+        indexes = [
+            # varchar_pattern_ops нужен, чтобы LIKE 'prefix%' использовал индекс
+            models.Index(fields=['geohash'], name='apartment_geohash_idx', opclasses=['varchar_pattern_ops']),
+            # Сортировка по умолчанию (и в админке) без полной сортировки таблицы
+            models.Index(fields=['-created_at', '-id'], name='apartment_created_idx'),
+            # Поиск в админке: title istartswith (^title) и city iexact (=city)
+            models.Index(OpClass(Upper('title'), name='text_pattern_ops'), name='apartment_title_upper_idx'),
+            models.Index(Upper('city'), name='apartment_city_upper_idx'),
+            # Лента изменений для синхронизации (apartments/changes.py): курсор (updated_at, id)
+            models.Index(fields=['updated_at', 'id'], name='apartment_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.city})"
+
+    def fill_geohash(self):
+        """Пересчитывает geohash по текущим координатам."""
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geo.encode(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+
+    def save(self, *args, **kwargs):
+        self.fill_geohash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
     
     
+class ReviewQuerySet(models.QuerySet):
+    def recent_per_apartment(self, limit):
+        """
+        Не более limit последних отзывов на каждую квартиру - одним запросом
+        с оконной функцией ROW_NUMBER() вместо запроса на каждую квартиру.
+        """
+        return self.annotate(
+            recent_rank=models.Window(
+                expression=RowNumber(),
+                partition_by=models.F('apartment_id'),
+                order_by=[models.F('created_at').desc(), models.F('id').desc()],
+            )
+        ).filter(recent_rank__lte=limit)
+
+
 class Review(models.Model):
     """Модель для отзыва/комментария к квартире."""
     apartment = models.ForeignKey(
@@ -91,6 +181,7 @@ class Review(models.Model):
         blank=True, null=True # Можно сделать необязательным
     )
 
+    objects = ReviewQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at'] # Сначала новые отзывы
@@ -98,13 +189,24 @@ class Review(models.Model):
         unique_together = ('apartment', 'author')
         verbose_name = "Отзыв"
         verbose_name_plural = "Отзывы"
+        indexes = [
+            # Лента отзывов квартиры (сначала новые) - для курсорной пагинации
+            models.Index(fields=['apartment', '-created_at', '-id'], name='review_apartment_recent_idx'),
+            # Общий список (сначала новые), в т.ч. в админке
+            models.Index(fields=['-created_at', '-id'], name='review_created_idx'),
+        ]
 
     def __str__(self):
-        # Возвращаем начало текста отзыва
-        return f"Отзыв от {self.author.username} на {self.apartment.title}: {self.text[:30]}..."
+        # Только собственные поля: __str__ вызывается в админке для каждой строки,
+        # обращение к author/apartment давало бы лишние запросы
+        return f"Отзыв #{self.pk} на квартиру #{self.apartment_id}: {self.text[:30]}..."
     
 
 # --- Модель Booking ---
+# Предел длины проживания: на нём держится отсечение секций (apartments/partitioning.py)
+BOOKING_MAX_NIGHTS = 365
+
+
 class Booking(models.Model):
     """Модель для бронирования квартиры."""
 
@@ -159,9 +261,47 @@ class Booking(models.Model):
         ordering = ['-created_at']
         verbose_name = "Бронирование"
         verbose_name_plural = "Бронирования"
+        indexes = [
+            # Частичные индексы только по актуальным броням: завершённые и отменённые
+            # (основная масса строк со временем) в них не попадают
+            models.Index(
+                fields=['apartment', 'check_in_date', 'check_out_date'],
+                name='booking_active_dates_idx',
+                condition=models.Q(status__in=['PE', 'CO']), # PENDING, CONFIRMED
+            ),
+            # Для команды complete_bookings: подтверждённые брони по дате выезда
+            models.Index(
+                fields=['check_out_date'],
+                name='booking_confirmed_checkout_idx',
+                condition=models.Q(status='CO'), # CONFIRMED
+            ),
+            # Список в админке (сначала новые)
+            models.Index(fields=['-created_at', '-id'], name='booking_created_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(check_out_date__lte=models.F('check_in_date') + datetime.timedelta(days=BOOKING_MAX_NIGHTS)),
+                name='booking_max_stay',
+            ),
+        ]
 
     def __str__(self):
-        return f"Бронь {self.user.username} на {self.apartment.title} ({self.check_in_date} - {self.check_out_date})"
+        # Без обращения к user/apartment - см. Review.__str__
+        return f"Бронь #{self.pk}: квартира #{self.apartment_id} ({self.check_in_date} - {self.check_out_date})"
+
+def photo_upload_to(instance, filename):
+    """
+    Имя файла - SHA-256 содержимого: apartments/ca/ab/abcdef....jpg.
+    По такому адресу всегда лежит одно и то же содержимое, поэтому медиа-view
+    отдаёт эти файлы с Cache-Control: immutable (см. uibar_project_new/media.py).
+    """
+    digest = hashlib.sha256()
+    for chunk in instance.image.chunks():
+        digest.update(chunk)
+    extension = os.path.splitext(filename)[1].lower()
+    name = digest.hexdigest()
+    return f'{PHOTO_CONTENT_ADDRESSED_PREFIX}{name[:2]}/{name}{extension}'
+
 
 class ApartmentPhoto(models.Model):
     """Модель для хранения фотографий квартиры."""
@@ -172,9 +312,10 @@ class ApartmentPhoto(models.Model):
         verbose_name="Квартира"
     )
     # Поле для хранения самого изображения
-    # upload_to='apartments/%Y/%m/%d/' - указывает, куда сохранять файлы
-    # файлы будут сохраняться в MEDIA_ROOT/apartments/год/месяц/день/
-    image = models.ImageField(upload_to='apartments/%Y/%m/%d/', verbose_name="Фото")
+    # Раньше файлы сохранялись в MEDIA_ROOT/apartments/год/месяц/день/ (старые фото остаются там),
+    # теперь - по хэшу содержимого, см. photo_upload_to
+    # Индекс - для проверки доступа к файлу по имени (apartments/media.py)
+    image = models.ImageField(upload_to=photo_upload_to, db_index=True, verbose_name="Фото")
     # Можно добавить поле для описания фото (alt текст)
     # caption = models.CharField(max_length=200, blank=True, verbose_name="Подпись")
     # Можно добавить поле для порядка сортировки фото
@@ -187,4 +328,155 @@ class ApartmentPhoto(models.Model):
 
     def __str__(self):
         # Возвращаем путь к файлу или ID
-        return f"Фото {self.id} для {self.apartment.title}"
+        return f"Фото {self.id} для квартиры #{self.apartment_id}"
+
+
+class ApartmentTombstone(models.Model):
+    """
+    След удалённой квартиры для ленты изменений (apartments/changes.py): клиент,
+    синхронизирующий каталог, узнаёт, что объявление нужно убрать из своей копии.
+    Создаётся сигналом post_delete; старые записи удаляет purge_apartment_tombstones.
+    """
+    # Не ForeignKey - квартиры уже нет
+    apartment_id = models.BigIntegerField(unique=True, verbose_name="ID квартиры")
+    deleted_at = models.DateTimeField(default=timezone.now, verbose_name="Удалена")
+
+    class Meta:
+        verbose_name = "Удалённая квартира"
+        verbose_name_plural = "Удалённые квартиры"
+        indexes = [
+            models.Index(fields=['deleted_at', 'apartment_id'], name='tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"Квартира #{self.apartment_id} удалена {self.deleted_at:%Y-%m-%d %H:%M}"
+
+
+class TombstonePurge(models.Model):
+    """
+    Запуск purge_apartment_tombstones: следы удалённых раньше purged_before
+    вычищены. Курсор ленты изменений старше последней такой отметки мог
+    пропустить удаления - клиент получает 410 (apartments/changes.py).
+    """
+    purged_before = models.DateTimeField(db_index=True, verbose_name="Вычищены следы до")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата запуска")
+
+    class Meta:
+        verbose_name = "Очистка следов удалённых квартир"
+        verbose_name_plural = "Очистки следов удалённых квартир"
+
+    def __str__(self):
+        return f"Следы до {self.purged_before:%Y-%m-%d %H:%M}"
+
+
+class PriceRule(models.Model):
+    """
+    Правило цены квартиры на даты (сезон, выходные, праздники) и/или минимальный
+    срок проживания. Вне правил действует Apartment.price. Если на ночь действует
+    несколько правил с ценой, побеждает правило с большим priority (при равном -
+    созданное позже). Расчёт стоимости - apartments/pricing.py.
+    """
+    ALL_WEEKDAYS = 0b1111111
+
+    apartment = models.ForeignKey(
+        Apartment,
+        on_delete=models.CASCADE,
+        related_name='price_rules',
+        verbose_name="Квартира"
+    )
+    # Границы включительно; пустая граница - без ограничения с этой стороны
+    start_date = models.DateField(null=True, blank=True, verbose_name="С даты")
+    end_date = models.DateField(null=True, blank=True, verbose_name="По дату")
+    # Битовая маска дней недели ночи заезда: бит 0 - понедельник, ..., бит 6 - воскресенье
+    weekdays = models.PositiveSmallIntegerField(
+        default=ALL_WEEKDAYS, validators=[MinValueValidator(1), MaxValueValidator(ALL_WEEKDAYS)],
+        verbose_name="Дни недели"
+    )
+    price = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True, validators=[MinValueValidator(0)],
+        verbose_name="Цена за ночь"
+    )
+    # Минимум ночей для проживания с заездом в период правила
+    min_nights = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name="Минимум ночей")
+    priority = models.SmallIntegerField(default=0, verbose_name="Приоритет")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['apartment', 'priority', 'id']
+        verbose_name = "Правило цены"
+        verbose_name_plural = "Правила цен"
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(price__isnull=False) | models.Q(min_nights__isnull=False),
+                name='price_rule_price_or_min_nights',
+            ),
+            models.CheckConstraint(
+                condition=models.Q(start_date__isnull=True) | models.Q(end_date__isnull=True)
+                | models.Q(start_date__lte=models.F('end_date')),
+                name='price_rule_dates_ordered',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Правило цены квартиры {self.apartment_id}: {self.start_date or '...'} - {self.end_date or '...'}"
+
+
+class IdempotencyRecord(models.Model):
+    """
+    Первый успешный ответ на POST с заголовком Idempotency-Key (см. idempotency.py):
+    повтор запроса с тем же ключом получает этот ответ, а не создаёт объект заново.
+    Просроченные записи удаляет purge_idempotency_keys.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='idempotency_records',
+        verbose_name="Пользователь"
+    )
+    route = models.CharField(max_length=100, verbose_name="Маршрут") # Имя URL, например apartments:booking-list
+    key = models.CharField(max_length=255, verbose_name="Ключ")
+    # sha256 тела запроса: тот же ключ с другими данными - ошибка клиента
+    fingerprint = models.CharField(max_length=64, verbose_name="Отпечаток запроса")
+    status_code = models.PositiveSmallIntegerField(verbose_name="Статус ответа")
+    response_body = models.BinaryField(verbose_name="Тело ответа (JSON)")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Создан")
+    expires_at = models.DateTimeField(db_index=True, verbose_name="Истекает")
+
+    class Meta:
+        verbose_name = "Ключ идемпотентности"
+        verbose_name_plural = "Ключи идемпотентности"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'route', 'key'], name='idempotency_user_route_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.route} {self.key} ({self.status_code})"
+
+
+class ApartmentMonthlyStats(models.Model):
+    """
+    Сводка по квартире за календарный месяц: выручка, забронированные ночи.
+    Поддерживается автоматически при изменении бронирований (см. analytics.py),
+    полностью пересобирается командой rebuild_monthly_stats.
+    """
+    apartment = models.ForeignKey(
+        Apartment,
+        on_delete=models.CASCADE,
+        related_name='monthly_stats',
+        verbose_name="Квартира"
+    )
+    month = models.DateField(verbose_name="Месяц") # Всегда первое число месяца
+    nights_booked = models.PositiveIntegerField(default=0, verbose_name="Забронировано ночей")
+    bookings_count = models.PositiveIntegerField(default=0, verbose_name="Заездов")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Выручка")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['apartment', 'month']
+        # Уникальный индекс (apartment, month) обслуживает и выборки для дашборда
+        unique_together = ('apartment', 'month')
+        verbose_name = "Статистика за месяц"
+        verbose_name_plural = "Статистика по месяцам"
+
+    def __str__(self):
+        return f"Статистика квартиры {self.apartment_id} за {self.month:%Y-%m}"
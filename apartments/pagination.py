@@ -0,0 +1,149 @@
+# apartments/pagination.py
+import json
+
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+def table_row_estimate(model, using='default'):
+    """
+    Оценка количества строк таблицы по статистике планировщика (pg_class.reltuples).
+    У секционированной таблицы (бронирования) - сумма оценок секций.
+    Возвращает None, если оценки нет (не PostgreSQL или таблица ещё не анализировалась).
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT CASE WHEN relkind = 'p' THEN ("
+            "  SELECT sum(part.reltuples) FROM pg_inherits JOIN pg_class part ON part.oid = pg_inherits.inhrelid"
+            "  WHERE pg_inherits.inhparent = pg_class.oid AND part.reltuples >= 0"
+            ") ELSE reltuples END::bigint FROM pg_class WHERE oid = %s::regclass",
+            [model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+def query_row_estimate(queryset):
+    """
+    Оценка количества строк запроса по плану PostgreSQL (EXPLAIN, без выполнения).
+    Возвращает None для других СУБД.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+    except EmptyResultSet:
+        return 0 # queryset.none() или pk__in=[] - запрос даже не строится
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedPage(Page):
+    """Страница, у которой наличие следующей определяется по факту, а не по count."""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator для больших таблиц: вместо точного COUNT(*) (полный проход по
+    таблице/индексу) использует оценку планировщика - pg_class.reltuples для
+    списка без фильтров и EXPLAIN для отфильтрованного. Если оценка меньше
+    порога, считает точно. Признак count_is_estimated показывает, что count
+    приблизительный.
+    """
+    # Ниже этого порога точный COUNT(*) дешёвый, а оценка может быть неточной
+    exact_count_threshold = 10000
+
+    count_is_estimated = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if hasattr(queryset, 'query'):
+            if queryset.query.where:
+                estimate = query_row_estimate(queryset)
+            else:
+                estimate = table_row_estimate(queryset.model, queryset.db)
+            if estimate is not None and estimate >= self.exact_count_threshold:
+                self.count_is_estimated = True
+                return estimate
+        return super().count
+
+    def validate_number(self, number):
+        if not self.count_is_estimated:
+            return super().validate_number(number)
+        # При оценочном count последняя страница неизвестна точно -
+        # проверяем только нижнюю границу, пустая страница обнаружится в page()
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages['invalid_page'])
+        if number < 1:
+            raise EmptyPage(self.error_messages['min_page'])
+        return number
+
+    def page(self, number):
+        # count вычисляем заранее: от него зависит count_is_estimated
+        self.count
+        if not self.count_is_estimated:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        # Берём на одну строку больше, чтобы точно знать, есть ли следующая страница
+        object_list = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not object_list and number > 1:
+            raise EmptyPage(self.error_messages['no_results'])
+        has_next = len(object_list) > self.per_page
+        return EstimatedPage(object_list[:self.per_page], number, self, has_next)
+
+
+class EstimatedCountPageNumberPagination(PageNumberPagination):
+    """
+    Постраничная пагинация DRF на EstimatedCountPaginator.
+    В ответе дополнительно count_is_estimated: true, если count - оценка.
+    """
+    django_paginator_class = EstimatedCountPaginator
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data['count_is_estimated'] = self.page.paginator.count_is_estimated
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema['properties']['count_is_estimated'] = {'type': 'boolean', 'example': False}
+        return schema
+
+
+class ReviewCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация ленты отзывов (сначала новые).
+    В отличие от page-number не считает COUNT(*) и не делает OFFSET -
+    каждая страница это индексный проход по (apartment, -created_at, -id).
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
@@ -0,0 +1,165 @@
+# apartments/partitioning.py
+"""
+Помесячные секции таблицы бронирований (PostgreSQL, PARTITION BY RANGE (check_in_date)).
+
+Таблица apartments_booking секционирована миграцией 0015: одна секция
+apartments_booking_pГГГГ_ММ на месяц заезда и секция по умолчанию
+apartments_booking_default для дат вне созданных секций. Запросы с условием
+на check_in_date читают только секции нужных месяцев (partition pruning).
+Проживание не длиннее BOOKING_MAX_NIGHTS (ограничение booking_max_stay),
+поэтому пересечение с периодом [start, end) ищется в секциях заездов
+с start - BOOKING_MAX_NIGHTS - см. overlapping_bookings.
+
+Секции на BOOKING_PARTITION_MONTHS_AHEAD месяцев вперёд создаются после
+каждого migrate (signals.py) и командой ensure_booking_partitions (cron).
+Старые секции отсоединяются и выгружаются в сжатые CSV командой
+archive_booking_partitions - не раньше чем через MIN_ARCHIVE_AGE_MONTHS месяцев
+и только без броней, которые ещё занимают даты (PENDING, CONFIRMED).
+"""
+import datetime
+import gzip
+import math
+import os
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .analytics import month_start, next_month
+from .models import BOOKING_MAX_NIGHTS, Booking
+
+TABLE = Booking._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+PARTITION_RE = re.compile(rf'^{TABLE}_p(\d{{4}})_(\d{{2}})$')
+# Проживание с заездом в архивируемом месяце уже закончилось: самое длинное - BOOKING_MAX_NIGHTS
+MIN_ARCHIVE_AGE_MONTHS = math.ceil(BOOKING_MAX_NIGHTS / 28) + 1
+# Брони, которые ещё не завершены или не отменены - такую секцию архивировать нельзя
+OPEN_STATUSES = (Booking.BookingStatus.PENDING, Booking.BookingStatus.CONFIRMED)
+
+
+class OpenBookingsError(Exception):
+    """В секции есть брони в статусе PENDING или CONFIRMED."""
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y_%m}'
+
+
+def overlapping_bookings(queryset, start, end):
+    """
+    Брони queryset, проживание которых пересекается с [start, end).
+    Нижняя граница по check_in_date не меняет результат, но позволяет
+    PostgreSQL не читать секции заездов старше start - BOOKING_MAX_NIGHTS.
+    """
+    return queryset.filter(
+        check_in_date__lt=end,
+        check_in_date__gt=start - datetime.timedelta(days=BOOKING_MAX_NIGHTS),
+        check_out_date__gt=start,
+    )
+
+
+def is_partitioned(using='default'):
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def partitions(using='default'):
+    """Помесячные секции: {первое число месяца: имя таблицы}."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = %s::regclass",
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    months = {}
+    for name in names:
+        match = PARTITION_RE.match(name)
+        if match:
+            months[datetime.date(int(match[1]), int(match[2]), 1)] = name
+    return months
+
+
+def _create_partition(cursor, month):
+    """
+    Создаёт секцию месяца. Брони этого месяца, попавшие раньше в секцию по
+    умолчанию, переносятся в новую до присоединения: иначе ATTACH завершится
+    ошибкой.
+    """
+    name, start, end = partition_name(month), month, next_month(month)
+    cursor.execute(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE check_in_date >= %s AND check_in_date < %s '
+        f'RETURNING *) INSERT INTO {name} SELECT * FROM moved',
+        [start, end],
+    )
+    cursor.execute(f'ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)', [start, end])
+    return name
+
+
+def oldest_partition_month(using='default'):
+    """Первый месяц, чья секция ещё есть; None - таблица не секционирована или секций нет."""
+    if not is_partitioned(using):
+        return None
+    return min(partitions(using), default=None)
+
+
+def ensure_partitions(first=None, last=None, months_ahead=None, using='default'):
+    """
+    Создаёт недостающие секции месяцев с first по last (по умолчанию - с
+    текущего на months_ahead, BOOKING_PARTITION_MONTHS_AHEAD, вперёд).
+    Возвращает имена созданных.
+    """
+    if not is_partitioned(using):
+        return []
+    today = datetime.date.today()
+    month = month_start(first or today)
+    if last is None:
+        if months_ahead is None:
+            months_ahead = getattr(settings, 'BOOKING_PARTITION_MONTHS_AHEAD', 12)
+        last = today
+        for _ in range(months_ahead):
+            last = next_month(last)
+    existing = partitions(using)
+    created = []
+    with transaction.atomic(using), connections[using].cursor() as cursor:
+        while month <= last:
+            if month not in existing:
+                created.append(_create_partition(cursor, month))
+            month = next_month(month)
+    return created
+
+
+def archive_partition(month, directory, using='default'):
+    """
+    Отсоединяет секцию месяца, выгружает её в <directory>/<имя>.csv.gz (CSV
+    с заголовком, формат COPY) и удаляет таблицу. Всё в одной транзакции:
+    при ошибке выгрузки секция остаётся на месте. Секция с бронями в статусе
+    PENDING/CONFIRMED не архивируется - OpenBookingsError. Возвращает путь к файлу.
+    """
+    name = partition_name(month)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f'{name}.csv.gz'
+    temporary = path.with_name(path.name + '.tmp')
+    try:
+        with transaction.atomic(using), connections[using].cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+            # После DETACH в секцию уже ничего не вставят; ошибка откатывает и отсоединение
+            cursor.execute(f'SELECT count(*) FROM {name} WHERE status IN %s', [OPEN_STATUSES])
+            open_bookings = cursor.fetchone()[0]
+            if open_bookings:
+                raise OpenBookingsError(f"{name}: незавершённых броней - {open_bookings}")
+            with gzip.open(temporary, 'wb') as output:
+                cursor.copy_expert(f'COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)', output)
+            os.replace(temporary, path)
+            cursor.execute(f'DROP TABLE {name}')
+    finally:
+        temporary.unlink(missing_ok=True)
+    return path
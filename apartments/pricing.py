@@ -0,0 +1,122 @@
+# apartments/pricing.py
+"""
+Стоимость проживания с учётом правил цен (PriceRule).
+
+Правила квартиры компилируются в массив цен по ночам: ночь - np.datetime64[D],
+цена - целые копейки (int64, без ошибок округления float). Для многих квартир
+сразу (quote_many: поисковая выдача, бронирование) это матрица квартиры x ночи:
+правила всех квартир читаются одним запросом по индексу apartment_id и
+применяются векторно - без цикла по ночам и по квартирам.
+"""
+from decimal import Decimal
+
+import numpy as np
+
+from .models import BOOKING_MAX_NIGHTS, PriceRule
+
+# Дальше по датам цены не считаются (и бронирование на такой срок не принимается)
+MAX_NIGHTS = BOOKING_MAX_NIGHTS
+
+RULE_COLUMNS = ('apartment_id', 'start_date', 'end_date', 'weekdays', 'price', 'min_nights')
+
+
+def _cents(value):
+    return int((Decimal(value) * 100).to_integral_value())
+
+
+def _money(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def weekdays_of(nights):
+    """Дни недели массива дат: 0 - понедельник, ..., 6 - воскресенье (1970-01-01 - четверг)."""
+    return (nights.astype(np.int64) + 3) % 7
+
+
+class Quote:
+    """Стоимость проживания в одной квартире: цены по ночам и минимальный срок."""
+
+    def __init__(self, apartment_id, check_in, cents, min_nights):
+        self.apartment_id = apartment_id
+        self.check_in = check_in
+        self.cents = cents
+        self.min_nights = int(min_nights)
+
+    @property
+    def nights(self):
+        return len(self.cents)
+
+    @property
+    def total(self):
+        return _money(self.cents.sum())
+
+    @property
+    def meets_min_stay(self):
+        return self.nights >= self.min_nights
+
+    def as_dict(self):
+        nights = np.datetime64(self.check_in) + np.arange(self.nights)
+        return {
+            'apartment': self.apartment_id,
+            'nights': self.nights,
+            'total_price': str(self.total),
+            'nightly_prices': [
+                {'date': str(night), 'price': str(_money(cents))} for night, cents in zip(nights, self.cents)
+            ],
+            'min_nights': self.min_nights,
+            'meets_min_stay': self.meets_min_stay,
+        }
+
+
+def compile_prices(base_prices, rules, check_in, check_out):
+    """
+    Матрица цен (копейки) квартиры x ночи и минимальный срок по квартирам.
+    base_prices - {id квартиры: цена за ночь}, rules - строки RULE_COLUMNS
+    по возрастанию приоритета (на ночь действует последнее подходящее правило).
+    """
+    row_of = {apartment_id: row for row, apartment_id in enumerate(base_prices)}
+    nights = np.arange(np.datetime64(check_in), np.datetime64(check_out))
+    base = np.fromiter((_cents(price) for price in base_prices.values()), dtype=np.int64, count=len(base_prices))
+    prices = np.repeat(base[:, None], len(nights), axis=1)
+    min_nights = np.ones(len(base), dtype=np.int64)
+    rules = [rule for rule in rules if rule[0] in row_of]
+    if not rules or not len(nights):
+        return prices, min_nights
+
+    rows = np.array([row_of[rule[0]] for rule in rules])
+    # Открытые границы - крайние представимые даты
+    start = np.array([rule[1] or '0001-01-01' for rule in rules], dtype='datetime64[D]')
+    end = np.array([rule[2] or '9999-12-31' for rule in rules], dtype='datetime64[D]')
+    weekdays = np.array([rule[3] for rule in rules], dtype=np.int64)
+    rule_prices = np.array([-1 if rule[4] is None else _cents(rule[4]) for rule in rules], dtype=np.int64)
+    rule_min_nights = np.array([rule[5] or 0 for rule in rules], dtype=np.int64)
+
+    # Правило x ночь: ночь в периоде правила и её день недели отмечен в маске
+    covers = (
+        (nights[None, :] >= start[:, None]) & (nights[None, :] <= end[:, None])
+        & ((weekdays[:, None] >> weekdays_of(nights)[None, :]) & 1).astype(bool)
+    )
+    # Номер (с 1) последнего по приоритету правила с ценой для каждой клетки квартира x ночь
+    rule_index, night_index = np.nonzero(covers & (rule_prices >= 0)[:, None])
+    winner = np.zeros(prices.shape, dtype=np.int64)
+    np.maximum.at(winner, (rows[rule_index], night_index), rule_index + 1)
+    prices = np.where(winner > 0, rule_prices[np.maximum(winner - 1, 0)], prices)
+
+    # Минимальный срок - по правилам, действующим в ночь заезда
+    applies = covers[:, 0] & (rule_min_nights > 0)
+    np.maximum.at(min_nights, rows[applies], rule_min_nights[applies])
+    return prices, min_nights
+
+
+def quote_many(base_prices, check_in, check_out):
+    """{id квартиры: Quote} для квартир base_prices ({id: Apartment.price}) - один запрос правил."""
+    rules = PriceRule.objects.filter(apartment_id__in=list(base_prices)).order_by('priority', 'id').values_list(*RULE_COLUMNS)
+    prices, min_nights = compile_prices(base_prices, list(rules), check_in, check_out)
+    return {
+        apartment_id: Quote(apartment_id, check_in, prices[row], min_nights[row])
+        for row, apartment_id in enumerate(base_prices)
+    }
+
+
+def quote(apartment, check_in, check_out):
+    return quote_many({apartment.pk: apartment.price}, check_in, check_out)[apartment.pk]
@@ -0,0 +1,299 @@
+# apartments/search.py
+"""
+Текстовый поиск квартир по названию и описанию (?q= в списке, см.
+filters.TextSearchFilterBackend) - векторная модель TF-IDF без внешних сервисов.
+
+Текст разбивается на слова, стоп-слова отбрасываются, остальные приводятся
+к основе стеммером Snowball ("уютная", "уютную", "уютный" -> "уютн"), поэтому
+запрос находит объявления с другими формами слов. Основа хэшируется в одну из
+HASH_FEATURES колонок: словаря нет, и новые слова не требуют пересборки.
+Документ - вектор 1 + log(tf) по колонкам (название считается TITLE_WEIGHT раз),
+нормированный по длине. idf не зашит в матрицу, а считается при открытии
+индекса по частотам колонок: запрос с весами idf² даёт тот же порядок, что
+tf-idf с обеих сторон, а инкрементальные обновления не трогают старые строки.
+
+Матрица хранится по колонкам (CSC - это и есть инвертированный индекс):
+на запрос читаются только списки документов его слов. Массивы основной сборки
+лежат в .npy и открываются через mmap - воркеры gunicorn делят страницы в page
+cache. Изменённые после сборки квартиры попадают в небольшой дельта-сегмент
+(отдельный .npz, переписывается целиком), а их прежние строки в основной
+сборке помечаются удалёнными. Когда дельта превышает SEARCH_DELTA_CAPACITY,
+она продолжает расти (обновления не теряются, но каждое дороже), а индекс
+помечается устаревшим (indexing.mark_stale) - его пересобирает cron
+(build_search_index --if-stale). Воркеры замечают обновления по mtime meta.json.
+"""
+import json
+import logging
+import re
+import shutil
+import threading
+import time
+import zlib
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import snowballstemmer
+from django.conf import settings
+from numpy.lib.format import open_memmap
+from scipy import sparse
+
+from . import indexing
+from .models import Apartment
+
+logger = logging.getLogger(__name__)
+
+HASH_FEATURES = 2 ** 18
+TITLE_WEIGHT = 2
+MAX_QUERY_TERMS = 32
+
+WORD_RE = re.compile(r'[0-9a-zа-я]+')
+STOP_WORDS = frozenset("""
+    а без более бы был была были было быть в вам вас весь во вот все всего всех вы где да даже для до его
+    ее ей ему если есть еще же за здесь и из или им их к как какая какой когда кто ли либо между мне
+    можно мы на над надо наш не него нее нет ни них но ну о об однако он она они оно от очень по под
+    после при про с со так также такой там те тем то того тоже только том ты у уже хотя чего чей чем
+    что чтобы чье эта эти это этот я
+    a an and at by for from in is of on or the to with
+""".split())
+
+_stemmers = {
+    'russian': snowballstemmer.stemmer('russian'),
+    'english': snowballstemmer.stemmer('english'),
+}
+# Стеммеры Snowball хранят состояние между вызовами - не для параллельных потоков
+_stem_lock = threading.Lock()
+
+
+def index_dir():
+    return Path(settings.SEARCH_INDEX_DIR)
+
+
+@lru_cache(maxsize=200_000)
+def stem(word):
+    language = 'english' if word.isascii() else 'russian'
+    with _stem_lock:
+        return _stemmers[language].stemWord(word)
+
+
+def tokenize(text):
+    """Основы значимых слов текста в порядке появления."""
+    words = WORD_RE.findall(text.lower().replace('ё', 'е'))
+    return [stem(word) for word in words if word not in STOP_WORDS and (len(word) > 1 or word.isdigit())]
+
+
+def feature(term):
+    return zlib.crc32(term.encode()) % HASH_FEATURES
+
+
+def _weights(counts):
+    """Counter основ -> (колонки, веса 1 + log(tf)) с учётом совпадения хэшей."""
+    buckets = Counter()
+    for term, count in counts.items():
+        buckets[feature(term)] += count
+    columns = np.fromiter(buckets.keys(), dtype=np.int32, count=len(buckets))
+    tf = np.fromiter(buckets.values(), dtype=np.float32, count=len(buckets))
+    return columns, 1.0 + np.log(tf)
+
+
+def document_vector(title, description):
+    """Нормированный вектор документа: (колонки, веса)."""
+    counts = Counter(tokenize(title))
+    for term in counts:
+        counts[term] *= TITLE_WEIGHT
+    counts.update(tokenize(description))
+    if not counts:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+    columns, weights = _weights(counts)
+    return columns, weights / np.linalg.norm(weights)
+
+
+def _documents_matrix(rows):
+    """CSR-матрица документов для строк (id, title, description)."""
+    columns, weights, indptr = [], [], [0]
+    for _, title, description in rows:
+        row_columns, row_weights = document_vector(title, description)
+        columns.append(row_columns)
+        weights.append(row_weights)
+        indptr.append(indptr[-1] + len(row_columns))
+    return sparse.csr_matrix(
+        (
+            np.concatenate(weights) if weights else np.empty(0, dtype=np.float32),
+            np.concatenate(columns) if columns else np.empty(0, dtype=np.int32),
+            np.array(indptr, dtype=np.int64),
+        ),
+        shape=(len(rows), HASH_FEATURES),
+    )
+
+
+def _load_rows(ids=None):
+    """(id, title, description) активных квартир по возрастанию id; с ids - только этих квартир."""
+    apartments = Apartment.objects.filter(is_active=True).order_by('id')
+    if ids is not None:
+        apartments = apartments.filter(pk__in=ids)
+    return list(apartments.values_list('id', 'title', 'description').iterator(chunk_size=5000))
+
+
+def build_index(directory=None):
+    """Полная сборка индекса по всем активным квартирам. Возвращает число квартир."""
+    directory = Path(directory or index_dir())
+    with indexing.lock(directory):
+        return _build(directory)
+
+
+def _build(directory):
+    rows = _load_rows()
+    matrix = _documents_matrix(rows).tocsc()
+    matrix.sort_indices()
+    meta = {'version': f'v{time.time_ns()}', 'count': len(rows), 'delta': None}
+    path = directory / meta['version']
+    path.mkdir(parents=True)
+    # Строки упорядочены по id - позиция квартиры ищется через searchsorted
+    np.save(path / 'ids.npy', np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)))
+    np.save(path / 'data.npy', matrix.data.astype(np.float32, copy=False))
+    np.save(path / 'indices.npy', matrix.indices)
+    np.save(path / 'indptr.npy', matrix.indptr.astype(matrix.indices.dtype, copy=False))
+    deleted = open_memmap(path / 'deleted.npy', mode='w+', dtype=np.bool_, shape=(len(rows),))
+    deleted.flush()
+    indexing.write_json(directory / 'meta.json', meta)
+    indexing.clear_stale(directory)
+    for old in directory.iterdir():
+        if old.is_dir() and old.name != meta['version']:
+            shutil.rmtree(old, ignore_errors=True)
+    return len(rows)
+
+
+def _load_delta(path):
+    if path is None:
+        return np.empty(0, dtype=np.int64), sparse.csr_matrix((0, HASH_FEATURES), dtype=np.float32)
+    with np.load(path) as delta:
+        matrix = sparse.csr_matrix(
+            (delta['data'], delta['indices'], delta['indptr']), shape=(len(delta['ids']), HASH_FEATURES)
+        )
+        return delta['ids'], matrix
+
+
+class SearchIndex:
+    """Открытый через mmap индекс одной сборки вместе с её дельта-сегментом."""
+
+    def __init__(self, directory, meta, mode='r'):
+        self.meta = meta
+        self.path = Path(directory) / meta['version']
+        self.count = meta['count']
+        self.ids = np.asarray(np.load(self.path / 'ids.npy', mmap_mode='r'))
+        self.deleted = np.load(self.path / 'deleted.npy', mmap_mode=mode)
+        if mode == 'r':
+            self.deleted = np.asarray(self.deleted)
+        # copy=False: scipy оборачивает mmap-массивы без копирования
+        self.matrix = sparse.csc_matrix(
+            tuple(np.asarray(np.load(self.path / f'{name}.npy', mmap_mode='r')) for name in ('data', 'indices', 'indptr')),
+            shape=(self.count, HASH_FEATURES), copy=False,
+        )
+        self.delta_ids, delta = _load_delta(self.path / meta['delta'] if meta['delta'] else None)
+        self.delta_rows = delta
+        self.delta = delta.tocsc()
+        # Документов с колонкой: основная сборка + дельта (удалённые строки учтутся при пересборке)
+        documents = np.diff(self.matrix.indptr) + np.bincount(delta.indices, minlength=HASH_FEATURES)
+        total = self.count + len(self.delta_ids)
+        self.idf = (np.log((1 + total) / (1 + documents)) + 1).astype(np.float32)
+
+    def position(self, apartment_id):
+        index = int(np.searchsorted(self.ids, apartment_id))
+        if index < len(self.ids) and self.ids[index] == apartment_id:
+            return index
+        return None
+
+    def query_vector(self, text):
+        """Колонки и веса запроса; пустые массивы, если значимых слов нет."""
+        counts = Counter(tokenize(text)[:MAX_QUERY_TERMS])
+        if not counts:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        columns, weights = _weights(counts)
+        return columns, weights * self.idf[columns] ** 2
+
+    def search(self, text, limit):
+        """До limit пар (id, релевантность) по убыванию релевантности."""
+        columns, weights = self.query_vector(text)
+        if not len(columns):
+            return []
+        # Срез по колонкам CSC читает только списки документов слов запроса
+        scores = self.matrix[:, columns] @ weights
+        scores[self.deleted] = 0
+        if len(self.delta_ids):
+            scores = np.concatenate([scores, self.delta[:, columns] @ weights])
+            ids = np.concatenate([self.ids, self.delta_ids])
+        else:
+            ids = self.ids
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(scores[candidates], -limit)[-limit:]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        results, seen = [], set()
+        for i in candidates:
+            # Пока update_apartments не пометил старую строку, квартира может быть и в дельте
+            apartment_id = int(ids[i])
+            if apartment_id not in seen:
+                seen.add(apartment_id)
+                results.append((apartment_id, float(scores[i])))
+        return results
+
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def get_index():
+    """Индекс текущей сборки (переоткрывается после обновления) или None, если его нет."""
+    directory = index_dir()
+    try:
+        mtime = (directory / 'meta.json').stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    key = (str(directory), mtime)
+    index = _loaded.get(key)
+    if index is None:
+        with _loaded_lock:
+            meta = json.loads((directory / 'meta.json').read_text())
+            index = SearchIndex(directory, meta)
+            _loaded.clear()
+            _loaded[key] = index
+    return index
+
+
+def update_apartments(ids):
+    """
+    Инкрементально обновляет индекс для квартир ids (изменены, созданы или удалены):
+    прежние строки помечаются удалёнными, актуальные тексты активных квартир
+    переписываются в дельта-сегмент.
+    """
+    directory = index_dir()
+    if not (directory / 'meta.json').exists():
+        return
+    ids = set(ids)
+    with indexing.lock(directory):
+        meta = json.loads((directory / 'meta.json').read_text())
+        index = SearchIndex(directory, meta, mode='r+')
+        keep = ~np.isin(index.delta_ids, list(ids))
+        rows = _load_rows(ids)
+        size = int(keep.sum()) + len(rows)
+        if size > getattr(settings, 'SEARCH_DELTA_CAPACITY', 5000):
+            # Полная пересборка - не здесь (on_commit запроса, под блокировкой), а в cron
+            indexing.mark_stale(directory, f"дельта текстового индекса переполнена: {size} квартир")
+
+        delta_ids = np.concatenate([index.delta_ids[keep], np.array([row[0] for row in rows], dtype=np.int64)])
+        delta = sparse.vstack([index.delta_rows[keep], _documents_matrix(rows)], format='csr')
+        name = f'delta-{time.time_ns()}.npz'
+        np.savez(index.path / name, ids=delta_ids, data=delta.data.astype(np.float32, copy=False),
+                 indices=delta.indices, indptr=delta.indptr)
+        previous, meta['delta'] = meta['delta'], name
+        indexing.write_json(directory / 'meta.json', meta)
+        if previous:
+            (index.path / previous).unlink(missing_ok=True)
+
+        # Старые строки - после новой дельты: квартира не пропадает из выдачи между шагами
+        for apartment_id in ids:
+            position = index.position(apartment_id)
+            if position is not None:
+                index.deleted[position] = True
+        index.deleted.flush()
@@ -0,0 +1,289 @@
+# apartments/seeding.py
+"""
+Генерация синтетических данных для нагрузочного тестирования и бенчмарков
+(команда seed_perf_data, тесты бюджета запросов).
+
+Все объекты создаются через bulk_create пачками, связанные строки - сразу после
+своей пачки квартир, поэтому память не растёт с масштабом. Сигналы при
+bulk_create не срабатывают: geohash заполняется явно, а помесячная статистика
+и индекс похожих квартир пересобираются одним проходом в конце.
+
+Все пользователи получают один известный пароль, имена вида <prefix>_<n> -
+так бенчмарк может логиниться, а flush() удаляет ровно сгенерированные данные.
+"""
+import datetime
+import io
+import random
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import amenities, analytics, indexing, partitioning, search, similarity
+from .models import Amenity, Apartment, ApartmentPhoto, Booking, Review
+
+User = get_user_model()
+
+DEFAULT_PREFIX = 'perf'
+DEFAULT_PASSWORD = 'perf-password-123'
+
+# Все сгенерированные фото ссылаются на один файл-заглушку
+PLACEHOLDER_PHOTO = 'apartments/perf/placeholder.jpg'
+
+# Город, примерный центр и разброс координат (градусы)
+CITIES = [
+    ('Алматы', 43.238, 76.889, 0.12),
+    ('Астана', 51.128, 71.430, 0.10),
+    ('Шымкент', 42.341, 69.590, 0.08),
+    ('Караганда', 49.806, 73.085, 0.07),
+    ('Актобе', 50.283, 57.167, 0.06),
+    ('Тараз', 42.900, 71.367, 0.05),
+    ('Павлодар', 52.287, 76.967, 0.05),
+    ('Усть-Каменогорск', 49.948, 82.628, 0.05),
+    ('Актау', 43.650, 51.160, 0.05),
+    ('Туркестан', 43.297, 68.252, 0.04),
+]
+# Вес города - доля объявлений (крупные города популярнее)
+CITY_WEIGHTS = [30, 22, 12, 8, 6, 5, 5, 4, 4, 4]
+
+AMENITIES = [
+    'Wi-Fi', 'Кондиционер', 'Стиральная машина', 'Парковка', 'Кухня', 'Телевизор',
+    'Балкон', 'Лифт', 'Утюг', 'Фен', 'Посудомоечная машина', 'Можно с животными',
+]
+STREETS = ['Абая', 'Достык', 'Назарбаева', 'Сатпаева', 'Толе би', 'Жибек жолы', 'Кабанбай батыра']
+TITLE_WORDS = ['Уютная', 'Светлая', 'Просторная', 'Тихая', 'Новая', 'Стильная']
+# Фразы описаний - чтобы текстовый поиск (search.py) работал на правдоподобных текстах
+DESCRIPTION_PHRASES = [
+    'Пять минут пешком до метро.', 'Рядом парк и набережная.', 'Вид на горы из окна.',
+    'Свежий ремонт, новая мебель и техника.', 'Тихий двор, окна во двор.', 'Есть балкон с видом на город.',
+    'В центре города, рядом кафе и магазины.', 'Бесплатная парковка у дома.', 'Подходит для семьи с детьми.',
+    'Быстрый Wi-Fi и рабочее место.', 'Можно с домашними животными.', 'Посудомоечная и стиральная машины.',
+]
+REVIEW_TEXTS = [
+    'Отличная квартира, всё как на фото.',
+    'Чисто и уютно, хозяин всегда на связи.',
+    'Хорошее расположение, рядом магазины и транспорт.',
+    'Немного шумно ночью, в остальном всё хорошо.',
+    'Заселение без проблем, рекомендую.',
+]
+TYPE_GUESTS = {
+    Apartment.ApartmentType.STUDIO: (1, 2),
+    Apartment.ApartmentType.ONE_ROOM: (2, 3),
+    Apartment.ApartmentType.TWO_ROOM: (3, 5),
+    Apartment.ApartmentType.THREE_ROOM: (4, 7),
+    Apartment.ApartmentType.HOUSE: (6, 12),
+    Apartment.ApartmentType.OTHER: (1, 4),
+}
+
+
+class PerfDataSeeder:
+    """
+    apartments - масштаб: остальные объёмы считаются от него (в среднем на
+    квартиру photos_per_apartment фото, reviews_per_apartment отзывов,
+    bookings_per_apartment броней и ~4 удобства; пользователей - users_ratio
+    от числа квартир). При значениях по умолчанию это ~21 строка на квартиру:
+    500 квартир ~ 10 тыс. строк, 500 тыс. ~ 10 млн.
+    """
+
+    def __init__(self, apartments, prefix=DEFAULT_PREFIX, password=DEFAULT_PASSWORD, seed=42,
+                 photos_per_apartment=3, reviews_per_apartment=4, bookings_per_apartment=8,
+                 users_ratio=0.2, batch_size=1000, stdout=None):
+        self.apartments = apartments
+        self.prefix = prefix
+        self.password = password
+        self.rng = random.Random(seed)
+        # Тексты - от отдельного генератора: набор фраз не меняет остальные данные того же seed
+        self.text_rng = random.Random(seed + 1)
+        self.photos_per_apartment = photos_per_apartment
+        self.reviews_per_apartment = reviews_per_apartment
+        self.bookings_per_apartment = bookings_per_apartment
+        self.users = max(10, int(apartments * users_ratio), reviews_per_apartment + 1)
+        self.batch_size = batch_size
+        self.stdout = stdout
+        self.counts = {'users': 0, 'amenities': 0, 'apartments': 0, 'apartment_amenities': 0,
+                       'photos': 0, 'reviews': 0, 'bookings': 0}
+
+    def flush(self):
+        """Удаляет ранее сгенерированные данные с этим префиксом (каскадом от пользователей)."""
+        # Индексы - одним обновлением в конце, а не на каждую удалённую квартиру
+        with indexing.deferred_updates():
+            deleted, _ = User.objects.filter(username__startswith=f'{self.prefix}_').delete()
+        return deleted
+
+    def run(self, rebuild_stats=True):
+        today = timezone.now().date()
+        self._ensure_placeholder()
+        amenity_ids = self._seed_amenities()
+        user_ids = self._seed_users()
+
+        created = 0
+        while created < self.apartments:
+            size = min(self.batch_size, self.apartments - created)
+            # Одна транзакция на пачку квартир со всеми связанными строками
+            with transaction.atomic():
+                apartments = self._seed_apartments(size, created, user_ids)
+                self._seed_apartment_amenities(apartments, amenity_ids)
+                self._seed_photos(apartments)
+                self._seed_reviews(apartments, user_ids)
+                self._seed_bookings(apartments, user_ids, today)
+            created += size
+            self._progress(f"Квартир: {created}/{self.apartments}")
+
+        self._analyze()
+        if rebuild_stats:
+            analytics.rebuild_all()
+            similarity.build_index()
+            search.build_index()
+        return self.counts
+
+    def _progress(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def _ensure_placeholder(self):
+        if default_storage.exists(PLACEHOLDER_PHOTO):
+            return
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 48), (200, 200, 200)).save(buffer, format='JPEG')
+        default_storage.save(PLACEHOLDER_PHOTO, ContentFile(buffer.getvalue()))
+
+    def _seed_amenities(self):
+        existing = set(Amenity.objects.filter(name__in=AMENITIES).values_list('name', flat=True))
+        missing = [Amenity(name=name) for name in AMENITIES if name not in existing]
+        Amenity.objects.bulk_create(missing)
+        if missing:
+            # bulk_create не отправляет post_save - сбрасываем кэш справочника сами
+            amenities.invalidate()
+        self.counts['amenities'] = len(missing)
+        return list(Amenity.objects.filter(name__in=AMENITIES).values_list('id', flat=True))
+
+    def _seed_users(self):
+        # Хешируем пароль один раз: PBKDF2 на каждого пользователя занял бы минуты
+        password_hash = make_password(self.password)
+        ids = []
+        for start in range(0, self.users, self.batch_size):
+            batch = [
+                User(
+                    username=f'{self.prefix}_{number}',
+                    email=f'{self.prefix}_{number}@example.invalid',
+                    password=password_hash,
+                    city=self.rng.choices(CITIES, CITY_WEIGHTS)[0][0],
+                )
+                for number in range(start, min(start + self.batch_size, self.users))
+            ]
+            ids.extend(user.pk for user in User.objects.bulk_create(batch))
+        self.counts['users'] = len(ids)
+        return ids
+
+    def _seed_apartments(self, size, offset, user_ids):
+        rng = self.rng
+        batch = []
+        for number in range(offset, offset + size):
+            city, latitude, longitude, spread = rng.choices(CITIES, CITY_WEIGHTS)[0]
+            apartment_type = rng.choice(list(TYPE_GUESTS))
+            min_guests, max_guests = TYPE_GUESTS[apartment_type]
+            guests = rng.randint(min_guests, max_guests)
+            apartment = Apartment(
+                owner_id=rng.choice(user_ids),
+                title=f'{rng.choice(TITLE_WORDS)} квартира #{number}',
+                description=' '.join(self.text_rng.sample(DESCRIPTION_PHRASES, 3)),
+                price=Decimal(rng.randrange(8000, 60000, 500)),
+                address=f'ул. {rng.choice(STREETS)}, {rng.randint(1, 250)}',
+                city=city,
+                latitude=latitude + rng.uniform(-spread, spread),
+                longitude=longitude + rng.uniform(-spread, spread),
+                apartment_type=apartment_type,
+                max_guests=guests,
+                beds=max(1, guests // 2),
+                is_active=rng.random() > 0.05,
+            )
+            apartment.fill_geohash() # bulk_create не вызывает save()
+            batch.append(apartment)
+        apartments = Apartment.objects.bulk_create(batch)
+        self.counts['apartments'] += len(apartments)
+        return apartments
+
+    def _seed_apartment_amenities(self, apartments, amenity_ids):
+        through = Apartment.amenities.through
+        rows = []
+        for apartment in apartments:
+            for amenity_id in self.rng.sample(amenity_ids, self.rng.randint(2, min(6, len(amenity_ids)))):
+                rows.append(through(apartment_id=apartment.pk, amenity_id=amenity_id))
+        through.objects.bulk_create(rows, batch_size=self.batch_size)
+        self.counts['apartment_amenities'] += len(rows)
+
+    def _seed_photos(self, apartments):
+        rows = []
+        for apartment in apartments:
+            for _ in range(self._around(self.photos_per_apartment)):
+                rows.append(ApartmentPhoto(apartment_id=apartment.pk, image=PLACEHOLDER_PHOTO))
+        ApartmentPhoto.objects.bulk_create(rows, batch_size=self.batch_size)
+        # bulk_create не вызывает сигналы - обложки и счётчики пересчитываем сами
+        Apartment.objects.filter(pk__in=[apartment.pk for apartment in apartments]).refresh_photo_summary()
+        self.counts['photos'] += len(rows)
+
+    def _seed_reviews(self, apartments, user_ids):
+        rows = []
+        for apartment in apartments:
+            count = min(self._around(self.reviews_per_apartment), len(user_ids) - 1)
+            # Уникальные авторы на квартиру (unique_together apartment, author), не владелец
+            authors = [user_id for user_id in self.rng.sample(user_ids, count + 1) if user_id != apartment.owner_id]
+            for author_id in authors[:count]:
+                rows.append(Review(
+                    apartment_id=apartment.pk,
+                    author_id=author_id,
+                    text=self.rng.choice(REVIEW_TEXTS),
+                    rating=self.rng.choices([1, 2, 3, 4, 5], [1, 2, 5, 12, 20])[0],
+                ))
+        Review.objects.bulk_create(rows, batch_size=self.batch_size)
+        self.counts['reviews'] += len(rows)
+
+    def _seed_bookings(self, apartments, user_ids, today):
+        Status = Booking.BookingStatus
+        rows = []
+        for apartment in apartments:
+            # Брони одной квартиры идут подряд без пересечений: с года назад и в будущее
+            day = today - datetime.timedelta(days=self.rng.randint(200, 400))
+            for _ in range(self._around(self.bookings_per_apartment)):
+                check_in = day + datetime.timedelta(days=self.rng.randint(0, 20))
+                check_out = check_in + datetime.timedelta(days=self.rng.randint(1, 7))
+                day = check_out
+                if check_out < today:
+                    status = self.rng.choices([Status.COMPLETED, Status.CANCELLED], [85, 15])[0]
+                else:
+                    status = self.rng.choices([Status.CONFIRMED, Status.PENDING, Status.CANCELLED], [70, 20, 10])[0]
+                rows.append(Booking(
+                    apartment_id=apartment.pk,
+                    user_id=self.rng.choice(user_ids),
+                    check_in_date=check_in,
+                    check_out_date=check_out,
+                    total_price=apartment.price * (check_out - check_in).days,
+                    status=status,
+                ))
+        if rows:
+            # Секции на весь диапазон дат - иначе брони дальних месяцев осядут в секции по умолчанию
+            partitioning.ensure_partitions(
+                min(row.check_in_date for row in rows), max(row.check_in_date for row in rows)
+            )
+        Booking.objects.bulk_create(rows, batch_size=self.batch_size)
+        self.counts['bookings'] += len(rows)
+
+    def _around(self, mean):
+        """Случайное количество со средним mean (от 0 до 2*mean)."""
+        if mean <= 0:
+            return 0
+        return self.rng.randint(0, 2 * mean)
+
+    def _analyze(self):
+        # Свежая статистика планировщика: иначе планы и оценки count (pagination.py) врут
+        if connection.vendor != 'postgresql':
+            return
+        with connection.cursor() as cursor:
+            for model in (User, Apartment, Apartment.amenities.through, ApartmentPhoto, Review, Booking):
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
@@ -1,7 +1,8 @@
 # apartments/serializers.py
 from rest_framework import serializers
-from .models import Apartment, Booking, Amenity, Review, ApartmentPhoto # Импортируем обе модели и Review
-from auth_app.serializers import UserSerializer # Импортируем UserSerializer для владельца
+from .models import Apartment, Booking, Amenity, Review, ApartmentPhoto, PriceRule # Импортируем обе модели и Review
+from . import amenities, pricing
+from auth_app.serializers import UserSerializer, PublicUserSerializer # Импортируем UserSerializer для владельца
 from django.utils import timezone
 
 class ApartmentPhotoSerializer(serializers.ModelSerializer):
@@ -19,6 +20,20 @@ class AmenitySerializer(serializers.ModelSerializer):
         model = Amenity
         fields = ['id', 'name'] # Определяем, какие поля показывать для Amenity
 
+class CachedAmenityField(serializers.PrimaryKeyRelatedField):
+    """ID удобства проверяется по кэшу справочника (amenities.py), а не запросом на каждый ID."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            amenity = amenities.by_id().get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if amenity is None:
+            self.fail('does_not_exist', pk_value=data)
+        return amenity
+
 # --- Сериализатор для Квартир ---
 class ApartmentSerializer(serializers.ModelSerializer):
     # Для чтения: Показываем полные данные владельца
@@ -27,7 +42,7 @@ class ApartmentSerializer(serializers.ModelSerializer):
     amenities = AmenitySerializer(many=True, read_only=True)
 
     # Для записи: Принимаем список ID удобств
-    amenity_ids = serializers.PrimaryKeyRelatedField(
+    amenity_ids = CachedAmenityField(
         many=True,
         write_only=True,            # Только для записи (не будет в ответе JSON)
         queryset=Amenity.objects.all(), # Для проверки, что такие ID существуют
@@ -46,6 +61,8 @@ class ApartmentSerializer(serializers.ModelSerializer):
             'price',
             'address',
             'city',
+            'latitude',
+            'longitude',
             'apartment_type',   # Новое поле
             'max_guests',       # Новое поле
             'beds',             # Новое поле
@@ -64,11 +81,19 @@ class ApartmentSerializer(serializers.ModelSerializer):
         if value < 0:
             raise serializers.ValidationError("Price cannot be negative.")
         return value
-    
+
+    def validate(self, data):
+        # Координаты имеют смысл только парой (учитываем partial update)
+        latitude = data.get('latitude', getattr(self.instance, 'latitude', None))
+        longitude = data.get('longitude', getattr(self.instance, 'longitude', None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError("Latitude and longitude must be set together.")
+        return data
+
 class ReviewSerializer(serializers.ModelSerializer):
     """Сериализатор для модели Review."""
-    # Отображаем автора с помощью его сериализатора (только чтение)
-    author = UserSerializer(read_only=True)
+    # Автор - только публичные данные (id, username), без email и имени
+    author = PublicUserSerializer(read_only=True)
     # При создании отзыва нам нужно будет передать ID квартиры.
     # Поэтому поле apartment делаем НЕ read_only, а ссылкой на первичный ключ.
     apartment = serializers.PrimaryKeyRelatedField(
@@ -83,30 +108,44 @@ class ReviewSerializer(serializers.ModelSerializer):
             'apartment', # ID квартиры (при создании/обновлении), объект при чтении (нужно настроить)
             'author',    # Объект автора (только чтение)
             'text',
+            'rating',
             'created_at',
-            # 'rating', # Если добавили поле рейтинга
         ]
         # Автор назначается автоматически, дата создания тоже
         read_only_fields = ['id', 'author', 'created_at']
+        # Повторный отзыв отсекается уникальным ограничением (apartment, author) в базе -
+        # без предварительного запроса exists(), см. ReviewViewSet.perform_create
 
 
-    def validate(self, data):
-        """
-        Проверка, что пользователь еще не оставлял отзыв на эту квартиру.
-        """
-        # Получаем пользователя из контекста запроса
-        request = self.context.get('request')
-        if not request or not hasattr(request, 'user'):
-             # На всякий случай, если контекст не передан
-             return data
+class ApartmentDetailSerializer(ApartmentSerializer):
+    """Детальная карточка квартиры: плюс несколько последних отзывов."""
+    RECENT_REVIEWS_LIMIT = 5
 
-        author = request.user
-        apartment = data.get('apartment')
+    recent_reviews = serializers.SerializerMethodField()
+
+    class Meta(ApartmentSerializer.Meta):
+        fields = ApartmentSerializer.Meta.fields + ['recent_reviews']
+
+    def get_recent_reviews(self, obj):
+        reviews = (
+            Review.objects.filter(apartment=obj)
+            .select_related('author')
+            .recent_per_apartment(self.RECENT_REVIEWS_LIMIT)
+            .order_by('-created_at', '-id')
+        )
+        return ReviewSerializer(reviews, many=True, context=self.context).data
+
+
+class ApartmentListSerializer(ApartmentSerializer):
+    """
+    Карточка квартиры в списках: вместо галереи - обложка и количество фото
+    (поля самой квартиры, таблица фото не читается). Галерея - в детальной карточке.
+    """
+
+    class Meta(ApartmentSerializer.Meta):
+        fields = [name for name in ApartmentSerializer.Meta.fields if name != 'photos'] + ['cover_photo', 'photo_count']
+        read_only_fields = ApartmentSerializer.Meta.read_only_fields + ['cover_photo', 'photo_count']
 
-        # Проверяем только при создании нового отзыва (instance is None)
-        if self.instance is None and Review.objects.filter(apartment=apartment, author=author).exists():
-            raise serializers.ValidationError("You have already reviewed this apartment.")
-        return data
 
 class LimitedApartmentSerializer(serializers.ModelSerializer):
     # Можно показать только ID владельца или его username
@@ -150,10 +189,17 @@ class BookingSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Дата выезда должна быть позже даты заезда.")
         if check_in < timezone.now().date():
             raise serializers.ValidationError("Дата заезда не может быть в прошлом.")
+        if (check_out - check_in).days > pricing.MAX_NIGHTS:
+            raise serializers.ValidationError(f"Бронирование не может быть дольше {pricing.MAX_NIGHTS} ночей.")
         # !!! Не забыть вернуть проверку доступности позже !!!
+        # Цены по ночам с учётом правил квартиры (сезоны, выходные) и минимальный срок
+        quote = pricing.quote(data['apartment'], check_in, check_out)
+        if not quote.meets_min_stay:
+            raise serializers.ValidationError(f"Минимум ночей для заезда в эту дату: {quote.min_nights}.")
+        data['total_price'] = quote.total
         return data
 
-    # --- Метод create (без изменений) ---
+    # --- Метод create ---
     def create(self, validated_data):
         # ... (код метода create как был) ...
         apartment = validated_data.get('apartment')
@@ -162,10 +208,71 @@ class BookingSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         nights = (check_out - check_in).days
         if nights <= 0: raise serializers.ValidationError("Некорректное количество ночей.")
-        total_price = nights * apartment.price
+        total_price = validated_data['total_price'] # Посчитана в validate()
         booking = Booking.objects.create(
             user=request.user, apartment=apartment, check_in_date=check_in,
             check_out_date=check_out, total_price=total_price, status=Booking.BookingStatus.CONFIRMED
         )
         return booking
 
+
+class WeekdaysField(serializers.Field):
+    """Битовая маска PriceRule.weekdays <-> список дней недели (0 - понедельник, 6 - воскресенье)."""
+
+    def to_representation(self, value):
+        return [day for day in range(7) if value >> day & 1]
+
+    def to_internal_value(self, data):
+        if (not isinstance(data, list) or not data
+                or any(isinstance(day, bool) or not isinstance(day, int) or not 0 <= day <= 6 for day in data)):
+            raise serializers.ValidationError("Expected a non-empty list of weekdays 0-6 (0 is Monday).")
+        return sum(1 << day for day in set(data))
+
+
+class PriceRuleSerializer(serializers.ModelSerializer):
+    weekdays = WeekdaysField(required=False)
+
+    class Meta:
+        model = PriceRule
+        fields = ['id', 'apartment', 'start_date', 'end_date', 'weekdays', 'price', 'min_nights', 'priority', 'created_at']
+        read_only_fields = ['id', 'created_at']
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # Правила можно заводить только для своих квартир
+        request = self.context.get('request')
+        if request is not None and request.user.is_authenticated:
+            fields['apartment'].queryset = Apartment.objects.filter(owner=request.user)
+        return fields
+
+    def validate(self, data):
+        def value(name):
+            return data[name] if name in data else getattr(self.instance, name, None)
+
+        start, end = value('start_date'), value('end_date')
+        if start and end and start > end:
+            raise serializers.ValidationError("start_date must not be later than end_date.")
+        if value('price') is None and value('min_nights') is None:
+            raise serializers.ValidationError("Either price or min_nights is required.")
+        return data
+
+
+class StayQuerySerializer(serializers.Serializer):
+    """Запрос цен (и доступности) на одни даты для многих квартир поисковой выдачи."""
+    MAX_APARTMENTS = 100
+
+    apartments = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), min_length=1, max_length=MAX_APARTMENTS
+    )
+    check_in = serializers.DateField()
+    check_out = serializers.DateField()
+
+    def validate(self, data):
+        nights = (data['check_out'] - data['check_in']).days
+        if nights <= 0:
+            raise serializers.ValidationError("check_out must be later than check_in.")
+        if nights > pricing.MAX_NIGHTS:
+            raise serializers.ValidationError(f"At most {pricing.MAX_NIGHTS} nights.")
+        # Порядок ответа - порядок запроса, без повторов
+        data['apartments'] = list(dict.fromkeys(data['apartments']))
+        return data
@@ -0,0 +1,124 @@
+# apartments/signals.py
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import amenities, analytics, availability, indexing, partitioning
+from .models import Amenity, Apartment, ApartmentPhoto, ApartmentTombstone, Booking, PriceRule
+
+
+# --- Помесячная статистика: пересчитываем только затронутые месяцы ---
+@receiver(pre_save, sender=Booking)
+def remember_booking_period(sender, instance, **kwargs):
+    """Запоминаем прежние квартиру и даты, чтобы пересчитать и старые месяцы."""
+    instance._stats_previous = None
+    if instance.pk:
+        instance._stats_previous = Booking.objects.filter(pk=instance.pk).values_list(
+            'apartment_id', 'check_in_date', 'check_out_date'
+        ).first()
+
+
+def _schedule_stats_refresh(periods):
+    affected = {}
+    for apartment_id, check_in, check_out in periods:
+        affected.setdefault(apartment_id, set()).update(analytics.months_of_stay(check_in, check_out))
+
+    def refresh():
+        for apartment_id, months in affected.items():
+            analytics.refresh_apartment_months(apartment_id, months)
+
+    # После коммита - чтобы пересчёт видел итоговое состояние броней
+    transaction.on_commit(refresh)
+
+
+@receiver(post_save, sender=Booking)
+def refresh_stats_on_booking_save(sender, instance, **kwargs):
+    periods = [(instance.apartment_id, instance.check_in_date, instance.check_out_date)]
+    previous = getattr(instance, '_stats_previous', None)
+    if previous:
+        periods.append(previous)
+    _schedule_stats_refresh(periods)
+
+
+@receiver(post_delete, sender=Booking)
+def refresh_stats_on_booking_delete(sender, instance, **kwargs):
+    _schedule_stats_refresh([(instance.apartment_id, instance.check_in_date, instance.check_out_date)])
+
+
+# --- Лента изменений: удалённые квартиры оставляют след (tombstone) ---
+@receiver(post_delete, sender=Apartment)
+def record_apartment_tombstone(sender, instance, **kwargs):
+    ApartmentTombstone.objects.bulk_create(
+        [ApartmentTombstone(apartment_id=instance.pk, deleted_at=timezone.now())],
+        update_conflicts=True, unique_fields=['apartment_id'], update_fields=['deleted_at'],
+    )
+
+
+# --- Обложка и количество фото в карточке квартиры ---
+@receiver(post_save, sender=ApartmentPhoto)
+@receiver(post_delete, sender=ApartmentPhoto)
+def refresh_apartment_photo_summary(sender, instance, origin=None, **kwargs):
+    # Фото удаляются каскадом вместе с квартирой (или её владельцем) - пересчитывать нечего
+    if origin is not None and not isinstance(origin, ApartmentPhoto) and getattr(origin, 'model', None) is not ApartmentPhoto:
+        return
+    Apartment.objects.filter(pk=instance.apartment_id).refresh_photo_summary()
+
+
+# --- Индексы похожих и текстового поиска: обновляем после коммита только изменённые квартиры ---
+@receiver(post_save, sender=Apartment)
+@receiver(post_delete, sender=Apartment)
+def refresh_indexes_on_apartment_change(sender, instance, **kwargs):
+    indexing.schedule_update([instance.pk])
+
+
+@receiver(m2m_changed, sender=Apartment.amenities.through)
+def refresh_indexes_on_amenities_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        indexing.schedule_update([instance.pk])
+    elif pk_set:
+        # amenity.apartment_set.add(...) - pk_set это id квартир
+        indexing.schedule_update(pk_set)
+
+
+# --- Кэш доступности: меняем версию квартир, чьи брони, цены или данные изменились ---
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_availability_on_booking_change(sender, instance, **kwargs):
+    apartment_ids = [instance.apartment_id]
+    previous = getattr(instance, '_stats_previous', None)
+    if previous:
+        apartment_ids.append(previous[0]) # Бронь перенесли на другую квартиру
+    availability.invalidate(apartment_ids)
+
+
+@receiver(post_save, sender=PriceRule)
+@receiver(post_delete, sender=PriceRule)
+@receiver(post_save, sender=Apartment)
+@receiver(post_delete, sender=Apartment)
+def invalidate_availability_on_apartment_change(sender, instance, **kwargs):
+    availability.invalidate([instance.apartment_id if sender is PriceRule else instance.pk])
+
+
+# --- Кэш справочника удобств (amenities.py) ---
+@receiver(post_save, sender=Amenity)
+@receiver(post_delete, sender=Amenity)
+def invalidate_amenities(sender, **kwargs):
+    amenities.invalidate()
+
+
+@receiver(post_save, sender=Amenity)
+@receiver(pre_delete, sender=Amenity) # После удаления связей с квартирами уже нет
+def touch_apartments_on_amenity_change(sender, instance, created=False, **kwargs):
+    """Карточки в ленте изменений содержат названия удобств - квартиры должны попасть в неё снова."""
+    if not created:
+        Apartment.objects.filter(amenities=instance).update(updated_at=timezone.now())
+
+
+# --- Секции бронирований: после каждого migrate создаём недостающие на месяцы вперёд ---
+@receiver(post_migrate)
+def ensure_booking_partitions(sender, using, **kwargs):
+    if sender.label == 'apartments':
+        partitioning.ensure_partitions(using=using)
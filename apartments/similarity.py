@@ -0,0 +1,336 @@
+# apartments/similarity.py
+"""
+Индекс похожих квартир для GET /api/apartments/{id}/similar/.
+
+Каждая активная квартира - вектор признаков (float32): тип жилья one-hot,
+стандартизованные log(цена), число гостей и кроватей, плюс битовая маска
+удобств (uint64). Расстояние между квартирами - квадрат евклидова расстояния
+по признакам плюс AMENITY_WEIGHT * (1 - Жаккар по удобствам). Похожие ищутся
+только в том же городе: строки индекса отсортированы по городу, поэтому
+кандидаты - непрерывный срез, и запрос на 100 тыс. квартир укладывается
+в доли миллисекунды (build_similarity_index --benchmark).
+
+Массивы хранятся в .npy и открываются через mmap: воркеры gunicorn делят одни
+страницы файлов в page cache, а не держат по копии индекса. Новая сборка пишется
+в отдельный каталог и подменяет meta.json атомарно; воркеры замечают это по
+mtime meta.json и переоткрывают индекс.
+
+Инкрементальное обновление (после коммита, см. indexing.py): изменённая
+квартира перезаписывается на своём месте, квартира из другого города или
+новая - дописывается в хвост (хвост просматривается целиком, он небольшой),
+удалённая или снятая с публикации помечается неактивной. Когда хвост заполнен,
+новые строки не дописываются, а индекс помечается устаревшим (indexing.mark_stale):
+такая квартира до пересборки не попадает в чужие выдачи, но свои похожие получает
+по строке из БД. Параметры нормировки и набор удобств фиксируются при сборке -
+периодическая полная пересборка (cron, build_similarity_index --if-stale) их обновляет.
+"""
+import json
+import logging
+import shutil
+import threading
+import time
+import zlib
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from numpy.lib.format import open_memmap
+
+from . import indexing
+from .models import Apartment
+
+logger = logging.getLogger(__name__)
+
+TYPES = [value for value, _ in Apartment.ApartmentType.choices]
+TYPE_WEIGHT = 1.0
+PRICE_WEIGHT = 1.0
+CAPACITY_WEIGHT = 0.5
+AMENITY_WEIGHT = 1.0
+FEATURES = len(TYPES) + 3 # Тип (one-hot), цена, гости, кровати
+
+# norms - квадрат нормы вектора признаков, amenity_counts - число удобств (для Жаккара)
+ARRAYS = ('ids', 'city', 'active', 'features', 'norms', 'amenities', 'amenity_counts')
+
+
+def index_dir():
+    return Path(settings.SIMILARITY_INDEX_DIR)
+
+
+def city_key(city):
+    """Город -> целое число (регистр и пробелы по краям не важны)."""
+    return zlib.crc32(city.strip().upper().encode())
+
+
+def _load_rows(ids=None):
+    """
+    Строки квартир (id, город, тип, цена, гости, кровати, активна) и id их удобств.
+    Без ids - все активные квартиры (для полной сборки).
+    """
+    apartments = Apartment.objects.order_by()
+    links = Apartment.amenities.through.objects.order_by()
+    if ids is None:
+        apartments = apartments.filter(is_active=True)
+        links = links.filter(apartment__is_active=True)
+    else:
+        apartments = apartments.filter(pk__in=ids)
+        links = links.filter(apartment_id__in=ids)
+    rows = list(apartments.values_list('id', 'city', 'apartment_type', 'price', 'max_guests', 'beds', 'is_active'))
+    amenities = defaultdict(list)
+    for apartment_id, amenity_id in links.values_list('apartment_id', 'amenity_id').iterator(chunk_size=10000):
+        amenities[apartment_id].append(amenity_id)
+    return rows, amenities
+
+
+def _scaling(rows):
+    """Среднее и стандартное отклонение log(цена), гостей и кроватей по всем квартирам."""
+    if not rows:
+        return {name: [0.0, 1.0] for name in ('price', 'guests', 'beds')}
+    columns = {
+        'price': np.log1p(np.array([float(row[3]) for row in rows])),
+        'guests': np.array([row[4] for row in rows], dtype=np.float64),
+        'beds': np.array([row[5] for row in rows], dtype=np.float64),
+    }
+    return {name: [float(values.mean()), float(values.std()) or 1.0] for name, values in columns.items()}
+
+
+def _featurize(rows, amenities, meta):
+    """Массивы ids, city, features, amenities для строк _load_rows (см. _derived для остальных)."""
+    count = len(rows)
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+    city = np.fromiter((city_key(row[1]) for row in rows), dtype=np.int64, count=count)
+    features = np.zeros((count, FEATURES), dtype=np.float32)
+    type_index = {value: index for index, value in enumerate(TYPES)}
+    price_mean, price_std = meta['scaling']['price']
+    guests_mean, guests_std = meta['scaling']['guests']
+    beds_mean, beds_std = meta['scaling']['beds']
+    bits = {int(amenity_id): bit for amenity_id, bit in meta['amenity_bits'].items()}
+    masks = np.zeros((count, meta['amenity_words']), dtype=np.uint64)
+    for position, (pk, _, apartment_type, price, guests, beds, _) in enumerate(rows):
+        if apartment_type in type_index:
+            features[position, type_index[apartment_type]] = TYPE_WEIGHT
+        offset = len(TYPES)
+        features[position, offset] = PRICE_WEIGHT * (np.log1p(float(price)) - price_mean) / price_std
+        features[position, offset + 1] = CAPACITY_WEIGHT * (guests - guests_mean) / guests_std
+        features[position, offset + 2] = CAPACITY_WEIGHT * (beds - beds_mean) / beds_std
+        for amenity_id in amenities.get(pk, ()):
+            bit = bits.get(amenity_id)
+            if bit is not None: # Удобства, появившиеся после сборки, учтутся при пересборке
+                masks[position, bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+    return ids, city, features, masks
+
+
+def _derived(features, masks):
+    """Квадраты норм векторов и число удобств - чтобы не считать их при каждом запросе."""
+    return np.einsum('ij,ij->i', features, features), np.bitwise_count(masks).sum(axis=1, dtype=np.uint16)
+
+
+def build_index(directory=None):
+    """Полная сборка индекса по всем активным квартирам. Возвращает число квартир."""
+    directory = Path(directory or index_dir())
+    with indexing.lock(directory):
+        return _build(directory)
+
+
+def _build(directory):
+    rows, amenities = _load_rows()
+    amenity_ids = sorted({amenity_id for values in amenities.values() for amenity_id in values})
+    meta = {
+        'version': f'v{time.time_ns()}',
+        'scaling': _scaling(rows),
+        'amenity_bits': {str(amenity_id): bit for bit, amenity_id in enumerate(amenity_ids)},
+        'amenity_words': max(1, -(-len(amenity_ids) // 64)),
+    }
+    ids, city, features, masks = _featurize(rows, amenities, meta)
+    # Сортировка по городу: кандидаты для запроса - один непрерывный срез
+    order = np.lexsort((ids, city))
+    ids, city, features, masks = ids[order], city[order], features[order], masks[order]
+
+    count = len(ids)
+    capacity = count + getattr(settings, 'SIMILARITY_TAIL_CAPACITY', 4096)
+    path = directory / meta['version']
+    path.mkdir(parents=True)
+    shapes = {
+        'ids': ((capacity,), np.int64), 'city': ((capacity,), np.int64), 'active': ((capacity,), np.bool_),
+        'features': ((capacity, FEATURES), np.float32), 'norms': ((capacity,), np.float32),
+        'amenities': ((capacity, meta['amenity_words']), np.uint64), 'amenity_counts': ((capacity,), np.uint16),
+    }
+    arrays = {name: open_memmap(path / f'{name}.npy', mode='w+', dtype=dtype, shape=shape)
+              for name, (shape, dtype) in shapes.items()}
+    arrays['ids'][:count] = ids
+    arrays['city'][:count] = city
+    arrays['active'][:count] = True
+    arrays['features'][:count] = features
+    arrays['amenities'][:count] = masks
+    arrays['norms'][:count], arrays['amenity_counts'][:count] = _derived(features, masks)
+    for array in arrays.values():
+        array.flush()
+    # Поиск позиции по id в основной части: отсортированные id и их позиции
+    by_id = np.argsort(ids)
+    np.save(path / 'sorted_ids.npy', ids[by_id])
+    np.save(path / 'sorted_positions.npy', by_id.astype(np.int64))
+    tail = open_memmap(path / 'tail.npy', mode='w+', dtype=np.int64, shape=(1,)) # Заполнено строк хвоста
+    tail.flush()
+
+    keys, starts, counts = np.unique(city, return_index=True, return_counts=True)
+    meta.update({
+        'count': count,
+        'capacity': capacity,
+        'cities': {str(key): [int(start), int(start + size)] for key, start, size in zip(keys, starts, counts)},
+    })
+    indexing.write_json(directory / 'meta.json', meta)
+    indexing.clear_stale(directory)
+    # Старые сборки больше не нужны; открытые воркерами mmap остаются валидными до переоткрытия
+    for old in directory.iterdir():
+        if old.is_dir() and old.name != meta['version']:
+            shutil.rmtree(old, ignore_errors=True)
+    return count
+
+
+class SimilarityIndex:
+    """Открытый через mmap индекс одной сборки."""
+
+    def __init__(self, directory, meta, mode='r'):
+        self.meta = meta
+        path = Path(directory) / meta['version']
+        for name in ARRAYS + ('tail',):
+            array = np.load(path / f'{name}.npy', mmap_mode=mode)
+            # Для чтения - обычный ndarray поверх того же mmap: у np.memmap заметные накладные расходы на срезы
+            setattr(self, name, array if mode != 'r' else np.asarray(array))
+        self.sorted_ids = np.asarray(np.load(path / 'sorted_ids.npy', mmap_mode='r'))
+        self.sorted_positions = np.asarray(np.load(path / 'sorted_positions.npy', mmap_mode='r'))
+        self.count = meta['count']
+        self.cities = {int(key): tuple(bounds) for key, bounds in meta['cities'].items()}
+
+    def position(self, apartment_id):
+        """Позиция квартиры в индексе (последняя запись, если их несколько) или None."""
+        tail_end = self.count + int(self.tail[0])
+        hits = np.flatnonzero(self.ids[self.count:tail_end] == apartment_id)
+        if len(hits):
+            return self.count + int(hits[-1])
+        index = int(np.searchsorted(self.sorted_ids, apartment_id))
+        if index < len(self.sorted_ids) and self.sorted_ids[index] == apartment_id:
+            return int(self.sorted_positions[index])
+        return None
+
+    def _distances(self, rows, features, mask):
+        """Расстояния до строк rows (срез или массив позиций); неактивные - бесконечность."""
+        # |x - f|^2 = |x|^2 - 2 x.f + |f|^2: одно матрично-векторное умножение вместо разностей
+        distances = self.norms[rows] - 2.0 * (self.features[rows] @ features) + float(features @ features)
+        common = np.bitwise_count(self.amenities[rows] & mask).sum(axis=1)
+        union = self.amenity_counts[rows] + int(np.bitwise_count(mask).sum()) - common
+        jaccard = np.divide(common, union, out=np.ones(len(common)), where=union > 0)
+        distances += AMENITY_WEIGHT * (1.0 - jaccard)
+        distances[~self.active[rows]] = np.inf
+        return distances
+
+    def nearest(self, features, mask, city, k, exclude=None):
+        """
+        k ближайших квартир того же города: список (id, расстояние) по возрастанию
+        расстояния. exclude - позиция самой квартиры в индексе.
+        """
+        start, end = self.cities.get(city, (0, 0))
+        tail_end = self.count + int(self.tail[0])
+        tail_rows = self.count + np.flatnonzero(self.city[self.count:tail_end] == city)
+        # Основная часть - срез без копирования позиций, хвост - по списку позиций
+        distances = self._distances(slice(start, end), features, mask)
+        positions = np.arange(start, end)
+        if len(tail_rows):
+            distances = np.concatenate([distances, self._distances(tail_rows, features, mask)])
+            positions = np.concatenate([positions, tail_rows])
+        if exclude is not None:
+            distances[positions == exclude] = np.inf
+        if len(distances) > k:
+            best = np.argpartition(distances, k)[:k]
+        else:
+            best = np.arange(len(distances))
+        best = best[np.argsort(distances[best], kind='stable')]
+        return [
+            (int(self.ids[positions[i]]), max(0.0, float(distances[i])))
+            for i in best if np.isfinite(distances[i])
+        ]
+
+    def similar(self, apartment_id, k=10):
+        """
+        Похожие на квартиру apartment_id. Если её нет в индексе (добавлена после
+        сборки и ещё не дописана), признаки считаются по строке из БД.
+        None - квартира не найдена или не активна.
+        """
+        position = self.position(apartment_id)
+        if position is not None and self.active[position]:
+            return self.nearest(
+                self.features[position], self.amenities[position], int(self.city[position]), k, exclude=position
+            )
+        rows, amenities = _load_rows([apartment_id])
+        if not rows or not rows[0][6]:
+            return None
+        _, city, features, masks = _featurize(rows, amenities, self.meta)
+        return self.nearest(features[0], masks[0], int(city[0]), k)
+
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def get_index():
+    """Индекс текущей сборки (переоткрывается после пересборки) или None, если его нет."""
+    directory = index_dir()
+    try:
+        mtime = (directory / 'meta.json').stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    key = (str(directory), mtime)
+    index = _loaded.get(key)
+    if index is None:
+        with _loaded_lock:
+            meta = json.loads((directory / 'meta.json').read_text())
+            index = SimilarityIndex(directory, meta)
+            _loaded.clear()
+            _loaded[key] = index
+    return index
+
+
+def update_apartments(ids):
+    """Инкрементально обновляет индекс для квартир ids (изменены, созданы или удалены)."""
+    directory = index_dir()
+    if not (directory / 'meta.json').exists():
+        return
+    ids = set(ids)
+    with indexing.lock(directory):
+        meta = json.loads((directory / 'meta.json').read_text())
+        index = SimilarityIndex(directory, meta, mode='r+')
+        rows, amenities = _load_rows(ids)
+        rows = [row for row in rows if row[6]] # Снятые с публикации - как удалённые
+        new_ids, city, features, masks = _featurize(rows, amenities, meta)
+        norms, amenity_counts = _derived(features, masks)
+
+        for apartment_id in ids:
+            position = index.position(apartment_id)
+            if position is not None:
+                index.active[position] = False
+        appended = skipped = 0
+        for row, apartment_id in enumerate(new_ids):
+            position = index.position(apartment_id)
+            if position is not None and index.city[position] == city[row]:
+                target = position # Город не изменился - перезаписываем на месте
+            else:
+                target = index.count + int(index.tail[0]) + appended
+                if target >= meta['capacity']:
+                    # Полная пересборка - не здесь (on_commit запроса, под блокировкой), а в cron
+                    skipped += 1
+                    continue
+                appended += 1
+            index.ids[target] = apartment_id
+            index.city[target] = city[row]
+            index.features[target] = features[row]
+            index.amenities[target] = masks[row]
+            index.norms[target] = norms[row]
+            index.amenity_counts[target] = amenity_counts[row]
+            index.active[target] = True
+        for name in ARRAYS:
+            getattr(index, name).flush()
+        # Счётчик хвоста - последним: читатели видят только полностью записанные строки
+        index.tail[0] += appended
+        index.tail.flush()
+        if skipped:
+            indexing.mark_stale(directory, f"хвост индекса похожих квартир заполнен, не дописано квартир: {skipped}")
@@ -1,3 +1,1276 @@
-from django.test import TestCase
+# apartments/tests.py
+"""
+Бюджет SQL-запросов для каждого эндпоинта API.
 
-# Create your tests here.
+Данные генерирует тот же PerfDataSeeder, что и seed_perf_data (в уменьшенном
+масштабе). Для каждого маршрута из apartments/urls.py и auth_app/urls.py в
+QUERY_BUDGETS задан максимум запросов по HTTP-методам; test_every_route_has_budget
+не даёт добавить маршрут без бюджета. Списки дополнительно проверяются на двух
+размерах страницы (или двух объёмах данных): число запросов не должно расти с
+количеством объектов - так ловится N+1 после изменения сериализатора или queryset.
+"""
+import csv
+import datetime
+import gzip
+import io
+import json
+import math
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Count
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.request import Request
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from auth_app import urls as auth_urls
+from uibar_project_new import metrics, middleware, tiered_cache
+from uibar_project_new.renderers import ORJSONRenderer
+from . import analytics, changes, fastpath, geo, idempotency, indexing, partitioning, search, similarity
+from . import urls as apartments_urls
+from .models import Amenity, Apartment, ApartmentMonthlyStats, ApartmentPhoto, ApartmentTombstone, Booking, PriceRule, Review
+from .pagination import EstimatedCountPaginator
+from .seeding import PerfDataSeeder
+from .serializers import ApartmentListSerializer, ApartmentSerializer, ReviewSerializer
+
+# Имя маршрута -> {HTTP-метод: максимум SQL-запросов}.
+# Запросы аутентификации по JWT (загрузка пользователя) входят в бюджет.
+QUERY_BUDGETS = {
+    'apartments:api-root': {'get': 0},
+    # Список: оценка размера таблицы, COUNT, страница, удобства (фото - обложкой из строки квартиры).
+    # Создание: amenity_ids проверяется по кэшу справочника (на промахе - один запрос на все ID);
+    # из-за обработчика m2m_changed (индекс похожих) Django проверяет уже связанные удобства
+    'apartments:apartment-list': {'get': 4, 'post': 8},
+    # Удаление: каскад по связанным таблицам (в т.ч. правила цен) и след (tombstone) для ленты изменений;
+    # фото из-за обработчика post_delete (обложка) удаляются через выборку, а не одним DELETE
+    'apartments:apartment-detail': {'get': 4, 'patch': 7, 'delete': 14},
+    'apartments:apartment-clusters': {'get': 1},
+    # Квартиры после курсора, следы удалённых, удобства, фото; с курсором - отметка очистки следов
+    'apartments:apartment-changes': {'get': 5},
+    # Соседи берутся из индекса в памяти; запросы - только сериализация найденных квартир
+    'apartments:apartment-similar': {'get': 2},
+    # Цены квартир и правила цен - два запроса на любое число квартир
+    'apartments:apartment-quote': {'post': 2},
+    # На промахе кэша: цены квартир, пересечение с бронями, правила цен; при попадании - 0
+    'apartments:apartment-availability': {'post': 3},
+    'apartments:apartment-bulk-import': {'post': 6},
+    'apartments:apartment-generate-description': {'post': 4},
+    # Справочник из двухуровневого кэша: запрос только на промахе
+    'apartments:amenity-list': {'get': 1},
+    'apartments:amenity-detail': {'get': 1},
+    # С фильтром ?apartment= django-filter проверяет существование квартиры
+    'apartments:review-list': {'get': 2},
+    'apartments:review-detail': {'get': 1, 'patch': 5, 'delete': 3},
+    # Создание: правила цен квартиры читаются одним запросом. С Idempotency-Key дополнительно:
+    # точка сохранения и её освобождение (в тестах транзакция вложенная), блокировка ключа,
+    # поиск и запись сохранённого ответа
+    'apartments:booking-list': {'get': 4, 'post': 12},
+    'apartments:booking-detail': {'get': 4},
+    # С фильтром ?apartment= django-filter проверяет существование квартиры
+    'apartments:price-rule-list': {'get': 3, 'post': 3},
+    'apartments:price-rule-detail': {'get': 2, 'patch': 4, 'delete': 3},
+    'apartments:my-apartment-list': {'get': 3},
+    'apartments:owner-analytics': {'get': 2},
+    # Загрузка и удаление фото пересчитывают обложку и количество фото квартиры (один UPDATE)
+    'apartments:photo-upload': {'post': 9},
+    'apartments:photo-delete': {'delete': 4},
+    'apartments:owner-export': {'get': 2},
+    'auth_app:register': {'post': 5},
+    'auth_app:token_obtain_pair': {'post': 3},
+    # Ротация refresh-токена с занесением старого в чёрный список (simplejwt)
+    'auth_app:token_refresh': {'post': 13},
+    'auth_app:current_user': {'get': 1, 'patch': 2},
+}
+
+
+def route_names(patterns, namespace):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from route_names(pattern.url_patterns, namespace)
+        elif pattern.name:
+            yield f'{namespace}:{pattern.name}'
+
+
+def image_upload(name='photo.jpg'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), (120, 120, 120)).save(buffer, format='JPEG')
+    buffer.seek(0)
+    buffer.name = name
+    return buffer
+
+
+class QueryBudgetTestCase(APITestCase):
+    """Общие данные и проверки бюджета запросов."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls._media_root = tempfile.mkdtemp()
+        cls._media_override = override_settings(
+            MEDIA_ROOT=cls._media_root, SIMILARITY_INDEX_DIR=f'{cls._media_root}/similarity',
+            SEARCH_INDEX_DIR=f'{cls._media_root}/search',
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        )
+        cls._media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._media_override.disable()
+        shutil.rmtree(cls._media_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        PerfDataSeeder(40, prefix='budget', users_ratio=0.5, batch_size=20).run()
+        owners = Apartment.objects.filter(is_active=True).values('owner').annotate(total=Count('id')).order_by('total', 'owner')
+        cls.small_owner = owners.first()['owner']
+        cls.large_owner = owners.last()['owner']
+        cls.apartment = Apartment.objects.filter(owner_id=cls.large_owner, is_active=True).first()
+        cls.owner = cls.apartment.owner
+        cls.review = Review.objects.exclude(author=cls.owner).select_related('author').first()
+        cls.booking = Booking.objects.select_related('user').first()
+
+    def setUp(self):
+        # Данные каждого класса создаются заново - кэш прошлых тестов не должен читаться
+        cache.clear()
+        tiered_cache.clear_local()
+
+    def authenticate(self, user):
+        token = RefreshToken.for_user(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def assertQueryBudget(self, route, method, url, **kwargs):
+        """Выполняет запрос и проверяет, что он уложился в QUERY_BUDGETS[route][method]."""
+        budget = QUERY_BUDGETS[route][method]
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, **kwargs)
+            if response.streaming:
+                # Потоковый ответ выполняет запросы во время чтения
+                b''.join(response.streaming_content)
+        if len(context) > budget:
+            queries = '\n'.join(query['sql'] for query in context.captured_queries)
+            self.fail(f"{method.upper()} {url}: {len(context)} SQL-запросов при бюджете {budget}:\n{queries}")
+        self.assertLess(response.status_code, 500, getattr(response, 'data', None))
+        return response, len(context)
+
+    def assertConstantQueries(self, route, small_url, large_url, small_user=None, large_user=None):
+        """Число запросов не зависит от количества объектов в ответе."""
+        if small_user:
+            self.authenticate(small_user)
+        small, small_count = self.assertQueryBudget(route, 'get', small_url)
+        if large_user:
+            self.authenticate(large_user)
+        large, large_count = self.assertQueryBudget(route, 'get', large_url)
+        self.assertEqual(small.status_code, 200)
+        self.assertEqual(large.status_code, 200)
+        self.assertEqual(
+            small_count, large_count,
+            f"{route}: {small_count} запросов на малой выборке и {large_count} на большой - похоже на N+1",
+        )
+
+
+class RouteCoverageTests(QueryBudgetTestCase):
+    def test_every_route_has_budget(self):
+        routes = set(route_names(apartments_urls.urlpatterns, 'apartments'))
+        routes |= set(route_names(auth_urls.urlpatterns, 'auth_app'))
+        self.assertSetEqual(routes, set(QUERY_BUDGETS))
+
+
+class ApartmentQueryBudgetTests(QueryBudgetTestCase):
+    def test_api_root(self):
+        self.assertQueryBudget('apartments:api-root', 'get', reverse('apartments:api-root'))
+
+    def test_list_pages(self):
+        url = reverse('apartments:apartment-list')
+        self.assertConstantQueries('apartments:apartment-list', f'{url}?page_size=2', f'{url}?page_size=20')
+
+    def test_list_count_estimate(self):
+        url = reverse('apartments:apartment-list')
+        active = Apartment.objects.filter(is_active=True).count()
+        # Ниже порога - точный COUNT(*)
+        response = self.client.get(url, {'page_size': 100})
+        self.assertEqual((response.data['count'], response.data['count_is_estimated']), (active, False))
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE apartments_apartment')
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = 'apartments_apartment'::regclass")
+            reltuples = cursor.fetchone()[0]
+        with mock.patch.object(EstimatedCountPaginator, 'exact_count_threshold', 1):
+            response = self.client.get(url, {'page_size': 100})
+            self.assertTrue(response.data['count_is_estimated'])
+            self.assertGreater(response.data['count'], 0)
+            # Последняя страница определяется по факту, а не по оценке
+            pages = math.ceil(active / 100)
+            last = self.client.get(url, {'page_size': 100, 'page': pages})
+            self.assertIsNone(last.data['next'])
+            self.assertEqual(len(last.data['results']), active - 100 * (pages - 1))
+            self.assertEqual(self.client.get(url, {'page_size': 100, 'page': pages + 1}).status_code, 404)
+            # Без фильтров - оценка по статистике таблицы
+            paginator = EstimatedCountPaginator(Apartment.objects.order_by('id'), 10)
+            self.assertEqual((paginator.count, paginator.count_is_estimated), (reltuples, True))
+
+    def test_fast_list_matches_serializer(self):
+        # Строка с пустыми полями, фото и удобствами - в первой странице выдачи по городу
+        apartment = self.apartment
+        Apartment.objects.filter(pk=apartment.pk).update(latitude=None, longitude=None, description='')
+        ApartmentPhoto.objects.create(apartment=apartment, image='apartments/ca/fast.jpg')
+        apartment.amenities.set(Amenity.objects.all()[:3])
+        apartment.refresh_from_db()
+        self.assertEqual((apartment.photo_count > 0, apartment.amenities.count()), (True, 3))
+
+        for serializer_class in (ApartmentListSerializer, ReviewSerializer, ApartmentSerializer):
+            self.assertIsNotNone(fastpath.build_plan(serializer_class(context={'request': None})), serializer_class)
+
+        urls = [
+            (reverse('apartments:apartment-list'), {'city': apartment.city, 'ordering': '-id', 'page_size': 100}),
+            (reverse('apartments:review-list'), {'page_size': 100}),
+        ]
+        pages = []
+        for url, params in urls:
+            fast = self.client.get(url, params)
+            with override_settings(FAST_LIST_ENABLED=False):
+                slow = self.client.get(url, params)
+            self.assertEqual(fast.status_code, 200)
+            self.assertEqual(fast.content, slow.content, url)
+            pages.append(fast.json()['results'])
+        self.assertIn(apartment.pk, [item['id'] for item in pages[0]])
+        self.assertTrue(pages[1])
+
+        # Галерея (вложенный список по обратному ForeignKey) - план напрямую против сериализатора
+        request = Request(RequestFactory().get('/'))
+        queryset = Apartment.objects.filter(owner=self.owner).order_by('id')
+        serializer = ApartmentSerializer(context={'request': request})
+        plan = fastpath.build_plan(serializer)
+        renderer = ORJSONRenderer()
+        self.assertEqual(
+            renderer.render(plan.represent(list(plan.values_queryset(queryset)))),
+            renderer.render(ApartmentSerializer(queryset, many=True, context={'request': request}).data),
+        )
+
+    def test_list_filters(self):
+        url = reverse('apartments:apartment-list')
+        self.assertQueryBudget(
+            'apartments:apartment-list', 'get', url,
+            data={'city': self.apartment.city, 'ordering': 'price', 'bbox': '40,46,56,88'},
+        )
+
+    def test_list_search(self):
+        url = reverse('apartments:apartment-list')
+        self.assertConstantQueries('apartments:apartment-list', f'{url}?q=метро&page_size=2', f'{url}?q=метро&page_size=20')
+
+        # Текст изменился - индекс обновляется после коммита; формы слова не важны, лучшее совпадение - первым
+        self.authenticate(self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                reverse('apartments:apartment-detail', args=[self.apartment.pk]),
+                {'title': 'Студия с камином у метро', 'description': 'Настоящий камин в гостиной.'}, format='json',
+            )
+        self.client.credentials()
+        response, _ = self.assertQueryBudget(
+            'apartments:apartment-list', 'get', url, data={'q': 'студию с каминами', 'city': self.apartment.city},
+        )
+        self.assertEqual(response.data['results'][0]['id'], self.apartment.pk)
+        self.assertEqual({item['city'] for item in response.data['results']}, {self.apartment.city})
+        response, _ = self.assertQueryBudget('apartments:apartment-list', 'get', url, data={'q': 'замок'})
+        self.assertEqual(response.data['results'], [])
+
+    def test_search_delta_full(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(SEARCH_INDEX_DIR=directory, SEARCH_DELTA_CAPACITY=0):
+            search.build_index()
+            version = search.get_index().meta['version']
+            # Дельта переполнена: изменение всё равно попадает в поиск, пересборка - в cron
+            Apartment.objects.filter(pk=self.apartment.pk).update(title='Студия с камином')
+            with self.assertLogs('apartments.indexing', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+                indexing.schedule_update([self.apartment.pk])
+            self.assertEqual(search.get_index().meta['version'], version)
+            self.assertTrue(indexing.is_stale(search.index_dir()))
+            self.assertEqual(search.get_index().search('камин', 10)[0][0], self.apartment.pk)
+
+            call_command('build_search_index', if_stale=True, stdout=io.StringIO())
+            self.assertFalse(indexing.is_stale(search.index_dir()))
+            self.assertNotEqual(search.get_index().meta['version'], version)
+
+    def test_create(self):
+        self.authenticate(self.owner)
+        amenity_ids = list(Amenity.objects.values_list('id', flat=True)[:3])
+        response, _ = self.assertQueryBudget(
+            'apartments:apartment-list', 'post', reverse('apartments:apartment-list'),
+            data={
+                'title': 'Новая квартира', 'price': '15000.00', 'address': 'ул. Абая, 1',
+                'city': 'Алматы', 'amenity_ids': amenity_ids, 'latitude': 43.2, 'longitude': 76.9,
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_detail(self):
+        url = reverse('apartments:apartment-detail', args=[self.apartment.pk])
+        response, _ = self.assertQueryBudget('apartments:apartment-detail', 'get', url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_update(self):
+        self.authenticate(self.owner)
+        url = reverse('apartments:apartment-detail', args=[self.apartment.pk])
+        response, _ = self.assertQueryBudget(
+            'apartments:apartment-detail', 'patch', url, data={'price': '20000.00'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_delete(self):
+        self.authenticate(self.owner)
+        url = reverse('apartments:apartment-detail', args=[self.apartment.pk])
+        response, _ = self.assertQueryBudget('apartments:apartment-detail', 'delete', url)
+        self.assertEqual(response.status_code, 204)
+
+    def test_clusters(self):
+        url = reverse('apartments:apartment-clusters')
+        response, _ = self.assertQueryBudget('apartments:apartment-clusters', 'get', url, data={'bbox': '40,46,56,88'})
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(CHANGES_FEED_LAG_SECONDS=0)
+    def test_changes(self):
+        url = reverse('apartments:apartment-changes')
+        self.assertConstantQueries('apartments:apartment-changes', f'{url}?limit=2', f'{url}?limit=40')
+
+        deactivated = Apartment.objects.filter(is_active=True).exclude(pk=self.apartment.pk).first()
+        deactivated.is_active = False
+        deactivated.save()
+        self.authenticate(self.owner)
+        self.client.delete(reverse('apartments:apartment-detail', args=[self.apartment.pk]))
+        self.client.credentials()
+
+        # Проходим ленту страницами по курсору: каждая квартира ровно один раз
+        seen, tombstones, since = [], {}, ''
+        while True:
+            response, _ = self.assertQueryBudget('apartments:apartment-changes', 'get', url, data={'since': since, 'limit': 7})
+            seen += [item['id'] for item in response.data['changes']]
+            tombstones.update((item['id'], item['reason']) for item in response.data['tombstones'])
+            since = response.data['next_cursor']
+            if not response.data['has_more']:
+                break
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertSetEqual(set(seen), set(Apartment.objects.filter(is_active=True).values_list('id', flat=True)))
+        self.assertEqual(tombstones[deactivated.pk], 'deactivated')
+        self.assertEqual(tombstones[self.apartment.pk], 'deleted')
+
+        # С последнего курсора новых изменений нет - курсор сдвигается к границе ленты
+        response, _ = self.assertQueryBudget('apartments:apartment-changes', 'get', url, data={'since': since})
+        self.assertEqual((response.data['changes'], response.data['tombstones']), ([], []))
+        self.assertGreaterEqual(changes.decode_cursor(response.data['next_cursor']), changes.decode_cursor(since))
+
+    @override_settings(CHANGES_FEED_LAG_SECONDS=0)
+    def test_changes_quiet_catalogue(self):
+        # Каталог не менялся дольше срока хранения следов; клиент синхронизировался тогда же
+        long_ago = timezone.now() - datetime.timedelta(days=200)
+        Apartment.objects.update(updated_at=long_ago)
+        ApartmentTombstone.objects.create(apartment_id=10 ** 9, deleted_at=long_ago)
+        url = reverse('apartments:apartment-changes')
+        stale = changes.encode_cursor(long_ago, 10 ** 9)
+
+        # Следы не вычищались - курсор действителен, пустая страница сдвигает его к границе ленты
+        response = self.client.get(url, data={'since': stale})
+        self.assertEqual((response.status_code, response.data['changes']), (200, []))
+        polled = response.data['next_cursor']
+        self.assertGreater(changes.decode_cursor(polled)[0], long_ago)
+
+        call_command('purge_apartment_tombstones', stdout=io.StringIO())
+        self.assertFalse(ApartmentTombstone.objects.exists())
+        self.assertEqual(self.client.get(url, data={'since': stale}).status_code, 410)
+        # Опрашивающий клиент и полная синхронизация продолжают без 410
+        self.assertEqual(self.client.get(url, data={'since': polled}).status_code, 200)
+        resynced = self.client.get(url, data={'limit': 1000}).data['next_cursor']
+        self.assertEqual(self.client.get(url, data={'since': resynced}).status_code, 200)
+
+    def test_amenity_change_touches_apartments(self):
+        amenity = Amenity.objects.annotate(apartments=Count('apartment')).filter(apartments__gt=0).first()
+        linked = set(Apartment.objects.filter(amenities=amenity).values_list('pk', flat=True))
+        before = dict(Apartment.objects.values_list('pk', 'updated_at'))
+
+        def touched():
+            return {pk for pk, updated_at in Apartment.objects.values_list('pk', 'updated_at') if updated_at != before[pk]}
+
+        amenity.name = f'{amenity.name} (новое)'
+        amenity.save()
+        self.assertEqual(touched(), linked)
+        before = dict(Apartment.objects.values_list('pk', 'updated_at'))
+        amenity.delete()
+        self.assertEqual(touched(), linked)
+
+    def test_similar(self):
+        url = reverse('apartments:apartment-similar', args=[self.apartment.pk])
+        response, _ = self.assertQueryBudget('apartments:apartment-similar', 'get', url, data={'k': 5})
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertTrue(results)
+        self.assertNotIn(self.apartment.pk, [item['id'] for item in results])
+        self.assertEqual({item['city'] for item in results}, {self.apartment.city})
+        distances = [item['distance'] for item in results]
+        self.assertEqual(distances, sorted(distances))
+
+        # Индекс обновляется после коммита: квартира переехала - соседи из нового города
+        other = Apartment.objects.exclude(city=self.apartment.city).filter(is_active=True).first()
+        self.authenticate(self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                reverse('apartments:apartment-detail', args=[self.apartment.pk]), {'city': other.city}, format='json'
+            )
+        self.client.credentials()
+        response, _ = self.assertQueryBudget('apartments:apartment-similar', 'get', url)
+        self.assertEqual({item['city'] for item in response.data['results']}, {other.city})
+
+    def test_similar_tail_full(self):
+        other = Apartment.objects.exclude(city=self.apartment.city).filter(is_active=True).first()
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(SIMILARITY_INDEX_DIR=directory, SIMILARITY_TAIL_CAPACITY=0):
+            similarity.build_index()
+            version = similarity.get_index().meta['version']
+            # Квартира переехала, дописать её некуда: индекс не пересобирается в запросе, а помечается
+            with self.assertLogs('apartments.indexing', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+                Apartment.objects.filter(pk=self.apartment.pk).update(city=other.city)
+                indexing.schedule_update([self.apartment.pk])
+            self.assertEqual(similarity.get_index().meta['version'], version)
+            self.assertTrue(indexing.is_stale(similarity.index_dir()))
+            # Свои похожие - по строке из БД
+            results = similarity.get_index().similar(self.apartment.pk, 5)
+            self.assertEqual({Apartment.objects.get(pk=pk).city for pk, _ in results}, {other.city})
+
+            call_command('build_similarity_index', if_stale=True, stdout=io.StringIO())
+            self.assertFalse(indexing.is_stale(similarity.index_dir()))
+            self.assertNotEqual(similarity.get_index().meta['version'], version)
+            out = io.StringIO()
+            call_command('build_similarity_index', if_stale=True, stdout=out)
+            self.assertIn('пересборка не нужна', out.getvalue())
+
+    def test_bulk_import(self):
+        self.authenticate(self.owner)
+        amenity = Amenity.objects.first()
+        rows = ['title,price,address,city,amenity_ids']
+        rows += [f'Импорт {n},10000,ул. Абая {n},Алматы,{amenity.pk}' for n in range(25)]
+        upload = io.BytesIO('\n'.join(rows).encode())
+        upload.name = 'apartments.csv'
+        response, _ = self.assertQueryBudget(
+            'apartments:apartment-bulk-import', 'post', reverse('apartments:apartment-bulk-import'),
+            data={'file': upload}, format='multipart',
+        )
+        self.assertEqual(response.data['created'], 25, response.data)
+
+    def test_bulk_import_stops_on_unreadable_file(self):
+        self.authenticate(self.owner)
+        url = reverse('apartments:apartment-bulk-import')
+        header = 'title,price,address,city'
+        cases = {
+            # Не UTF-8 в четвёртой строке файла
+            4: b'\n'.join([
+                header.encode(), 'Импорт 1,10000,ул. Абая 1,Алматы'.encode(),
+                'Импорт 2,10000,ул. Абая 2,Алматы'.encode(), 'Импорт 3,10000,ул. Абая 3,Алматы'.encode('cp1251'),
+            ]),
+            # Поле длиннее csv.field_size_limit() в третьей строке
+            3: '\n'.join([
+                header, 'Импорт 4,10000,ул. Абая 4,Алматы', 'Импорт 5,10000,' + 'x' * (csv.field_size_limit() + 1) + ',Алматы',
+            ]).encode(),
+        }
+        for row, content in cases.items():
+            upload = io.BytesIO(content)
+            upload.name = 'apartments.csv'
+            response = self.client.post(url, data={'file': upload}, format='multipart')
+            self.assertEqual(response.status_code, 400, response.data)
+            self.assertEqual(response.data['stopped_at_row'], row)
+        # Строки до ошибки импортированы
+        self.assertEqual(Apartment.objects.filter(owner=self.owner, title__startswith='Импорт ').count(), 3)
+
+        with tempfile.NamedTemporaryFile(suffix='.csv') as path:
+            path.write(cases[4])
+            path.flush()
+            with self.assertRaisesMessage(CommandError, 'строке 4'):
+                call_command('import_apartments', path.name, owner=self.owner.username,
+                             stdout=io.StringIO(), stderr=io.StringIO())
+            # username другого пользователя совпадает с email владельца
+            self.owner.__class__.objects.create_user(username=self.owner.email, email='other@example.com', password='x')
+            with self.assertRaisesMessage(CommandError, 'use the username'):
+                call_command('import_apartments', path.name, owner=self.owner.email, stdout=io.StringIO())
+
+    def test_generate_description(self):
+        self.authenticate(self.owner)
+        url = reverse('apartments:apartment-generate-description', args=[self.apartment.pk])
+        # Вместо Gemini - заглушка: промпт (с удобствами квартиры) собирается как обычно
+        with mock.patch('apartments.gemini_utils.model') as model:
+            model.generate_content.return_value.text = 'Описание'
+            response, _ = self.assertQueryBudget('apartments:apartment-generate-description', 'post', url)
+        self.assertEqual(response.data, {'description': 'Описание'})
+
+    def test_my_apartments(self):
+        url = reverse('apartments:my-apartment-list')
+        self.assertConstantQueries(
+            'apartments:my-apartment-list', url, url,
+            small_user=self.owner.__class__.objects.get(pk=self.small_owner), large_user=self.owner,
+        )
+
+    def test_owner_analytics(self):
+        self.authenticate(self.owner)
+        url = reverse('apartments:owner-analytics')
+        response, _ = self.assertQueryBudget('apartments:owner-analytics', 'get', url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_owner_exports(self):
+        self.authenticate(self.owner)
+        for resource in ('bookings', 'apartments'):
+            for fmt in ('csv', 'jsonl'):
+                url = reverse('apartments:owner-export', kwargs={'resource': resource, 'fmt': fmt})
+                response, _ = self.assertQueryBudget('apartments:owner-export', 'get', url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_owner_exports_compressed(self):
+        self.authenticate(self.owner)
+        url = reverse('apartments:owner-export', kwargs={'resource': 'bookings', 'fmt': 'jsonl'})
+        plain = b''.join(self.client.get(url).streaming_content)
+        decompress = {'gzip': gzip.decompress}
+        if middleware.brotli is not None:
+            decompress['br'] = middleware.brotli.decompress
+        for encoding, function in decompress.items():
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING=encoding)
+            self.assertEqual(response['Content-Encoding'], encoding)
+            self.assertFalse(response.has_header('Content-Length'))
+            self.assertEqual(function(b''.join(response.streaming_content)), plain)
+
+    def test_owner_exports_content(self):
+        self.authenticate(self.owner)
+        own = Booking.objects.filter(apartment__owner=self.owner).order_by('id')
+        self.assertTrue(own.exists())
+        self.assertTrue(Booking.objects.exclude(apartment__owner=self.owner).exists())
+
+        url = reverse('apartments:owner-export', kwargs={'resource': 'bookings', 'fmt': 'csv'})
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], [
+            'id', 'apartment_id', 'apartment_title', 'guest', 'check_in_date', 'check_out_date',
+            'total_price', 'status', 'created_at',
+        ])
+        first = own.select_related('apartment', 'user').first()
+        self.assertEqual(rows[1][:8], [
+            str(first.pk), str(first.apartment_id), first.apartment.title, first.user.username,
+            str(first.check_in_date), str(first.check_out_date), str(first.total_price), first.status,
+        ])
+        # Только брони квартир владельца - чужие не попадают
+        self.assertEqual([int(row[0]) for row in rows[1:]], list(own.values_list('id', flat=True)))
+
+        url = reverse('apartments:owner-export', kwargs={'resource': 'apartments', 'fmt': 'jsonl'})
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        apartments = Apartment.objects.filter(owner=self.owner).order_by('id')
+        self.assertEqual([line['id'] for line in lines], list(apartments.values_list('id', flat=True)))
+        self.assertEqual(lines[0]['title'], apartments[0].title)
+        self.assertEqual(lines[0]['price'], str(apartments[0].price))
+        self.assertEqual(set(lines[0]), {
+            'id', 'title', 'city', 'address', 'price', 'apartment_type', 'max_guests', 'beds',
+            'is_active', 'latitude', 'longitude', 'created_at', 'updated_at',
+        })
+
+
+class PricingQueryBudgetTests(QueryBudgetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Выходные (сб, вс) дороже, в июле - своя цена и минимум 3 ночи
+        cls.weekend_rule = PriceRule.objects.create(apartment=cls.apartment, weekdays=0b1100000, price='150.50')
+        PriceRule.objects.create(
+            apartment=cls.apartment, start_date='2099-07-01', end_date='2099-07-31', price='200', min_nights=3, priority=1,
+        )
+
+    def test_quote(self):
+        others = list(Apartment.objects.filter(is_active=True).exclude(pk=self.apartment.pk).values_list('pk', flat=True)[:20])
+        response, _ = self.assertQueryBudget(
+            'apartments:apartment-quote', 'post', reverse('apartments:apartment-quote'),
+            data={'apartments': [self.apartment.pk, *others], 'check_in': '2099-06-28', 'check_out': '2099-07-03'},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual([item['apartment'] for item in response.data['results']], [self.apartment.pk, *others])
+        quote = response.data['results'][0]
+        # 28.06.2099 - воскресенье; 1-2 июля - по июльскому правилу (приоритет выше)
+        prices = [night['price'] for night in quote['nightly_prices']]
+        base = str(self.apartment.price)
+        self.assertEqual(prices, ['150.50', base, base, '200.00', '200.00'])
+        self.assertEqual(quote['total_price'], str(self.apartment.price * 2 + Decimal('550.50')))
+        self.assertTrue(quote['meets_min_stay'])
+
+    def test_availability(self):
+        cache.clear()
+        booking = Booking.objects.create(
+            apartment=self.apartment, user=self.review.author, total_price=1,
+            check_in_date=datetime.date(2099, 5, 10), check_out_date=datetime.date(2099, 5, 12),
+        )
+        others = list(Apartment.objects.filter(is_active=True).exclude(pk=booking.apartment_id).values_list('pk', flat=True)[:20])
+        url = reverse('apartments:apartment-availability')
+        data = {
+            'apartments': [booking.apartment_id, *others],
+            'check_in': str(booking.check_in_date), 'check_out': str(booking.check_in_date + datetime.timedelta(days=1)),
+        }
+        response, _ = self.assertQueryBudget('apartments:apartment-availability', 'post', url, data=data, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        results = {item['apartment']: item for item in response.data['results']}
+        self.assertFalse(results[booking.apartment_id]['available'])
+        self.assertEqual(len(results[booking.apartment_id]['nightly_prices']), 1)
+        # Повтор на те же даты - из кэша, без запросов к БД
+        response, queries = self.assertQueryBudget('apartments:apartment-availability', 'post', url, data=data, format='json')
+        self.assertEqual(queries, 0)
+        self.assertEqual(response.data['results'][0], results[booking.apartment_id])
+
+        # Отмена брони меняет версию квартиры - её запись в кэше больше не читается
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.status = Booking.BookingStatus.CANCELLED
+            booking.save()
+        response, queries = self.assertQueryBudget('apartments:apartment-availability', 'post', url, data=data, format='json')
+        self.assertTrue(response.data['results'][0]['available'])
+        self.assertEqual(queries, 3)
+
+    def test_booking_uses_rules(self):
+        self.authenticate(self.owner)
+        url = reverse('apartments:booking-list')
+        response = self.client.post(
+            url, {'apartment': self.apartment.pk, 'check_in_date': '2099-07-01', 'check_out_date': '2099-07-02'},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            url, {'apartment': self.apartment.pk, 'check_in_date': '2099-07-01', 'check_out_date': '2099-07-04'},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['total_price'], '600.00')
+
+    def test_rules_crud(self):
+        self.authenticate(self.owner)
+        url = reverse('apartments:price-rule-list')
+        response, _ = self.assertQueryBudget('apartments:price-rule-list', 'get', url, data={'apartment': self.apartment.pk})
+        self.assertEqual(len(response.data), 2)
+        response, _ = self.assertQueryBudget(
+            'apartments:price-rule-list', 'post', url,
+            data={'apartment': self.apartment.pk, 'weekdays': [4], 'price': '99.00'}, format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['weekdays'], [4])
+
+        detail = reverse('apartments:price-rule-detail', args=[self.weekend_rule.pk])
+        response, _ = self.assertQueryBudget('apartments:price-rule-detail', 'get', detail)
+        self.assertEqual(response.data['weekdays'], [5, 6])
+        response, _ = self.assertQueryBudget(
+            'apartments:price-rule-detail', 'patch', detail, data={'price': None}, format='json',
+        )
+        self.assertEqual(response.status_code, 400) # Ни цены, ни минимального срока
+        response, _ = self.assertQueryBudget('apartments:price-rule-detail', 'delete', detail)
+        self.assertEqual(response.status_code, 204)
+
+        # Чужая квартира
+        other = Apartment.objects.exclude(owner=self.owner).first()
+        response = self.client.post(url, {'apartment': other.pk, 'price': '1.00'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class AmenityQueryBudgetTests(QueryBudgetTestCase):
+    def test_list(self):
+        self.assertQueryBudget('apartments:amenity-list', 'get', reverse('apartments:amenity-list'))
+
+    def test_detail(self):
+        url = reverse('apartments:amenity-detail', args=[Amenity.objects.first().pk])
+        self.assertQueryBudget('apartments:amenity-detail', 'get', url)
+
+    def test_cache(self):
+        url = reverse('apartments:amenity-list')
+        self.assertQueryBudget('apartments:amenity-list', 'get', url)
+        with self.assertNumQueries(0):
+            names = [item['name'] for item in self.client.get(url).data]
+        # Другой воркер: свой LRU, общий кэш и версии
+        other = tiered_cache.TieredCache('amenities')
+        with self.assertNumQueries(0):
+            self.assertEqual([amenity.name for amenity in other.get_or_set('all', list, namespace='amenities')], names)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Amenity.objects.create(name='Сауна')
+        response = self.client.get(url)
+        self.assertIn('Сауна', [item['name'] for item in response.data])
+        # Версию другой воркер перечитывает не позже чем через CACHE_VERSION_CHECK_SECONDS
+        other.clear_local()
+        self.assertIn('Сауна', [amenity.name for amenity in other.get_or_set('all', list, namespace='amenities')])
+        self.assertEqual(other.stats()['misses'], 0)
+
+        lru = tiered_cache.LocalLRU('test', max_entries=2)
+        for key in 'abc':
+            lru.set(key, key, ttl=60)
+        self.assertEqual((lru.get('a'), lru.get('c'), lru.evictions['size']), (tiered_cache._MISSING, 'c', 1))
+
+    def test_shared_cache_check(self):
+        # check --deploy: кэш процесса и файловый кэш не подходят для нескольких воркеров
+        self.assertEqual([warning.id for warning in tiered_cache.check_shared_cache(None)], ['uibar.W001'])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': self._media_root}}):
+            self.assertEqual([warning.id for warning in tiered_cache.check_shared_cache(None)], ['uibar.W002'])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379/0'}}):
+            self.assertEqual(tiered_cache.check_shared_cache(None), [])
+
+
+class ReviewQueryBudgetTests(QueryBudgetTestCase):
+    def test_list_pages(self):
+        url = reverse('apartments:review-list')
+        self.assertConstantQueries('apartments:review-list', f'{url}?page_size=2', f'{url}?page_size=50')
+
+    def test_list_for_apartment(self):
+        url = reverse('apartments:review-list')
+        self.assertQueryBudget('apartments:review-list', 'get', url, data={'apartment': self.apartment.pk})
+
+    def test_detail(self):
+        url = reverse('apartments:review-detail', args=[self.review.pk])
+        self.assertQueryBudget('apartments:review-detail', 'get', url)
+
+    def test_update(self):
+        self.authenticate(self.review.author)
+        url = reverse('apartments:review-detail', args=[self.review.pk])
+        response, _ = self.assertQueryBudget(
+            'apartments:review-detail', 'patch', url, data={'text': 'Обновлённый отзыв'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_delete(self):
+        self.authenticate(self.review.author)
+        url = reverse('apartments:review-detail', args=[self.review.pk])
+        response, _ = self.assertQueryBudget('apartments:review-detail', 'delete', url)
+        self.assertEqual(response.status_code, 204)
+
+
+class BookingQueryBudgetTests(QueryBudgetTestCase):
+    def test_list(self):
+        users = Booking.objects.values('user').annotate(total=Count('id')).order_by('total', 'user')
+        User = self.owner.__class__
+        self.assertConstantQueries(
+            'apartments:booking-list', reverse('apartments:booking-list'), reverse('apartments:booking-list'),
+            small_user=User.objects.get(pk=users.first()['user']),
+            large_user=User.objects.get(pk=users.last()['user']),
+        )
+
+    def test_create(self):
+        self.authenticate(self.owner)
+        response, _ = self.assertQueryBudget(
+            'apartments:booking-list', 'post', reverse('apartments:booking-list'),
+            data={'apartment': self.apartment.pk, 'check_in_date': '2099-01-10', 'check_out_date': '2099-01-15'},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_create_idempotent(self):
+        self.authenticate(self.owner)
+        url = reverse('apartments:booking-list')
+        data = {'apartment': self.apartment.pk, 'check_in_date': '2099-02-10', 'check_out_date': '2099-02-12'}
+        first, _ = self.assertQueryBudget(
+            'apartments:booking-list', 'post', url, data=data, format='json', HTTP_IDEMPOTENCY_KEY='booking-1',
+        )
+        self.assertEqual(first.status_code, 201, first.data)
+        # Повтор не выполняет валидацию и вставку - только поиск сохранённого ответа
+        replayed, _ = self.assertQueryBudget(
+            'apartments:booking-list', 'post', url, data=data, format='json', HTTP_IDEMPOTENCY_KEY='booking-1',
+        )
+        self.assertEqual(replayed.status_code, 201)
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+        self.assertEqual(replayed.content, first.content)
+        self.assertEqual(Booking.objects.filter(user=self.owner, check_in_date='2099-02-10').count(), 1)
+
+        response = self.client.post(
+            url, {**data, 'check_out_date': '2099-02-14'}, format='json', HTTP_IDEMPOTENCY_KEY='booking-1',
+        )
+        self.assertEqual(response.status_code, 422)
+
+        # Ограничение ожидания действует только на саму блокировку ключа, не на handler()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SHOW lock_timeout')
+            before = cursor.fetchone()[0]
+            idempotency._lock(self.owner.pk, 'apartments:booking-list', 'booking-2')
+            cursor.execute('SHOW lock_timeout')
+            self.assertEqual(cursor.fetchone()[0], before)
+
+    def test_monthly_stats(self):
+        other = Apartment.objects.exclude(pk=self.apartment.pk).first()
+        may, june = datetime.date(2099, 5, 1), datetime.date(2099, 6, 1)
+
+        def stats(apartment):
+            rows = ApartmentMonthlyStats.objects.filter(apartment=apartment, month__in=[may, june])
+            return {row.month: (row.nights_booked, row.bookings_count, row.revenue) for row in rows}
+
+        self.assertEqual(stats(self.apartment), {})
+        # Две ночи в мае и одна в июне: выручка делится по ночам, бронь считается в месяце заезда
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = Booking.objects.create(
+                apartment=self.apartment, user=self.owner, total_price='100', status=Booking.BookingStatus.CONFIRMED,
+                check_in_date=datetime.date(2099, 5, 30), check_out_date=datetime.date(2099, 6, 2),
+            )
+        self.assertEqual(stats(self.apartment), {may: (2, 1, Decimal('66.67')), june: (1, 0, Decimal('33.33'))})
+
+        # Перенос на другую квартиру и даты: прежние месяцы прежней квартиры пересчитываются
+        booking.apartment = other
+        booking.check_in_date, booking.check_out_date = datetime.date(2099, 6, 10), datetime.date(2099, 6, 12)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.save()
+        self.assertEqual(stats(self.apartment), {})
+        self.assertEqual(stats(other), {june: (2, 1, Decimal('100'))})
+
+        # Отменённая бронь в статистику не входит
+        booking.status = Booking.BookingStatus.CANCELLED
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.save()
+        self.assertEqual(stats(other), {})
+
+    def test_complete_bookings(self):
+        today = timezone.now().date()
+        Status = Booking.BookingStatus
+
+        def book(status, check_in, check_out):
+            return Booking.objects.create(
+                apartment=self.apartment, user=self.owner, total_price='100', status=status,
+                check_in_date=today + datetime.timedelta(days=check_in),
+                check_out_date=today + datetime.timedelta(days=check_out),
+            )
+
+        bookings = {
+            book(Status.CONFIRMED, -30, -28): Status.COMPLETED,
+            book(Status.CONFIRMED, -27, -1): Status.COMPLETED,
+            # Выезд сегодня - ещё не завершена
+            book(Status.CONFIRMED, -1, 0): Status.CONFIRMED,
+            book(Status.PENDING, -20, -18): Status.PENDING,
+            book(Status.CANCELLED, -20, -18): Status.CANCELLED,
+        }
+        call_command('complete_bookings', batch_size=1, stdout=io.StringIO())
+        for booking, expected in bookings.items():
+            booking.refresh_from_db()
+            self.assertEqual(booking.status, expected, (booking.check_in_date, booking.check_out_date))
+
+        # Повторный запуск ничего не меняет
+        out = io.StringIO()
+        call_command('complete_bookings', stdout=out)
+        self.assertIn('Завершено бронирований: 0', out.getvalue())
+
+    def test_detail(self):
+        self.authenticate(self.booking.user)
+        url = reverse('apartments:booking-detail', args=[self.booking.pk])
+        response, _ = self.assertQueryBudget('apartments:booking-detail', 'get', url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_partitions(self):
+        self.assertTrue(partitioning.is_partitioned())
+        month = datetime.date(2099, 3, 1)
+        booking = Booking.objects.create(
+            apartment=self.apartment, user=self.owner, total_price='300',
+            check_in_date=datetime.date(2099, 3, 5), check_out_date=datetime.date(2099, 3, 8),
+        )
+
+        def partition_of(pk):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT tableoid::regclass::text FROM apartments_booking WHERE id = %s', [pk])
+                return cursor.fetchone()[0]
+
+        # Месяца ещё нет - бронь в секции по умолчанию; новая секция забирает её оттуда
+        self.assertEqual(partition_of(booking.pk), partitioning.DEFAULT_PARTITION)
+        self.assertEqual(partitioning.ensure_partitions(month, month), [partitioning.partition_name(month)])
+        self.assertEqual(partition_of(booking.pk), partitioning.partition_name(month))
+
+        # Проверка пересечения не читает секции месяцев задолго до периода
+        overlapping = partitioning.overlapping_bookings(
+            Booking.objects.filter(apartment=self.apartment), datetime.date(2099, 3, 6), datetime.date(2099, 3, 7),
+        )
+        self.assertEqual(list(overlapping.values_list('id', flat=True)), [booking.pk])
+        plan = overlapping.explain()
+        self.assertIn(partitioning.partition_name(month), plan)
+        self.assertNotIn(partitioning.partition_name(datetime.date.today()), plan)
+
+        with tempfile.TemporaryDirectory() as directory:
+            # Подтверждённая бронь ещё занимает даты - секция остаётся
+            with self.assertRaises(partitioning.OpenBookingsError):
+                partitioning.archive_partition(month, directory)
+            self.assertIn(month, partitioning.partitions())
+            Booking.objects.filter(pk=booking.pk).update(status=Booking.BookingStatus.COMPLETED)
+            with connection.cursor() as cursor:
+                # Отложенные проверки FK после UPDATE в той же транзакции теста мешают DROP TABLE
+                cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            path = partitioning.archive_partition(month, directory)
+            with gzip.open(path, 'rt') as archive:
+                rows = list(csv.DictReader(archive))
+        self.assertEqual([row['id'] for row in rows], [str(booking.pk)])
+        self.assertNotIn(month, partitioning.partitions())
+        self.assertFalse(Booking.objects.filter(pk=booking.pk).exists())
+
+        with self.assertRaises(CommandError):
+            call_command('archive_booking_partitions', older_than_months=1, dry_run=True, stdout=io.StringIO())
+
+        # Все брони в архиве: статистика архивных месяцев переживает полную пересборку
+        archived = ApartmentMonthlyStats.objects.create(apartment=self.apartment, month=datetime.date(2000, 1, 1), nights_booked=3)
+        Booking.objects.all().delete()
+        analytics.rebuild_all()
+        self.assertEqual(list(ApartmentMonthlyStats.objects.values_list('pk', flat=True)), [archived.pk])
+
+
+class PhotoQueryBudgetTests(QueryBudgetTestCase):
+    def test_upload(self):
+        self.authenticate(self.owner)
+        response, _ = self.assertQueryBudget(
+            'apartments:photo-upload', 'post', reverse('apartments:photo-upload'),
+            data={'apartment': self.apartment.pk, 'image': image_upload()}, format='multipart',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_cover_photo(self):
+        apartment = Apartment.objects.filter(owner=self.owner, is_active=True, photo_count=0).first() or self.apartment
+        apartment.photos.all().delete()
+        self.authenticate(self.owner)
+        uploaded = [
+            self.client.post(
+                reverse('apartments:photo-upload'), {'apartment': apartment.pk, 'image': image_upload(f'{i}.jpg')},
+                format='multipart',
+            ).data
+            for i in range(2)
+        ]
+        apartment.refresh_from_db()
+        self.assertEqual(apartment.photo_count, 2)
+        self.assertTrue(uploaded[0]['image'].endswith(apartment.cover_photo.url))
+
+        # Карточка в списке - обложка и количество без галереи
+        response = self.client.get(reverse('apartments:my-apartment-list'))
+        card = next(item for item in response.data if item['id'] == apartment.pk)
+        self.assertNotIn('photos', card)
+        self.assertEqual((card['cover_photo'], card['photo_count']), (uploaded[0]['image'], 2))
+
+        self.client.delete(reverse('apartments:photo-delete', args=[uploaded[0]['id']]))
+        apartment.refresh_from_db()
+        self.assertEqual(apartment.photo_count, 1)
+        self.assertTrue(uploaded[1]['image'].endswith(apartment.cover_photo.url))
+
+    def test_upload_idempotent(self):
+        self.authenticate(self.owner)
+        url = reverse('apartments:photo-upload')
+        responses = [
+            self.assertQueryBudget(
+                'apartments:photo-upload', 'post', url, HTTP_IDEMPOTENCY_KEY='photo-1',
+                data={'apartment': self.apartment.pk, 'image': image_upload()}, format='multipart',
+            )[0]
+            for _ in range(2)
+        ]
+        self.assertEqual([response.status_code for response in responses], [201, 201])
+        self.assertEqual(responses[0].content, responses[1].content)
+        photo_id = responses[0].json()['id']
+        self.assertEqual(ApartmentPhoto.objects.filter(pk=photo_id).count(), 1)
+        self.assertEqual(ApartmentPhoto.objects.filter(apartment=self.apartment).count(),
+                         ApartmentPhoto.objects.filter(apartment=self.apartment).distinct().count())
+
+    def test_delete(self):
+        photo = ApartmentPhoto.objects.select_related('apartment__owner').first()
+        self.authenticate(photo.apartment.owner)
+        url = reverse('apartments:photo-delete', args=[photo.pk])
+        response, _ = self.assertQueryBudget('apartments:photo-delete', 'delete', url)
+        self.assertEqual(response.status_code, 204)
+
+
+class MediaTests(QueryBudgetTestCase):
+    name = 'apartments/ca/media-test.jpg'
+    body = bytes(range(256)) * 4
+
+    def setUp(self):
+        super().setUp()
+        path = os.path.join(self._media_root, self.name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(self.body)
+        self.photo = ApartmentPhoto.objects.create(apartment=self.apartment, image=self.name)
+        self.url = f'/media/{self.name}'
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        # Потоковый ответ клиент тестов закрывает сам, когда содержимое прочитано
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, content
+
+    def test_full_and_not_modified(self):
+        response, content = self.get()
+        self.assertEqual((response.status_code, content), (200, self.body))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+        response, content = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((response.status_code, content), (304, b''))
+        self.assertEqual(response['ETag'], self.get()[0]['ETag'])
+
+    def test_range(self):
+        response, content = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual((response.status_code, content), (206, self.body[10:20]))
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.body)}')
+        self.assertEqual(response['Content-Length'], '10')
+        response, content = self.get(HTTP_RANGE='bytes=-5')
+        self.assertEqual((response.status_code, content), (206, self.body[-5:]))
+        response, content = self.get(HTTP_RANGE=f'bytes={len(self.body)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.body)}')
+        # Несколько диапазонов и устаревший If-Range - файл целиком
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-1,5-6')[1], self.body)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"stale"')[1], self.body)
+
+    def test_accel_redirect(self):
+        with override_settings(MEDIA_ACCEL='x-accel-redirect', MEDIA_ACCEL_PREFIX='/protected-media/'):
+            response, content = self.get()
+        self.assertEqual((response.status_code, content), (200, b''))
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.name}')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+
+    def test_hidden_apartment(self):
+        Apartment.objects.filter(pk=self.apartment.pk).update(is_active=False)
+        self.assertEqual(self.get()[0].status_code, 404)
+        self.authenticate(self.owner)
+        response, content = self.get()
+        self.assertEqual((response.status_code, content), (200, self.body))
+        self.assertIn('private', response['Cache-Control'])
+
+
+class AuthQueryBudgetTests(QueryBudgetTestCase):
+    def test_register(self):
+        response, _ = self.assertQueryBudget(
+            'auth_app:register', 'post', reverse('auth_app:register'),
+            data={
+                'username': 'new_user', 'email': 'new_user@example.invalid',
+                'password': 'Sl0zhnyi-parol', 'password_confirm': 'Sl0zhnyi-parol',
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_login(self):
+        response, _ = self.assertQueryBudget(
+            'auth_app:token_obtain_pair', 'post', reverse('auth_app:token_obtain_pair'),
+            data={'username': self.owner.username, 'password': 'perf-password-123'}, format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_token_refresh(self):
+        refresh = str(RefreshToken.for_user(self.owner))
+        response, _ = self.assertQueryBudget(
+            'auth_app:token_refresh', 'post', reverse('auth_app:token_refresh'),
+            data={'refresh': refresh}, format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_current_user(self):
+        self.authenticate(self.owner)
+        url = reverse('auth_app:current_user')
+        self.assertQueryBudget('auth_app:current_user', 'get', url)
+        response, _ = self.assertQueryBudget('auth_app:current_user', 'patch', url, data={'first_name': 'Test'}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+
+
+class AdminSearchTests(QueryBudgetTestCase):
+    def test_search_uses_indexes(self):
+        booking_admin = admin.site._registry[Booking]
+        queryset = Booking.objects.all()
+        for term, expected in [
+            (str(self.booking.pk), self.booking),
+            (self.booking.user.username, self.booking),
+        ]:
+            found, _ = booking_admin.get_search_results(None, queryset, term)
+            # UPPER(...) = UPPER(%s) по id или username индексом не покрыт
+            self.assertNotIn('UPPER', str(found.query))
+            self.assertIn(expected, found)
+        found, _ = admin.site._registry[Apartment].get_search_results(None, Apartment.objects.all(), self.apartment.title[:5])
+        self.assertIn(self.apartment, found)
+
+
+class BatchTests(QueryBudgetTestCase):
+    def test_apartment_screen(self):
+        self.authenticate(self.owner)
+        pk = self.apartment.pk
+        requests = [
+            {'method': 'GET', 'path': reverse('apartments:apartment-detail', args=[pk])},
+            {'method': 'GET', 'path': f"{reverse('apartments:review-list')}?apartment={pk}"},
+            {'method': 'GET', 'path': reverse('apartments:amenity-list')},
+            {
+                'method': 'POST', 'path': reverse('apartments:apartment-availability'),
+                'body': {'apartments': [pk], 'check_in': '2099-04-01', 'check_out': '2099-04-03'},
+            },
+            {'method': 'GET', 'path': reverse('auth_app:current_user')},
+        ]
+        separate, separate_queries = [], 0
+        for item in requests:
+            cache.clear()
+            tiered_cache.clear_local()
+            with CaptureQueriesContext(connection) as context:
+                if item['method'] == 'POST':
+                    response = self.client.post(item['path'], item['body'], format='json')
+                else:
+                    response = self.client.get(item['path'])
+            self.assertEqual(response.status_code, 200)
+            separate.append(response.json())
+            separate_queries += len(context)
+
+        cache.clear()
+        tiered_cache.clear_local()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post('/api/batch/', {'requests': requests}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual([item['status'] for item in response.json()['responses']], [200] * len(requests))
+        self.assertEqual([item['body'] for item in response.json()['responses']], separate)
+        # Пользователь по JWT загружается один раз на пакет, а не на каждый подзапрос
+        self.assertEqual(len(context), separate_queries - (len(requests) - 1))
+
+    def test_item_errors(self):
+        bookings = Booking.objects.count()
+        response = self.client.post('/api/batch/', {'requests': [
+            {'path': '/api/no-such-route/'},
+            {'method': 'POST', 'path': reverse('apartments:booking-list'), 'body': {}},
+            {'path': reverse('apartments:owner-analytics')},
+            {'path': '/api/batch/'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual([item['status'] for item in response.data['responses']], [404, 405, 401, 400])
+        self.assertEqual(Booking.objects.count(), bookings)
+
+        with override_settings(BATCH_MAX_REQUESTS=2):
+            response = self.client.post('/api/batch/', {'requests': [{'path': '/api/amenities/'}] * 3}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class GeoTests(SimpleTestCase):
+    def test_geohash(self):
+        # Эталонные значения: http://geohash.org/u4pruydqqvj, пример ezs42 из описания формата
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(geo.encode(42.6, -5.6, 5), 'ezs42')
+        self.assertEqual(geo.decode('ezs42'), (42.5830078125, -5.625, 42.626953125, -5.5810546875))
+        for lat, lng in [(43.2389, 76.8897), (-33.8688, 151.2093), (0.0, 0.0), (89.9999, -179.9999)]:
+            min_lat, min_lng, max_lat, max_lng = geo.decode(geo.encode(lat, lng))
+            self.assertTrue(min_lat <= lat < max_lat and min_lng <= lng < max_lng)
+            self.assertAlmostEqual(max_lat - min_lat, geo.cell_size(geo.GEOHASH_PRECISION)[0])
+        # Точка на границе ячейки относится к верхней/правой: сравнение >= в encode
+        self.assertEqual(geo.encode(0.0, 0.0, 1), 's')
+        self.assertEqual(geo.encode(-1e-9, -1e-9, 1), '7')
+
+    def test_cover_bbox(self):
+        bbox = (43.1, 76.8, 43.4, 77.1)
+        precision = geo.precision_for_bbox(bbox, 32)
+        # Граница точности: следующая точность уже не укладывается в 32 ячейки
+        self.assertLessEqual(geo._cells_count(bbox, precision), 32)
+        self.assertGreater(geo._cells_count(bbox, precision + 1), 32)
+        cells = geo.cover_bbox(bbox, max_cells=32)
+        self.assertEqual(cells, ['txwt', 'txwv', 'txww', 'txwy'])
+        min_lat, min_lng, max_lat, max_lng = bbox
+        for step_lat in range(11):
+            for step_lng in range(11):
+                lat = min_lat + (max_lat - min_lat) * step_lat / 10
+                lng = min_lng + (max_lng - min_lng) * step_lng / 10
+                self.assertIn(geo.encode(lat, lng, precision), cells)
+        # Прямоугольник ровно по границам ячейки покрывается ею (и соседними справа/сверху)
+        self.assertIn('ezs42', geo.cover_bbox(geo.decode('ezs42'), max_cells=4))
+
+    def test_haversine(self):
+        # Париж - Лондон ~343.6 км, Алматы - Астана ~972 км
+        self.assertAlmostEqual(geo.haversine_km(48.8566, 2.3522, 51.5074, -0.1278), 343.56, delta=0.5)
+        self.assertAlmostEqual(geo.haversine_km(43.2389, 76.8897, 51.1694, 71.4491), 972.25, delta=0.5)
+        self.assertEqual(geo.haversine_km(43.0, 76.0, 43.0, 76.0), 0.0)
+        # Половина окружности Земли - антиподы
+        self.assertAlmostEqual(geo.haversine_km(0, 0, 0, 180), math.pi * geo.EARTH_RADIUS_KM, places=6)
+
+    def test_bbox_around(self):
+        # Точки окружности радиуса 10 км по всем направлениям лежат внутри прямоугольника,
+        # и прямоугольник не шире нужного: северная точка - ровно на радиусе
+        for lat, lng in [(43.25, 76.9), (70.0, 20.0), (-55.0, -70.0)]:
+            min_lat, min_lng, max_lat, max_lng = geo.bbox_around(lat, lng, 10)
+            self.assertAlmostEqual(geo.haversine_km(lat, lng, max_lat, lng), 10, places=6)
+            phi, lmb, angular = math.radians(lat), math.radians(lng), 10 / geo.EARTH_RADIUS_KM
+            for bearing in range(0, 360, 2):
+                theta = math.radians(bearing)
+                point_phi = math.asin(math.sin(phi) * math.cos(angular) + math.cos(phi) * math.sin(angular) * math.cos(theta))
+                point_lmb = lmb + math.atan2(
+                    math.sin(theta) * math.sin(angular) * math.cos(phi),
+                    math.cos(angular) - math.sin(phi) * math.sin(point_phi),
+                )
+                self.assertTrue(min_lat - 1e-9 <= math.degrees(point_phi) <= max_lat + 1e-9)
+                self.assertTrue(min_lng - 1e-9 <= math.degrees(point_lmb) <= max_lng + 1e-9)
+        # Круг через полюс - все долготы
+        self.assertEqual(geo.bbox_around(89.99, 10, 5)[1::2], (-180.0, 180.0))
+
+
+class MetricsTests(SimpleTestCase):
+    def test_token(self):
+        request = RequestFactory().get('/metrics')
+        # Без токена на проде метрики не отдаются, check --deploy предупреждает
+        with override_settings(DEBUG=False, METRICS_TOKEN=None):
+            self.assertEqual(metrics.metrics_view(request).status_code, 403)
+            self.assertEqual([warning.id for warning in metrics.check_metrics_token(None)], ['uibar.W003'])
+        with override_settings(DEBUG=True, METRICS_TOKEN=None):
+            self.assertEqual(metrics.metrics_view(request).status_code, 200)
+        with override_settings(DEBUG=False, METRICS_TOKEN='secret'):
+            self.assertEqual(metrics.check_metrics_token(None), [])
+            self.assertEqual(metrics.metrics_view(request).status_code, 403)
+            authorized = RequestFactory().get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(metrics.metrics_view(authorized).status_code, 200)
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_require_baseline(self):
+        # Без базового файла - ошибка ещё до прогона (к серверу и БД не обращается)
+        with self.assertRaisesMessage(CommandError, 'не найден'):
+            call_command('run_benchmarks', baseline='/nonexistent/baseline.json', require_baseline=True, stdout=io.StringIO())
+
+
+class CompressionTests(SimpleTestCase):
+    body = json.dumps([{'id': n, 'title': 'Квартира'} for n in range(100)]).encode()
+
+    def compress(self, response, accept='gzip, br', **options):
+        request = RequestFactory().get('/api/apartments/', HTTP_ACCEPT_ENCODING=accept)
+        with override_settings(COMPRESSION_ROUTES={}, **options):
+            return middleware.CompressionMiddleware(lambda request: response)(request)
+
+    def json_response(self, body=None, **headers):
+        response = HttpResponse(self.body if body is None else body, content_type='application/json')
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    def test_negotiation(self):
+        # br предпочтительнее при равном q, если установлен brotli
+        preferred = 'br' if middleware.brotli is not None else 'gzip'
+        cases = [
+            ('gzip, br', preferred), ('*', preferred), ('gzip', 'gzip'), ('br;q=0, gzip', 'gzip'),
+            ('br;q=0.5, gzip', 'gzip'), ('identity', None), ('', None),
+        ]
+        for accept, expected in cases:
+            with self.subTest(accept=accept):
+                response = self.compress(self.json_response(), accept)
+                self.assertIn('Accept-Encoding', response['Vary'])
+                self.assertEqual(response.get('Content-Encoding'), expected)
+                if expected is None:
+                    self.assertEqual(response.content, self.body)
+                    continue
+                decompress = gzip.decompress if expected == 'gzip' else middleware.brotli.decompress
+                self.assertEqual(decompress(response.content), self.body)
+                self.assertEqual(response['Content-Length'], str(len(response.content)))
+
+    def test_skipped(self):
+        # Меньше порога, уже сжатые типы и частичные ответы не трогаем
+        small = self.compress(self.json_response(b'{}'))
+        self.assertFalse(small.has_header('Content-Encoding'))
+        self.assertEqual(small.content, b'{}')
+        self.assertEqual(self.compress(self.json_response(), COMPRESSION_MIN_SIZE=len(self.body) + 1).content, self.body)
+        image = HttpResponse(b'\0' * 4096, content_type='image/png')
+        self.assertFalse(self.compress(image).has_header('Content-Encoding'))
+        partial = self.json_response()
+        partial.status_code = 206
+        self.assertFalse(self.compress(partial).has_header('Content-Encoding'))
+
+    def test_weak_etag(self):
+        response = self.compress(self.json_response(ETag='"abc"'), 'gzip')
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        weak = self.compress(self.json_response(ETag='W/"abc"'), 'gzip')
+        self.assertEqual(weak['ETag'], 'W/"abc"')
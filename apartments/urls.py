@@ -1,7 +1,7 @@
 # apartments/urls.py
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
-from .views import ApartmentViewSet, AmenityViewSet, MyApartmentListView, ReviewViewSet, BookingViewSet, ApartmentPhotoUploadView, ApartmentPhotoDestroyView # Импортируем наши ViewSet'ы
+from .views import ApartmentViewSet, AmenityViewSet, MyApartmentListView, ReviewViewSet, BookingViewSet, ApartmentPhotoUploadView, ApartmentPhotoDestroyView, OwnerExportView, OwnerAnalyticsView, PriceRuleViewSet # Импортируем наши ViewSet'ы
 
 app_name = 'apartments' # Имя приложения для пространства имен URL (не обязательно для API, но хорошая практика)
 
@@ -19,14 +19,22 @@ router.register(r'apartments', ApartmentViewSet, basename='apartment')
 router.register(r'amenities', AmenityViewSet, basename='amenity')
 router.register(r'reviews', ReviewViewSet, basename='review')
 router.register(r'bookings', BookingViewSet, basename='booking')
+# Правила цен владельца: /api/price-rules/
+router.register(r'price-rules', PriceRuleViewSet, basename='price-rule')
 # urlpatterns теперь содержат все URL-адреса, сгенерированные роутером
 urlpatterns = [
     # Мы включаем сгенерированные роутером URL без дополнительного префикса здесь,
     # так как основной префикс 'api/' будет добавлен в главном urls.py проекта
     path('', include(router.urls)),
     path('my-apartments/', MyApartmentListView.as_view(), name='my-apartment-list'),
+    path('my-apartments/analytics/', OwnerAnalyticsView.as_view(), name='owner-analytics'),
     # --- URL для Фото ---
     path('photos/upload/', ApartmentPhotoUploadView.as_view(), name='photo-upload'),
     path('photos/<int:pk>/delete/', ApartmentPhotoDestroyView.as_view(), name='photo-delete'),
+    # --- Выгрузка для владельца: /api/exports/bookings.csv, /api/exports/apartments.jsonl ---
+    re_path(
+        r'^exports/(?P<resource>bookings|apartments)\.(?P<fmt>csv|jsonl)$',
+        OwnerExportView.as_view(), name='owner-export'
+    ),
 
 ]
\ No newline at end of file
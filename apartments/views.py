@@ -2,48 +2,264 @@
 from rest_framework import viewsets, permissions, status, filters, generics, serializers # Добавляем filters и serializers
 from rest_framework.response import Response # Добавляем Response
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.views import APIView
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend # Добавляем DjangoFilterBackend
-from .models import Apartment, Amenity, Booking, Review, ApartmentPhoto # Импортируем модели
-from .serializers import ApartmentSerializer, AmenitySerializer, ReviewSerializer, BookingSerializer, ApartmentPhotoSerializer # Импортируем сериализаторы
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count
+from django.db.models.functions import Left
+from .models import Apartment, Amenity, Booking, Review, ApartmentPhoto, ApartmentMonthlyStats, PriceRule # Импортируем модели
+from .serializers import ApartmentSerializer, ApartmentDetailSerializer, ApartmentListSerializer, AmenitySerializer, ReviewSerializer, BookingSerializer, ApartmentPhotoSerializer, PriceRuleSerializer, StayQuerySerializer # Импортируем сериализаторы
 from .permissions import IsOwnerOrReadOnly, IsAuthorOrReadOnly # Импортируем пользовательские права доступа
 from .gemini_utils import generate_apartment_description
+from .filters import GeoFilterBackend, TextSearchFilterBackend, parse_bbox
+from . import geo
 from rest_framework.decorators import action
+from rest_framework.exceptions import APIException
+from .importers import ApartmentImporter, detect_format, iter_rows, FORMATS
+from . import exports
+from . import analytics
+from . import changes
+from .pagination import EstimatedCountPageNumberPagination, ReviewCursorPagination
+from .fastpath import ValuesListMixin, represent_ids
+from .idempotency import IdempotentCreateMixin
+from . import similarity
+from . import pricing
+from . import availability
+from . import amenities
+import datetime
 # --- ViewSet для Удобств (Amenity) ---
 # Создадим простой ViewSet только для чтения списка удобств,
 # это может быть полезно для фронтенда, чтобы знать, какие удобства доступны.
 class AmenityViewSet(viewsets.ReadOnlyModelViewSet):
     """
     ViewSet для просмотра списка доступных удобств.
-    Только чтение (list, retrieve).
+    Только чтение (list, retrieve). Справочник читается из кэша (amenities.py) -
+    при попадании без запросов к БД.
     """
     queryset = Amenity.objects.all()
     serializer_class = AmenitySerializer
     permission_classes = [permissions.AllowAny] # Разрешаем просмотр всем
     pagination_class = None # Отключаем пагинацию для удобств, их обычно не так много
+
+    def list(self, request, *args, **kwargs):
+        return Response(self.get_serializer(amenities.all_amenities(), many=True).data)
+
+    def get_object(self):
+        try:
+            amenity = amenities.by_id().get(int(self.kwargs['pk']))
+        except ValueError:
+            amenity = None
+        if amenity is None:
+            raise Http404
+        self.check_object_permissions(self.request, amenity)
+        return amenity
 # ------------------------------------
 
 
+class SimilarityIndexUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Similarity index is not built yet."
+    default_code = 'similarity_index_unavailable'
+
+
 # --- ViewSet для Квартир (Apartment) ---
-class ApartmentViewSet(viewsets.ModelViewSet):
+class ApartmentViewSet(ValuesListMixin, viewsets.ModelViewSet):
     """
     ViewSet для просмотра и редактирования объявлений квартир.
+    Список читается через values() без экземпляров моделей (см. fastpath.py).
     """
-    # Используем prefetch_related для оптимизации запроса удобств (ManyToMany)
+    # Используем prefetch_related для оптимизации запроса удобств (ManyToMany) и фото
     # Используем select_related для оптимизации запроса владельца (ForeignKey)
-    queryset = Apartment.objects.filter(is_active=True).select_related('owner').prefetch_related('amenities')
+    queryset = Apartment.objects.filter(is_active=True).select_related('owner').prefetch_related('amenities', 'photos')
     serializer_class = ApartmentSerializer
     permission_classes = [IsOwnerOrReadOnly] # Читать могут все, создавать/изменять - авторизованные
+    # Постраничный вывод; на больших выборках count - оценка планировщика, а не COUNT(*)
+    pagination_class = EstimatedCountPageNumberPagination
 
 
     # Добавим фильтрацию по городу, комн и т.д. с помощью django-filter
-    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    # GeoFilterBackend - поиск по прямоугольнику карты (?bbox=) и радиусу (?lat=&lng=&radius=)
+    # TextSearchFilterBackend - текстовый поиск ?q= с сортировкой по релевантности (после OrderingFilter)
+    filter_backends = [DjangoFilterBackend, GeoFilterBackend, filters.OrderingFilter, TextSearchFilterBackend]
     filterset_fields = ['city', 'apartment_type', 'max_guests', 'beds'] # Поля для фильтрации
     ordering_fields = ['price', 'created_at'] # Поля для сортировки
     ordering = ['-created_at'] # Сортировка по умолчанию
     # --------------------------------
+    # Действия-списки: карточки с обложкой и количеством фото вместо галереи
+    CARD_ACTIONS = ('list', 'similar')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.CARD_ACTIONS:
+            queryset = queryset.prefetch_related(None).prefetch_related('amenities')
+        return queryset
+
+    def get_serializer_class(self):
+        # В детальной карточке дополнительно показываем последние отзывы
+        if self.action == 'retrieve':
+            return ApartmentDetailSerializer
+        if self.action in self.CARD_ACTIONS:
+            return ApartmentListSerializer
+        return super().get_serializer_class()
+
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    # Сколько ячеек максимум показываем на карте при автоматическом выборе точности
+    CLUSTER_MAX_CELLS = 256
+    # Максимум похожих квартир в ответе similar
+    SIMILAR_MAX_K = 50
+
+    @action(detail=False, methods=['get'])
+    def clusters(self, request):
+        """
+        Кластеры маркеров для отдалённого масштаба карты:
+        количество квартир и средняя точка в каждой ячейке geohash.
+        Параметры: bbox (обязательный), precision (1-9, по умолчанию подбирается по bbox).
+        Остальные фильтры списка (город, тип и т.д.) тоже применяются.
+        """
+        if 'bbox' not in request.query_params:
+            raise serializers.ValidationError({'bbox': "This parameter is required."})
+        bbox = parse_bbox(request.query_params['bbox'])
+
+        precision = request.query_params.get('precision')
+        if precision is None:
+            precision = geo.precision_for_bbox(bbox, self.CLUSTER_MAX_CELLS)
+        else:
+            try:
+                precision = int(precision)
+            except ValueError:
+                precision = 0
+            if not 1 <= precision <= geo.GEOHASH_PRECISION:
+                raise serializers.ValidationError({'precision': f"Must be between 1 and {geo.GEOHASH_PRECISION}."})
+
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        clusters = (
+            queryset.order_by()
+            .annotate(cell=Left('geohash', precision))
+            .values('cell')
+            .annotate(count=Count('id'), latitude=Avg('latitude'), longitude=Avg('longitude'))
+            .order_by('cell')
+        )
+        return Response({'precision': precision, 'clusters': list(clusters)})
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """
+        Похожие квартиры того же города по предрасчитанному индексу (см. similarity.py).
+        Параметр k - сколько вернуть (по умолчанию 10, не больше 50).
+        """
+        k = request.query_params.get('k', 10)
+        try:
+            k = int(k)
+        except ValueError:
+            k = 0
+        if not 1 <= k <= self.SIMILAR_MAX_K:
+            raise serializers.ValidationError({'k': f"Must be between 1 and {self.SIMILAR_MAX_K}."})
+        try:
+            apartment_id = int(pk)
+        except ValueError:
+            raise Http404
+        index = similarity.get_index()
+        if index is None:
+            raise SimilarityIndexUnavailable()
+        neighbours = index.similar(apartment_id, k)
+        if neighbours is None:
+            raise Http404
+        distances = dict(neighbours)
+        results = represent_ids(self.get_serializer(), self.get_queryset(), list(distances))
+        for item in results:
+            item['distance'] = round(distances[item['id']], 4)
+        return Response({'results': results})
+
+    @action(detail=False, methods=['post'], permission_classes=[permissions.AllowAny])
+    def quote(self, request):
+        """
+        Стоимость проживания на одни даты для многих квартир (карточки поисковой выдачи):
+        {"apartments": [id, ...], "check_in": "YYYY-MM-DD", "check_out": "YYYY-MM-DD"}.
+        Цены по ночам с учётом правил цен (см. pricing.py); неактивные и несуществующие
+        квартиры в ответ не попадают. Два запроса к БД на любое число квартир.
+        """
+        query = StayQuerySerializer(data=request.data)
+        query.is_valid(raise_exception=True)
+        ids, check_in, check_out = (query.validated_data[name] for name in ('apartments', 'check_in', 'check_out'))
+        prices = dict(Apartment.objects.filter(pk__in=ids, is_active=True).values_list('id', 'price'))
+        quotes = pricing.quote_many({pk: prices[pk] for pk in ids if pk in prices}, check_in, check_out)
+        return Response({
+            'check_in': check_in,
+            'check_out': check_out,
+            'results': [quote.as_dict() for quote in quotes.values()],
+        })
+
+    @action(detail=False, methods=['post'], permission_classes=[permissions.AllowAny])
+    def availability(self, request):
+        """
+        Доступность и стоимость многих квартир на одни даты - тело как у quote.
+        Для каждой квартиры: available (нет пересекающихся актуальных броней)
+        и расчёт стоимости. Результаты кэшируются на диапазон дат (см. availability.py).
+        """
+        query = StayQuerySerializer(data=request.data)
+        query.is_valid(raise_exception=True)
+        ids, check_in, check_out = (query.validated_data[name] for name in ('apartments', 'check_in', 'check_out'))
+        return Response({
+            'check_in': check_in,
+            'check_out': check_out,
+            'results': availability.check_availability(ids, check_in, check_out),
+        })
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """
+        Лента изменений для синхронизации мобильного каталога (см. changes.py).
+        Параметры: since - курсор из next_cursor прошлого ответа (без него - с начала),
+        limit - размер страницы (по умолчанию 500, не больше 1000).
+        """
+        limit = request.query_params.get('limit', changes.DEFAULT_LIMIT)
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= changes.MAX_LIMIT:
+            raise serializers.ValidationError({'limit': f"Must be between 1 and {changes.MAX_LIMIT}."})
+        feed = changes.ChangesFeed(self.get_serializer(), since=request.query_params.get('since'), limit=limit)
+        return Response(feed.page())
+
+    @action(
+        detail=False, methods=['post'], url_path='bulk-import',
+        permission_classes=[permissions.IsAuthenticated], parser_classes=[MultiPartParser, FormParser]
+    )
+    def bulk_import(self, request):
+        """
+        Массовый импорт квартир текущего пользователя из файла.
+        Принимает multipart с полем 'file' (.csv или .jsonl) и необязательным 'format'.
+        Возвращает количество созданных квартир и ошибки по номерам строк;
+        если файл не удалось дочитать - 400 и stopped_at_row.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise serializers.ValidationError({'file': "This field is required."})
+        fmt = request.data.get('format') or detect_format(upload.name)
+        if fmt not in FORMATS:
+            raise serializers.ValidationError({'format': f"Expected one of: {', '.join(FORMATS)}."})
+
+        # Читаем загруженный файл потоково, не загружая его целиком в память
+        importer = ApartmentImporter(request.user).run(iter_rows(upload.file, fmt))
+
+        data = {
+            'created': importer.created,
+            'failed': len(importer.errors),
+            'errors': importer.errors,
+            'rows_per_second': round(importer.rows_per_second, 1),
+        }
+        if importer.stopped:
+            # Файл не дочитан (не UTF-8, ошибка CSV): строки до stopped_at_row уже импортированы
+            data['stopped_at_row'] = importer.stopped['row']
+        ok = importer.created and not importer.stopped
+        return Response(data, status=status.HTTP_201_CREATED if ok else status.HTTP_400_BAD_REQUEST)
+
     # --- НОВОЕ ДЕЙСТВИЕ ДЛЯ ГЕНЕРАЦИИ ОПИСАНИЯ ---
     @action(detail=True, methods=['post'], permission_classes=[IsOwnerOrReadOnly])
     # detail=True - действие для конкретного объекта (нужен /pk/)
@@ -81,7 +297,7 @@ class MyApartmentListView(generics.ListAPIView):
     принадлежащих текущему аутентифицированному пользователю.
     Доступно только аутентифицированным пользователям.
     """
-    serializer_class = ApartmentSerializer
+    serializer_class = ApartmentListSerializer # Карточки: обложка и количество фото вместо галереи
     permission_classes = [permissions.IsAuthenticated] # Только для авторизованных
 
     def get_queryset(self):
@@ -99,9 +315,60 @@ class MyApartmentListView(generics.ListAPIView):
         """
         serializer.save(owner=self.request.user)
         
-class ReviewViewSet(viewsets.ModelViewSet):
+class OwnerAnalyticsView(APIView):
+    """
+    Аналитика владельца по месяцам: выручка, ночи, заезды и загрузка по каждой квартире.
+    Параметры: from, to в формате YYYY-MM (по умолчанию - последние 12 месяцев).
+    Читает только предрасчитанную таблицу ApartmentMonthlyStats - один индексный запрос.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def _parse_month(self, name, default):
+        value = self.request.query_params.get(name)
+        if not value:
+            return default
+        try:
+            return datetime.datetime.strptime(value, '%Y-%m').date()
+        except ValueError:
+            raise serializers.ValidationError({name: "Expected format YYYY-MM."})
+
+    def get(self, request):
+        current = analytics.month_start(timezone.now().date())
+        date_to = self._parse_month('to', current)
+        date_from = self._parse_month('from', date_to.replace(year=date_to.year - 1) + datetime.timedelta(days=31))
+        date_from = analytics.month_start(date_from)
+        if date_from > date_to:
+            raise serializers.ValidationError("'from' must not be later than 'to'.")
+
+        rows = ApartmentMonthlyStats.objects.filter(
+            apartment__owner=request.user, month__gte=date_from, month__lte=date_to
+        ).values(
+            'apartment_id', 'apartment__title', 'month', 'nights_booked', 'bookings_count', 'revenue'
+        ).order_by('apartment_id', 'month')
+
+        results = [
+            {
+                'apartment': row['apartment_id'],
+                'apartment_title': row['apartment__title'],
+                'month': row['month'].strftime('%Y-%m'),
+                'nights_booked': row['nights_booked'],
+                'bookings_count': row['bookings_count'],
+                'revenue': str(row['revenue']),
+                'occupancy_rate': analytics.occupancy_rate(row['month'], row['nights_booked']),
+            }
+            for row in rows
+        ]
+        return Response({
+            'from': date_from.strftime('%Y-%m'),
+            'to': date_to.strftime('%Y-%m'),
+            'results': results,
+        })
+
+
+class ReviewViewSet(ValuesListMixin, viewsets.ModelViewSet):
     """
     ViewSet для создания, просмотра, изменения и удаления отзывов.
+    Список читается через values() без экземпляров моделей (см. fastpath.py).
     """
     serializer_class = ReviewSerializer
     # Права: читать могут все, остальное - только автор
@@ -110,9 +377,11 @@ class ReviewViewSet(viewsets.ModelViewSet):
     # фильтровать по ID квартиры (?apartment=...)
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['apartment'] # Разрешаем фильтрацию по полю apartment
+    # Курсорная пагинация: лента отзывов квартиры идёт по индексу (apartment, -created_at)
+    pagination_class = ReviewCursorPagination
 
     # Базовый queryset - все отзывы
-    queryset = Review.objects.all().select_related('author', 'apartment') # Оптимизация
+    queryset = Review.objects.all().select_related('author') # Оптимизация
 
     def perform_create(self, serializer):
         """
@@ -121,11 +390,26 @@ class ReviewViewSet(viewsets.ModelViewSet):
         # Проверяем, что пользователь аутентифицирован (хотя IsAuthorOrReadOnly это тоже сделает)
         if not self.request.user.is_authenticated:
              raise serializers.ValidationError("Authentication required to post reviews.")
-        serializer.save(author=self.request.user)
+        self._save_unique(serializer, author=self.request.user)
 
-class BookingViewSet(viewsets.ModelViewSet):
+    def perform_update(self, serializer):
+        self._save_unique(serializer)
+
+    def _save_unique(self, serializer, **kwargs):
+        """
+        Повторный отзыв на ту же квартиру отсекает уникальное ограничение в базе,
+        а не отдельный запрос exists() перед вставкой (он ещё и не защищал от гонки).
+        """
+        try:
+            with transaction.atomic():
+                serializer.save(**kwargs)
+        except IntegrityError:
+            raise serializers.ValidationError("You have already reviewed this apartment.")
+
+class BookingViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     """
     ViewSet для создания и просмотра СВОИХ бронирований.
+    Создание поддерживает заголовок Idempotency-Key (см. idempotency.py).
     """
     serializer_class = BookingSerializer
     permission_classes = [permissions.IsAuthenticated] # Только авторизованные
@@ -137,7 +421,10 @@ class BookingViewSet(viewsets.ModelViewSet):
         """
         Пользователь видит только свои бронирования.
         """
-        return Booking.objects.filter(user=self.request.user).select_related('apartment', 'user').order_by('-created_at')
+        # apartment_details - полный ApartmentSerializer: владелец, удобства и фото квартиры
+        return Booking.objects.filter(user=self.request.user).select_related(
+            'apartment__owner', 'user'
+        ).prefetch_related('apartment__amenities', 'apartment__photos').order_by('-created_at')
 
     def get_serializer_context(self):
         """
@@ -146,10 +433,25 @@ class BookingViewSet(viewsets.ModelViewSet):
         context = super().get_serializer_context()
         context.update({"request": self.request})
         return context
-class ApartmentPhotoUploadView(generics.CreateAPIView):
+class PriceRuleViewSet(viewsets.ModelViewSet):
+    """
+    Правила цен на свои квартиры (сезоны, выходные, минимальный срок) - для владельца.
+    Фильтр ?apartment=<id>.
+    """
+    serializer_class = PriceRuleSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['apartment']
+
+    def get_queryset(self):
+        return PriceRule.objects.filter(apartment__owner=self.request.user)
+
+
+class ApartmentPhotoUploadView(IdempotentCreateMixin, generics.CreateAPIView):
     """
     Представление для загрузки одного фото для квартиры.
     Принимает POST запрос с 'image' (файл) и 'apartment' (ID квартиры).
+    Повтор с тем же Idempotency-Key не сохраняет файл заново (см. idempotency.py).
     """
     queryset = ApartmentPhoto.objects.all()
     serializer_class = ApartmentPhotoSerializer
@@ -158,25 +460,19 @@ class ApartmentPhotoUploadView(generics.CreateAPIView):
     parser_classes = (MultiPartParser, FormParser)
 
     def perform_create(self, serializer):
-        # Проверяем, является ли пользователь владельцем квартиры, к которой добавляется фото
-        apartment_id = self.request.data.get('apartment')
-        try:
-            apartment = Apartment.objects.get(pk=apartment_id)
-            if apartment.owner != self.request.user:
-                # Можно вызывать PermissionDenied или ValidationError
-                raise serializers.ValidationError("You can only add photos to your own apartments.")
-            # Если все ок, сохраняем фото, связь с квартирой установится через validated_data
-            serializer.save()
-        except Apartment.DoesNotExist:
-             raise serializers.ValidationError("Apartment not found.")
-        # В сериализаторе нужно будет УБРАТЬ read_only=True для apartment
-        # или передать apartment напрямую: serializer.save(apartment=apartment)
+        # Проверяем, является ли пользователь владельцем квартиры, к которой добавляется фото.
+        # Квартиру уже загрузил сериализатор (поле apartment), несуществующий ID он отклонил сам
+        apartment = serializer.validated_data['apartment']
+        if apartment.owner_id != self.request.user.id:
+            # Можно вызывать PermissionDenied или ValidationError
+            raise serializers.ValidationError("You can only add photos to your own apartments.")
+        serializer.save()
 
 class ApartmentPhotoDestroyView(generics.DestroyAPIView):
     """
     Представление для удаления фото квартиры.
     """
-    queryset = ApartmentPhoto.objects.all()
+    queryset = ApartmentPhoto.objects.select_related('apartment')
     serializer_class = ApartmentPhotoSerializer # Не особо нужен для DELETE, но требуется
     permission_classes = [permissions.IsAuthenticated] # Только авторизованные
 
@@ -184,9 +480,40 @@ class ApartmentPhotoDestroyView(generics.DestroyAPIView):
         # Получаем объект фото (как в стандартном DestroyAPIView)
         obj = super().get_object()
         # Проверяем, что пользователь является владельцем КВАРТИРЫ, к которой относится фото
-        if obj.apartment.owner != self.request.user:
+        if obj.apartment.owner_id != self.request.user.id:
             # Генерируем ошибку прав доступа
             self.permission_denied(
                 self.request, message="You can only delete photos from your own apartments."
             )
-        return obj
\ No newline at end of file
+        return obj
+
+class IgnoreClientContentNegotiation(BaseContentNegotiation):
+    """
+    Ответ формируется вручную (CSV/JSONL), поэтому заголовок Accept клиента
+    не проверяем - иначе DRF вернёт 406 на Accept: text/csv.
+    """
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return (renderers[0], renderers[0].media_type)
+
+
+class OwnerExportView(APIView):
+    """
+    Потоковая выгрузка для бухгалтерии владельца:
+    /api/exports/bookings.csv, /api/exports/apartments.jsonl и т.д.
+    Память на сервере не зависит от количества строк.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    content_negotiation_class = IgnoreClientContentNegotiation
+
+    def get(self, request, resource, fmt):
+        queryset, columns = exports.RESOURCES[resource](request.user)
+        response = StreamingHttpResponse(
+            exports.stream_export(queryset, columns, fmt),
+            content_type=exports.FORMATS[fmt],
+        )
+        filename = f"{resource}-{timezone.now():%Y%m%d}.{fmt}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
@@ -16,6 +16,14 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class PublicUserSerializer(serializers.ModelSerializer):
+    """Краткие публичные данные пользователя (например, автор отзыва)"""
+    class Meta:
+        model = User
+        fields = ('id', 'username')
+        read_only_fields = fields
+
+
 class RegisterSerializer(serializers.ModelSerializer):
     """Сериализатор для регистрации нового пользователя"""
     password = serializers.CharField(write_only=True, required=True, style={'input_type': 'password'})
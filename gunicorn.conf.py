@@ -0,0 +1,27 @@
+# gunicorn.conf.py
+"""
+Конфигурация gunicorn.
+
+Метрики Prometheus в multiprocess-режиме: воркеры пишут значения в общий
+каталог PROMETHEUS_MULTIPROC_DIR, /metrics агрегирует их. Каталог очищается
+при старте мастера (иначе останутся значения прошлого запуска), а при
+завершении воркера его livesum-значения помечаются как мёртвые.
+"""
+import os
+import shutil
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', '3'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+
+
+def on_starting(server):
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from uibar_project_new.metrics import mark_process_dead
+    mark_process_dead(worker.pid)
@@ -0,0 +1,141 @@
+# uibar_project_new/batch.py
+"""
+Пакетный запрос POST /api/batch/: несколько запросов на чтение к существующим
+маршрутам API за один HTTP-запрос.
+
+Экран квартиры собирает данные из нескольких эндпоинтов (квартира, отзывы,
+удобства, доступность, /api/auth/me/), и каждый отдельный запрос проходит
+сеть, весь стек middleware и разбор JWT с загрузкой пользователя. Здесь
+подзапросы выполняются в том же процессе и потоке: представление вызывается
+напрямую по resolve(path), пользователь пакетного запроса передаётся
+подзапросам без повторной аутентификации, соединение с БД общее. Middleware
+к подзапросам не применяются - замеры, метрики и сжатие относятся к пакету
+целиком; по подзапросам ведётся счётчик batch_subrequests.
+
+Тело запроса:
+
+    {"requests": [
+        {"method": "GET", "path": "/api/apartments/5/"},
+        {"method": "POST", "path": "/api/apartments/availability/", "body": {...}}
+    ]}
+
+Ответ - 200 и результаты в том же порядке:
+{"responses": [{"status": 200, "body": {...}}, ...]}. Ошибка подзапроса
+(404, 403, 400) на остальные не влияет.
+
+Разрешены GET и POST к маршрутам-расчётам без записи (READ_ONLY_POST_ROUTES),
+не больше BATCH_MAX_REQUESTS подзапросов. Поддерживаются только представления
+DRF с ответом-данными: выгрузки и медиафайлы (потоковые ответы) - нет.
+"""
+import io
+import json
+import logging
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.urls import Resolver404, resolve
+from rest_framework import serializers, status
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# POST-маршруты, которые только считают и ничего не записывают
+READ_ONLY_POST_ROUTES = frozenset({
+    'apartments:apartment-quote',
+    'apartments:apartment-availability',
+})
+
+# Заголовки пакетного запроса, которые не относятся к подзапросам
+DROPPED_HEADERS = ('HTTP_IDEMPOTENCY_KEY', 'HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE', 'HTTP_RANGE')
+
+
+class SubRequestSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=['GET', 'POST'], default='GET')
+    path = serializers.CharField(max_length=2000)
+    body = serializers.JSONField(required=False)
+
+    def validate_path(self, value):
+        if not value.startswith('/'):
+            raise serializers.ValidationError("Must be an absolute path, e.g. /api/apartments/.")
+        return value
+
+
+class BatchRequestSerializer(serializers.Serializer):
+    requests = SubRequestSerializer(many=True, allow_empty=False)
+
+    def validate_requests(self, value):
+        limit = getattr(settings, 'BATCH_MAX_REQUESTS', 20)
+        if len(value) > limit:
+            raise serializers.ValidationError(f"At most {limit} requests.")
+        return value
+
+
+def _error(status_code, detail):
+    return {'status': status_code, 'body': {'detail': detail}}
+
+
+def _sub_request(request, method, path, body):
+    """WSGIRequest подзапроса: окружение пакетного (хост, схема, заголовки) с другими методом, путём и телом."""
+    url = urlsplit(path)
+    content = b'' if body is None else json.dumps(body).encode()
+    environ = {key: value for key, value in request.META.items() if key not in DROPPED_HEADERS}
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(content)),
+        'wsgi.input': io.BytesIO(content),
+    })
+    return WSGIRequest(environ)
+
+
+def execute(request, method, path, body=None):
+    """Выполняет один подзапрос в текущем процессе. Возвращает {'status', 'body'}."""
+    try:
+        match = resolve(urlsplit(path).path)
+    except Resolver404:
+        return _error(status.HTTP_404_NOT_FOUND, "Not found.")
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None or not issubclass(view_class, APIView) or issubclass(view_class, BatchView):
+        return _error(status.HTTP_400_BAD_REQUEST, "This route is not available in a batch.")
+    if method == 'POST' and match.view_name not in READ_ONLY_POST_ROUTES:
+        return _error(status.HTTP_405_METHOD_NOT_ALLOWED, "Only read requests are allowed in a batch.")
+
+    sub_request = _sub_request(request, method, path, body)
+    sub_request.resolver_match = match
+    if request.user.is_authenticated:
+        # Пользователь уже аутентифицирован пакетным запросом: DRF не разбирает JWT повторно
+        sub_request._force_auth_user = request.user
+        sub_request._force_auth_token = request.auth
+    try:
+        response = match.func(sub_request, *match.args, **match.kwargs)
+    except Exception:
+        logger.exception("Batch sub-request %s %s failed", method, path)
+        result = _error(status.HTTP_500_INTERNAL_SERVER_ERROR, "Internal server error.")
+    else:
+        if isinstance(response, Response):
+            result = {'status': response.status_code, 'body': response.data}
+        else:
+            result = _error(status.HTTP_400_BAD_REQUEST, "This route is not available in a batch.")
+    metrics.record_batch_subrequest(method, match.view_name, result['status'])
+    return result
+
+
+class BatchView(APIView):
+    """POST /api/batch/ - несколько запросов на чтение одним запросом (см. описание модуля)."""
+    permission_classes = (AllowAny,) # Права проверяет каждый подзапрос
+
+    def post(self, request):
+        serializer = BatchRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        responses = [
+            execute(request, item['method'], item['path'], item.get('body'))
+            for item in serializer.validated_data['requests']
+        ]
+        return Response({'responses': responses})
@@ -0,0 +1,192 @@
+# uibar_project_new/media.py
+"""
+Раздача медиафайлов (MEDIA_URL) через Django с проверкой доступа.
+
+Django только проверяет права (settings.MEDIA_ACCESS_CHECK) и заголовки
+условного запроса, а сам файл отдаёт фронт-прокси:
+
+* MEDIA_ACCEL = 'x-accel-redirect' - nginx, заголовок X-Accel-Redirect с путём
+  MEDIA_ACCEL_PREFIX + имя файла. В nginx нужна internal-локация:
+
+      location /protected-media/ {
+          internal;
+          alias /app/media/;
+      }
+
+* MEDIA_ACCEL = 'x-sendfile' - Apache (mod_xsendfile), lighttpd: X-Sendfile с
+  абсолютным путём к файлу.
+
+Range-запросы в этих режимах обрабатывает прокси. Без прокси (MEDIA_ACCEL пуст)
+файл отдаётся FileResponse: gunicorn передаёт его через sendfile(), воркер не
+читает изображение в память. Поддерживаются ETag/Last-Modified (304) и один
+диапазон Range/If-Range (206); несколько диапазонов - отдаём файл целиком,
+как разрешает RFC 9110.
+
+Файлы с адресацией по содержимому (MEDIA_IMMUTABLE_PREFIXES) кэшируются на год
+с immutable, остальные - на MEDIA_CACHE_MAX_AGE с повторной проверкой по ETag.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+from django.utils.module_loading import import_string
+from django.views.decorators.http import require_safe
+
+PUBLIC = 'public'
+PRIVATE = 'private'
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class _FileRange:
+    """
+    Файл, ограниченный диапазоном [start, start + length). read() не выходит за
+    диапазон; fileno()/tell() нужны gunicorn для sendfile (длину он берёт из Content-Length).
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def _access(request, name):
+    check = getattr(settings, 'MEDIA_ACCESS_CHECK', None)
+    if not check:
+        return PUBLIC
+    return import_string(check)(request, name)
+
+
+def _etag(stat):
+    # Как у nginx: время изменения и размер, без чтения файла
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _parse_range(header, size):
+    """(start, length) для одного диапазона, None - отдать файл целиком, False - 416."""
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match:
+        return None # Несколько диапазонов или другие единицы
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        length = min(int(last), size) # bytes=-N - последние N байт
+        return (size - length, length) if length else False
+    start = int(first)
+    if start >= size:
+        return False
+    end = min(int(last), size - 1) if last else size - 1
+    if end < start:
+        return None
+    return start, end - start + 1
+
+
+def _if_range_matches(request, etag, mtime):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag # If-Range допускает только сильное сравнение
+    return parse_http_date_safe(if_range) == int(mtime)
+
+
+def _set_cache_headers(response, name, access, etag, mtime):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    if access == PRIVATE:
+        # Доступ зависит от пользователя - только в кэш браузера и с проверкой
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Authorization', 'Cookie'))
+    elif name.startswith(tuple(getattr(settings, 'MEDIA_IMMUTABLE_PREFIXES', ()))):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=getattr(settings, 'MEDIA_CACHE_MAX_AGE', 3600))
+
+
+@require_safe
+def media_view(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    name = os.path.relpath(full_path, settings.MEDIA_ROOT).replace(os.sep, '/')
+
+    access = _access(request, name)
+    if access is None:
+        # 404, а не 403 - не раскрываем, что файл существует
+        raise Http404
+    try:
+        stat = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    etag, mtime = _etag(stat), stat.st_mtime
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(mtime))
+    if not_modified is not None:
+        _set_cache_headers(not_modified, name, access, etag, mtime)
+        return not_modified
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    accel = getattr(settings, 'MEDIA_ACCEL', '')
+    if accel == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/') + name)
+    elif accel == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+    else:
+        response = _file_response(request, full_path, stat.st_size, content_type, etag, mtime)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    _set_cache_headers(response, name, access, etag, mtime)
+    return response
+
+
+def _file_response(request, full_path, size, content_type, etag, mtime):
+    file = open(full_path, 'rb')
+    byte_range = None
+    if 'Range' in request.headers and _if_range_matches(request, etag, mtime):
+        byte_range = _parse_range(request.headers['Range'], size)
+    if byte_range is False:
+        file.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, length = byte_range
+        response = FileResponse(_FileRange(file, start, length), content_type=content_type, status=206)
+        response['Content-Range'] = f'bytes {start}-{start + length - 1}/{size}'
+        response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,240 @@
+# uibar_project_new/metrics.py
+"""
+Метрики в формате Prometheus (эндпоинт /metrics).
+
+Под gunicorn каждый воркер - отдельный процесс со своими счётчиками, поэтому
+используется multiprocess-режим prometheus_client: если задана переменная
+окружения PROMETHEUS_MULTIPROC_DIR, значения пишутся в общий каталог и
+агрегируются при чтении /metrics. Каталог должен быть пустым при старте
+сервера и очищаться от умерших воркеров - это делает gunicorn.conf.py.
+Без переменной (runserver, тесты) используется обычный реестр процесса.
+"""
+import hmac
+import os
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core import checks
+from django.core.signals import request_finished
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess,
+)
+
+# Каталог создаёт gunicorn.conf.py при старте, но модуль импортируется и в manage.py
+# (collectstatic, migrate) - без каталога prometheus_client падает на первой метрике
+if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+# Границы корзин задержки HTTP-запросов (секунды)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# --- HTTP ---
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'Длительность обработки HTTP-запроса',
+    ['method', 'route'],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter(
+    'http_requests',
+    'Количество HTTP-запросов по статусу ответа',
+    ['method', 'route', 'status'],
+)
+REQUEST_EXCEPTIONS = Counter(
+    'http_request_exceptions',
+    'Необработанные исключения при обработке запроса',
+    ['method', 'route', 'exception'],
+)
+# livesum - сумма по живым воркерам: значения умерших процессов не учитываются
+IN_FLIGHT = Gauge(
+    'http_requests_in_flight',
+    'Запросы, обрабатываемые в данный момент',
+    multiprocess_mode='livesum',
+)
+BATCH_SUBREQUESTS = Counter(
+    'batch_subrequests',
+    'Подзапросы пакетного запроса /api/batch/ по статусу ответа',
+    ['method', 'route', 'status'],
+)
+
+# --- База данных ---
+DB_CONNECTIONS_OPEN = Gauge(
+    'db_connections_open',
+    'Открытые соединения с БД после завершения запроса (по всем воркерам)',
+    ['alias'],
+    multiprocess_mode='livesum',
+)
+DB_CONNECTIONS_CREATED = Counter(
+    'db_connections_created',
+    'Новые соединения с БД; быстрый рост - соединения не переиспользуются',
+    ['alias'],
+)
+DB_QUERIES = Histogram(
+    'db_queries_per_request',
+    'Количество SQL-запросов на HTTP-запрос',
+    ['route'],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200),
+)
+DB_QUERY_DURATION = Counter(
+    'db_query_duration_seconds',
+    'Суммарное время SQL-запросов',
+    ['route'],
+)
+
+# --- Кэш ---
+CACHE_REQUESTS = Counter(
+    'cache_requests',
+    'Обращения к кэшу; hit ratio = hit / (hit + miss)',
+    ['cache', 'result'],
+)
+CACHE_TIER_HITS = Counter(
+    'cache_tier_hits',
+    'Попадания двухуровневого кэша по уровням (local - LRU процесса, shared - общий кэш)',
+    ['cache', 'tier'],
+)
+CACHE_LOCAL_EVICTIONS = Counter(
+    'cache_local_evictions',
+    'Вытеснения из LRU процесса: size - по размеру, expired - по сроку',
+    ['cache', 'reason'],
+)
+CACHE_SINGLEFLIGHT_WAITS = Counter(
+    'cache_singleflight_waits',
+    'Промахи, дождавшиеся значения, которое вычислял другой процесс',
+    ['cache'],
+)
+
+# --- Сжатие ответов (CompressionMiddleware) ---
+COMPRESSION_ORIGINAL_BYTES = Counter(
+    'http_compression_original_bytes',
+    'Размер ответов до сжатия',
+    ['route', 'encoding'],
+)
+COMPRESSION_SAVED_BYTES = Counter(
+    'http_compression_saved_bytes',
+    'Байты, сэкономленные сжатием ответов',
+    ['route', 'encoding'],
+)
+
+# --- Gemini ---
+GEMINI_LATENCY = Histogram(
+    'gemini_request_duration_seconds',
+    'Длительность запроса к Gemini API',
+    ['operation'],
+    buckets=(0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0),
+)
+GEMINI_FAILURES = Counter(
+    'gemini_failures',
+    'Неудачные обращения к Gemini API',
+    ['operation', 'reason'],
+)
+
+
+def route_label(request):
+    """
+    Метка маршрута - имя URL (например apartments:apartment-detail), а не путь:
+    иначе каждый id квартиры порождал бы новую серию метрик.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route or 'unnamed'
+
+
+def record_batch_subrequest(method, route, status_code):
+    BATCH_SUBREQUESTS.labels(method, route or 'unnamed', str(status_code)).inc()
+
+
+def record_cache_access(cache_name, hit, tier=None):
+    """Учитывает попадание/промах кэша cache_name (tier - уровень попадания двухуровневого кэша)."""
+    CACHE_REQUESTS.labels(cache_name, 'hit' if hit else 'miss').inc()
+    if hit and tier:
+        CACHE_TIER_HITS.labels(cache_name, tier).inc()
+
+
+def record_cache_eviction(cache_name, reason):
+    CACHE_LOCAL_EVICTIONS.labels(cache_name, reason).inc()
+
+
+def record_cache_singleflight_wait(cache_name):
+    CACHE_SINGLEFLIGHT_WAITS.labels(cache_name).inc()
+
+
+def record_compression(route, encoding, original, compressed):
+    """Учитывает сжатый ответ: исходный размер и сэкономленные байты."""
+    COMPRESSION_ORIGINAL_BYTES.labels(route, encoding).inc(original)
+    COMPRESSION_SAVED_BYTES.labels(route, encoding).inc(max(0, original - compressed))
+
+
+@contextmanager
+def track_gemini(operation):
+    """Замеряет вызов Gemini; исключение считается отказом и пробрасывается дальше."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as exc:
+        GEMINI_FAILURES.labels(operation, type(exc).__name__).inc()
+        raise
+    finally:
+        GEMINI_LATENCY.labels(operation).observe(time.perf_counter() - started)
+
+
+@receiver(connection_created)
+def count_db_connection(sender, connection, **kwargs):
+    DB_CONNECTIONS_CREATED.labels(connection.alias).inc()
+
+
+@receiver(request_finished)
+def update_db_connections(sender, **kwargs):
+    # Подключен после close_old_connections Django, поэтому видит соединения,
+    # оставшиеся открытыми (CONN_MAX_AGE) после запроса
+    for connection in connections.all(initialized_only=True):
+        DB_CONNECTIONS_OPEN.labels(connection.alias).set(1 if connection.connection is not None else 0)
+
+
+def _registry():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+@checks.register(checks.Tags.security, deploy=True)
+def check_metrics_token(app_configs, **kwargs):
+    if not settings.DEBUG and not getattr(settings, 'METRICS_TOKEN', None):
+        return [checks.Warning(
+            "METRICS_TOKEN is not set: /metrics answers 403 while DEBUG is off.",
+            hint="Set METRICS_TOKEN and give Prometheus the same bearer token.",
+            id='uibar.W003',
+        )]
+    return []
+
+
+def metrics_view(request):
+    """
+    Отдаёт метрики в текстовом формате Prometheus.
+    Если задан METRICS_TOKEN, требуется заголовок Authorization: Bearer <token>;
+    без токена метрики отдаются только при DEBUG.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token:
+        # Маршруты, ошибки и нагрузка не должны быть видны всем на проде
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    else:
+        provided = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(provided, f'Bearer {token}'):
+            return HttpResponseForbidden()
+    return HttpResponse(generate_latest(_registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+def mark_process_dead(pid):
+    """Вызывается из gunicorn (child_exit): убирает livesum-значения умершего воркера."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,436 @@
+# uibar_project_new/middleware.py
+"""
+Middleware проекта.
+
+PerformanceMiddleware - инструментирование запросов: количество и время SQL,
+время сериализаторов DRF, view и рендеринга, размер ответа.
+Результаты отдаются в заголовке Server-Timing, пишутся в лог (с выборкой)
+вместе с обнаружением повторяющихся запросов (N+1), а для медленных
+запросов - с дампом выполненного SQL.
+
+MetricsMiddleware - метрики Prometheus (см. uibar_project_new.metrics):
+задержка и количество запросов по маршрутам, запросы в обработке, SQL.
+
+CompressionMiddleware - сжатие ответов API (Brotli или gzip по Accept-Encoding),
+в том числе потоковых; сэкономленные байты попадают в метрики.
+"""
+import contextvars
+import gzip
+import json
+import logging
+import random
+import time
+import zlib
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError: # Brotli необязателен - без него сжимаем только gzip
+    brotli = None
+
+from . import metrics
+
+logger = logging.getLogger('uibar.performance')
+
+# Статистика текущего запроса (contextvar - корректно и для потоков, и для async)
+_current_stats = contextvars.ContextVar('request_performance_stats', default=None)
+
+# Сколько SQL-запросов максимум храним для дампа одного запроса
+MAX_CAPTURED_STATEMENTS = 200
+
+
+class RequestStats:
+    __slots__ = (
+        'started', 'queries', 'sql_time', 'serializer_time', 'in_serializer',
+        'view_started', 'view_time', 'render_started', 'render_time',
+        'statements', 'query_counts',
+    )
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.in_serializer = False
+        self.view_started = None
+        self.view_time = 0.0
+        self.render_started = None
+        self.render_time = 0.0
+        self.statements = []
+        # Текст запроса уже параметризован (%s), поэтому одинаковый текст
+        # означает одинаковый запрос с разными параметрами - типичный N+1
+        self.query_counts = {}
+
+    def duplicates(self, threshold):
+        return sorted(
+            ((sql, count) for sql, count in self.query_counts.items() if count >= threshold),
+            key=lambda item: -item[1],
+        )
+
+
+def current_stats():
+    """Статистика текущего запроса или None вне инструментированного запроса."""
+    return _current_stats.get()
+
+
+def _sql_timer(execute, sql, params, many, context):
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.queries += 1
+        stats.sql_time += elapsed
+        stats.query_counts[sql] = stats.query_counts.get(sql, 0) + 1
+        if len(stats.statements) < MAX_CAPTURED_STATEMENTS:
+            stats.statements.append((sql, elapsed))
+
+
+def _timed_property(prop):
+    """Оборачивает property .data сериализатора DRF, накапливая время в статистике запроса."""
+    def getter(self):
+        stats = _current_stats.get()
+        # Вложенные сериализаторы учитываются во внешнем - не считаем время дважды
+        if stats is None or stats.in_serializer:
+            return prop.fget(self)
+        stats.in_serializer = True
+        started = time.perf_counter()
+        try:
+            return prop.fget(self)
+        finally:
+            stats.serializer_time += time.perf_counter() - started
+            stats.in_serializer = False
+    getter._performance_timed = True
+    return property(getter)
+
+
+def instrument_serializers():
+    """Подключает измерение времени сериализации DRF (один раз на процесс)."""
+    from rest_framework import serializers
+
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        prop = cls.__dict__['data']
+        if not getattr(prop.fget, '_performance_timed', False):
+            cls.data = _timed_property(prop)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+class PerformanceMiddleware:
+    """
+    Настройки (settings.py):
+    PERF_ENABLED, PERF_PATH_PREFIXES, PERF_SERVER_TIMING, PERF_LOG_SAMPLE_RATE,
+    PERF_SLOW_REQUEST_MS, PERF_SLOW_DUMP_SAMPLE_RATE, PERF_DUPLICATE_QUERY_THRESHOLD.
+    Накладные расходы - один счётчик на SQL-запрос и несколько вызовов perf_counter,
+    поэтому middleware можно держать включённым в продакшене.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'PERF_ENABLED', True)
+        self.path_prefixes = tuple(getattr(settings, 'PERF_PATH_PREFIXES', ('/api/',)))
+        self.server_timing = getattr(settings, 'PERF_SERVER_TIMING', settings.DEBUG)
+        self.log_sample_rate = getattr(settings, 'PERF_LOG_SAMPLE_RATE', 0.01)
+        self.slow_request_ms = getattr(settings, 'PERF_SLOW_REQUEST_MS', 1000)
+        self.slow_dump_sample_rate = getattr(settings, 'PERF_SLOW_DUMP_SAMPLE_RATE', 1.0)
+        self.duplicate_threshold = getattr(settings, 'PERF_DUPLICATE_QUERY_THRESHOLD', 5)
+        if self.enabled:
+            instrument_serializers()
+
+    def __call__(self, request):
+        if not self.enabled or not request.path.startswith(self.path_prefixes):
+            return self.get_response(request)
+
+        stats = RequestStats()
+        # Для MetricsMiddleware, которая стоит снаружи и читает статистику после ответа
+        request._performance_stats = stats
+        token = _current_stats.set(stats)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_sql_timer))
+                response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+
+        finished = time.perf_counter()
+        if stats.render_started is not None:
+            stats.render_time = finished - stats.render_started
+        elif stats.view_started is not None:
+            # Обычный HttpResponse без отдельного рендеринга
+            stats.view_time = finished - stats.view_started
+        total = finished - stats.started
+        size = None if response.streaming else len(response.content)
+
+        if self.server_timing:
+            response['Server-Timing'] = self._server_timing(stats, total)
+        self._log(request, response, stats, total, size)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF Response рендерится после view - засекаем начало рендеринга
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.render_started = time.perf_counter()
+            if stats.view_started is not None:
+                stats.view_time = stats.render_started - stats.view_started
+        return response
+
+    def _server_timing(self, stats, total):
+        return ', '.join([
+            f'db;dur={_ms(stats.sql_time)};desc="queries={stats.queries}"',
+            f'ser;dur={_ms(stats.serializer_time)}',
+            f'view;dur={_ms(stats.view_time)}',
+            f'render;dur={_ms(stats.render_time)}',
+            f'total;dur={_ms(total)}',
+        ])
+
+    def _log(self, request, response, stats, total, size):
+        duplicates = stats.duplicates(self.duplicate_threshold)
+        slow = total * 1000 >= self.slow_request_ms
+        sampled = random.random() < self.log_sample_rate
+        if not (duplicates or slow or sampled):
+            return
+
+        match = getattr(request, 'resolver_match', None)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'route': match.route if match else None,
+            'status': response.status_code,
+            'total_ms': _ms(total),
+            'view_ms': _ms(stats.view_time),
+            'db_ms': _ms(stats.sql_time),
+            'queries': stats.queries,
+            'serializer_ms': _ms(stats.serializer_time),
+            'render_ms': _ms(stats.render_time),
+            'response_bytes': size,
+        }
+        if duplicates:
+            record['duplicate_queries'] = [{'sql': sql, 'count': count} for sql, count in duplicates]
+        if slow and random.random() < self.slow_dump_sample_rate:
+            record['sql'] = [{'sql': sql, 'ms': _ms(elapsed)} for sql, elapsed in stats.statements]
+
+        level = logging.WARNING if slow or duplicates else logging.INFO
+        logger.log(level, json.dumps(record, ensure_ascii=False))
+
+
+class MetricsMiddleware:
+    """
+    Метрики Prometheus для всех запросов. Ставится первой в MIDDLEWARE, перед
+    PerformanceMiddleware, чтобы задержка включала остальные middleware.
+    Путь самого эндпоинта метрик (settings.METRICS_PATH) не учитывается.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.metrics_path = '/' + getattr(settings, 'METRICS_PATH', 'metrics').strip('/')
+
+    def __call__(self, request):
+        if request.path.rstrip('/') == self.metrics_path:
+            return self.get_response(request)
+
+        metrics.IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        except Exception as exc:
+            # Обычно исключения превращаются в 500 внутри Django, сюда доходят только
+            # те, что вылетели из middleware
+            metrics.REQUEST_EXCEPTIONS.labels(request.method, metrics.route_label(request), type(exc).__name__).inc()
+            raise
+        finally:
+            metrics.IN_FLIGHT.dec()
+
+        route = metrics.route_label(request)
+        metrics.REQUEST_LATENCY.labels(request.method, route).observe(time.perf_counter() - started)
+        metrics.REQUESTS.labels(request.method, route, str(response.status_code)).inc()
+
+        stats = getattr(request, '_performance_stats', None)
+        if stats is not None:
+            metrics.DB_QUERIES.labels(route).observe(stats.queries)
+            metrics.DB_QUERY_DURATION.labels(route).inc(stats.sql_time)
+        return response
+
+
+def parse_accept_encoding(header):
+    """Accept-Encoding -> {кодировка: q}; кодировки с q=0 клиент явно не принимает."""
+    accepted = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+class _GzipStream:
+    def __init__(self, level):
+        # wbits=31 - формат gzip (заголовок и контрольная сумма)
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        # SYNC_FLUSH - клиент получает каждый кусок сразу, не дожидаясь конца потока
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class _BrotliStream:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    Настройки (settings.py):
+    COMPRESSION_ENABLED, COMPRESSION_PATH_PREFIXES, COMPRESSION_MIN_SIZE,
+    COMPRESSION_ENCODINGS (порядок предпочтения), COMPRESSION_GZIP_LEVEL,
+    COMPRESSION_BROTLI_QUALITY, COMPRESSION_SKIP_CONTENT_TYPES и
+    COMPRESSION_ROUTES - переопределения по имени маршрута, например
+    {'apartments:owner-export': {'min_size': 0}, 'metrics': False}.
+    Уже сжатые ответы (Content-Encoding, изображения, архивы) и частичные
+    ответы (206) не трогаем.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'COMPRESSION_ENABLED', True)
+        self.path_prefixes = tuple(getattr(settings, 'COMPRESSION_PATH_PREFIXES', ('/api/',)))
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.encodings = tuple(
+            encoding for encoding in getattr(settings, 'COMPRESSION_ENCODINGS', ('br', 'gzip'))
+            if encoding == 'gzip' or (encoding == 'br' and brotli is not None)
+        )
+        self.gzip_level = getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6)
+        self.brotli_quality = getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5)
+        self.skip_content_types = tuple(getattr(settings, 'COMPRESSION_SKIP_CONTENT_TYPES', (
+            'image/', 'video/', 'audio/', 'application/zip', 'application/gzip', 'application/x-gzip',
+            'application/pdf', 'application/octet-stream',
+        )))
+        self.routes = getattr(settings, 'COMPRESSION_ROUTES', {})
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not self.enabled or not request.path.startswith(self.path_prefixes):
+            return response
+
+        route = metrics.route_label(request)
+        config = self.routes.get(route, {})
+        if config is False:
+            return response
+        if not self._compressible(response, config.get('min_size', self.min_size)):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = self._negotiate(request, config.get('encodings', self.encodings))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            self._compress_streaming(response, route, encoding)
+        else:
+            self._compress_content(response, route, encoding)
+        return response
+
+    def _compressible(self, response, min_size):
+        if response.has_header('Content-Encoding') or response.status_code in (204, 206, 304):
+            return False
+        if response.get('Content-Type', '').lower().startswith(self.skip_content_types):
+            return False
+        if response.streaming:
+            # Асинхронные потоки не сжимаем; известная малая длина - тоже не сжимаем
+            if getattr(response, 'is_async', False):
+                return False
+            length = response.get('Content-Length')
+            return length is None or int(length) >= min_size
+        return len(response.content) >= min_size
+
+    def _negotiate(self, request, encodings):
+        accepted = parse_accept_encoding(request.headers.get('Accept-Encoding', ''))
+        wildcard = accepted.get('*', 0.0)
+        best, best_quality = None, 0.0
+        for encoding in encodings:
+            if encoding not in self.encodings:
+                continue
+            quality = accepted.get(encoding, wildcard)
+            # При равном q побеждает кодировка, стоящая раньше в списке предпочтений
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def _stream(self, encoding):
+        if encoding == 'br':
+            return _BrotliStream(self.brotli_quality)
+        return _GzipStream(self.gzip_level)
+
+    def _compress_content(self, response, route, encoding):
+        original = response.content
+        if encoding == 'br':
+            compressed = brotli.compress(original, quality=self.brotli_quality)
+        else:
+            compressed = gzip.compress(original, compresslevel=self.gzip_level, mtime=0)
+        if len(compressed) >= len(original):
+            return
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        self._mark_encoded(response, encoding)
+        metrics.record_compression(route, encoding, len(original), len(compressed))
+
+    def _compress_streaming(self, response, route, encoding):
+        chunks = response.streaming_content
+        stream = self._stream(encoding)
+
+        def compressed_chunks():
+            original = compressed = 0
+            for chunk in chunks:
+                original += len(chunk)
+                data = stream.compress(chunk)
+                if data:
+                    compressed += len(data)
+                    yield data
+            tail = stream.finish()
+            compressed += len(tail)
+            yield tail
+            metrics.record_compression(route, encoding, original, compressed)
+
+        response.streaming_content = compressed_chunks()
+        if response.has_header('Content-Length'):
+            del response['Content-Length']
+        self._mark_encoded(response, encoding)
+
+    def _mark_encoded(self, response, encoding):
+        response['Content-Encoding'] = encoding
+        # Сжатое представление побайтово отличается - сильный ETag становится слабым
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
@@ -0,0 +1,41 @@
+# uibar_project_new/renderers.py
+"""
+Быстрый JSON-рендерер DRF на orjson.
+
+Вывод совпадает с rest_framework.renderers.JSONRenderer (компактный JSON в
+UTF-8, экранированные U+2028/U+2029): типы, которые orjson не знает или
+форматирует иначе (Decimal, datetime, lazy-строки), передаются стандартному
+JSONEncoder DRF. Если orjson не установлен, запрошен отступ (indent) или
+настройки DRF требуют другой формат - работает обычный JSONRenderer.
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError: # pragma: no cover - orjson необязателен
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+
+    def __init__(self):
+        super().__init__()
+        self._encoder = self.encoder_class()
+
+    def _default(self, obj):
+        return self._encoder.default(obj)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent is not None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # datetime/date/time - через кодировщик DRF: у orjson другой формат (Z, микросекунды)
+            ret = orjson.dumps(data, default=self._default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except (TypeError, ValueError):
+            # Например, целые больше 64 бит - orjson их не поддерживает
+            return super().render(data, accepted_media_type, renderer_context)
+        # Как в JSONRenderer: JSON должен оставаться подмножеством JavaScript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
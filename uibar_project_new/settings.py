@@ -53,6 +53,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres', # Индексы с классами операторов (OpClass) и т.п.
 
     # Сторонние приложения
     'rest_framework',
@@ -67,6 +68,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первыми - чтобы замеры включали все остальные middleware
+    'uibar_project_new.middleware.MetricsMiddleware',
+    'uibar_project_new.middleware.PerformanceMiddleware',
+    # Сжатие ответов API (до остальных middleware, чтобы они видели несжатое тело)
+    'uibar_project_new.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -185,9 +191,17 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend', 
-    )
+    ),
+    # JSON через orjson (тот же вывод, что у стандартного JSONRenderer, но быстрее)
+    'DEFAULT_RENDERER_CLASSES': (
+        'uibar_project_new.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
+# Списки квартир и отзывов через values() вместо экземпляров моделей (apartments/fastpath.py)
+FAST_LIST_ENABLED = os.getenv('FAST_LIST_ENABLED', 'True') == 'True'
+
 # Настройки Simple JWT
 from datetime import timedelta
 SIMPLE_JWT = {
@@ -222,7 +236,113 @@ SIMPLE_JWT = {
 }
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# --- Раздача медиа (uibar_project_new/media.py) ---
+# '' - FileResponse (sendfile в gunicorn), 'x-accel-redirect' - nginx, 'x-sendfile' - Apache/lighttpd
+MEDIA_ACCEL = os.getenv('MEDIA_ACCEL', '')
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/protected-media/') # internal-локация nginx
+MEDIA_ACCESS_CHECK = 'apartments.media.media_access'
+MEDIA_CACHE_MAX_AGE = int(os.getenv('MEDIA_CACHE_MAX_AGE', '3600'))
+# Файлы с адресацией по содержимому - Cache-Control: immutable на год
+MEDIA_IMMUTABLE_PREFIXES = ('apartments/ca/',)
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+
+# --- Инструментирование запросов (uibar_project_new.middleware.PerformanceMiddleware) ---
+PERF_ENABLED = os.getenv('PERF_ENABLED', 'True') == 'True'
+PERF_PATH_PREFIXES = ('/api/',) # Какие запросы измеряем
+# Заголовок Server-Timing; по умолчанию только при DEBUG - иначе любой клиент видит число SQL-запросов и тайминги
+PERF_SERVER_TIMING = os.getenv('PERF_SERVER_TIMING', str(DEBUG)) == 'True'
+PERF_LOG_SAMPLE_RATE = float(os.getenv('PERF_LOG_SAMPLE_RATE', '0.01')) # Доля запросов, попадающих в лог
+PERF_SLOW_REQUEST_MS = int(os.getenv('PERF_SLOW_REQUEST_MS', '1000')) # Медленные запросы логируются всегда
+PERF_SLOW_DUMP_SAMPLE_RATE = float(os.getenv('PERF_SLOW_DUMP_SAMPLE_RATE', '1.0')) # Доля медленных с дампом SQL
+PERF_DUPLICATE_QUERY_THRESHOLD = int(os.getenv('PERF_DUPLICATE_QUERY_THRESHOLD', '5')) # Порог N+1
+
+# --- Метрики Prometheus (uibar_project_new.metrics) ---
+# Для нескольких воркеров gunicorn задайте PROMETHEUS_MULTIPROC_DIR (см. gunicorn.conf.py)
+METRICS_PATH = 'metrics/'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN') # /metrics требует Authorization: Bearer <token>; без токена - только при DEBUG
+
+# --- Лента изменений каталога (apartments/changes.py) ---
+CHANGES_FEED_LAG_SECONDS = int(os.getenv('CHANGES_FEED_LAG_SECONDS', '5')) # Не отдаём изменения моложе - их транзакции могли ещё не закоммититься
+CHANGES_TOMBSTONE_RETENTION_DAYS = int(os.getenv('CHANGES_TOMBSTONE_RETENTION_DAYS', '90')) # Хранение следов удалённых квартир (purge_apartment_tombstones)
+
+# --- Индекс похожих квартир (apartments/similarity.py, команда build_similarity_index) ---
+SIMILARITY_INDEX_DIR = os.getenv('SIMILARITY_INDEX_DIR', str(BASE_DIR / 'var' / 'similarity'))
+SIMILARITY_TAIL_CAPACITY = int(os.getenv('SIMILARITY_TAIL_CAPACITY', '4096')) # Строк для дописывания; дальше индекс ждёт пересборки (cron)
+
+# --- Idempotency-Key для создания бронирований и загрузки фото (apartments/idempotency.py) ---
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv('IDEMPOTENCY_KEY_TTL_HOURS', '24')) # Сколько хранится первый ответ
+IDEMPOTENCY_LOCK_TIMEOUT_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT_SECONDS', '30')) # Ожидание параллельного запроса с тем же ключом
+
+# --- Кэш (uibar_project_new/tiered_cache.py) ---
+# На проде с несколькими воркерами gunicorn нужен общий кэш - Redis (CACHE_REDIS_URL, пакет redis):
+# без него инвалидация кэша доступности и справочников не доходит до других воркеров.
+# Без CACHE_REDIS_URL (разработка) - LocMemCache, свой в каждом процессе.
+# Файловый кэш не используем: FileBasedCache на каждую запись перечитывает весь каталог (_cull),
+# а add() в нём не атомарен.
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')
+if CACHE_REDIS_URL:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_REDIS_URL}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'OPTIONS': {'MAX_ENTRIES': 10000}}}
+CACHE_LOCAL_MAX_ENTRIES = int(os.getenv('CACHE_LOCAL_MAX_ENTRIES', '1000')) # Записей в LRU каждого процесса (на кэш)
+CACHE_LOCAL_TTL_SECONDS = int(os.getenv('CACHE_LOCAL_TTL_SECONDS', '30')) # Срок записи в LRU процесса
+CACHE_SHARED_TTL_SECONDS = int(os.getenv('CACHE_SHARED_TTL_SECONDS', '300')) # Срок записи в общем кэше; без Redis - и задержка изменений в других воркерах
+CACHE_VERSION_CHECK_SECONDS = float(os.getenv('CACHE_VERSION_CHECK_SECONDS', '1')) # Как часто процесс перечитывает версии - задержка инвалидации в других воркерах
+CACHE_LOCK_TIMEOUT_SECONDS = int(os.getenv('CACHE_LOCK_TIMEOUT_SECONDS', '10')) # Ожидание чужого вычисления при промахе (single-flight)
+
+# --- Доступность и цены для поисковой выдачи (apartments/availability.py) ---
+AVAILABILITY_CACHE_SECONDS = int(os.getenv('AVAILABILITY_CACHE_SECONDS', '60')) # Срок записи в кэше на диапазон дат
+
+# --- Секционирование бронирований по месяцу заезда (apartments/partitioning.py) ---
+BOOKING_PARTITION_MONTHS_AHEAD = int(os.getenv('BOOKING_PARTITION_MONTHS_AHEAD', '12')) # Секции создаются заранее на столько месяцев (migrate, ensure_booking_partitions)
+BOOKING_ARCHIVE_AFTER_MONTHS = int(os.getenv('BOOKING_ARCHIVE_AFTER_MONTHS', '24')) # archive_booking_partitions: месяцы старше уходят в архив
+BOOKING_ARCHIVE_DIR = os.getenv('BOOKING_ARCHIVE_DIR', str(BASE_DIR / 'var' / 'booking-archive'))
+
+# --- Текстовый поиск ?q= (apartments/search.py, команда build_search_index) ---
+SEARCH_INDEX_DIR = os.getenv('SEARCH_INDEX_DIR', str(BASE_DIR / 'var' / 'search'))
+SEARCH_DELTA_CAPACITY = int(os.getenv('SEARCH_DELTA_CAPACITY', '5000')) # Изменённых квартир в дельте; больше - индекс ждёт пересборки (cron)
+SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', '1000')) # Сколько лучших совпадений фильтруется и сортируется
+
+# --- Пакетные запросы /api/batch/ (uibar_project_new/batch.py) ---
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', '20')) # Подзапросов в одном пакете
+
+# --- Сжатие ответов API (uibar_project_new.middleware.CompressionMiddleware) ---
+# Статика сжимается WhiteNoise заранее, медиа (изображения) не сжимаются
+COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'True') == 'True'
+COMPRESSION_PATH_PREFIXES = ('/api/',)
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024')) # Меньше - не сжимаем, выигрыш меньше накладных расходов
+COMPRESSION_ENCODINGS = ('br', 'gzip') # Порядок предпочтения; br - только если установлен brotli
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5 # Для динамических ответов: почти как gzip по скорости, заметно лучше по размеру
+COMPRESSION_ROUTES = {
+    # Выгрузки большие и текстовые - сжимаем всегда
+    'apartments:owner-export': {'min_size': 0},
+}
+
+# --- Логирование ---
+# Строки логов производительности - JSON, удобно разбирать сборщиком логов
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'plain',
+        },
+    },
+    'loggers': {
+        'uibar.performance': {
+            'handlers': ['console'],
+            'level': os.getenv('PERF_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
 # --- Опционально для работы за прокси (как на Render) ---
 # SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 # USE_X_FORWARDED_HOST = True
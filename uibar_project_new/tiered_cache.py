@@ -0,0 +1,247 @@
+# uibar_project_new/tiered_cache.py
+"""
+Двухуровневый кэш для горячих, почти неизменных данных (справочник удобств и т.п.).
+
+Уровень 1 - LRU в памяти процесса: не больше CACHE_LOCAL_MAX_ENTRIES записей,
+каждая живёт CACHE_LOCAL_TTL_SECONDS. Попадание не стоит ни запроса к БД,
+ни обращения к общему кэшу.
+Уровень 2 - кэш Django CACHES['default']: на проде Redis, общий для всех
+воркеров gunicorn; при разработке - LocMemCache процесса (settings.py), и
+тогда изменения из другого процесса видны через CACHE_SHARED_TTL_SECONDS.
+
+Инвалидация - версиями: ключ записи включает версию пространства имён,
+invalidate() после коммита записывает в общий кэш новую версию, и прежние
+записи перестают читаться во всех воркерах. Версию процесс перечитывает из
+общего кэша не чаще раза в CACHE_VERSION_CHECK_SECONDS - столько другие
+воркеры могут отдавать прежнее значение; в процессе, который сделал
+изменение, новая версия действует сразу.
+
+Защита от лавины промахов (single-flight): при промахе значение вычисляет
+один поток процесса (блокировка по ключу), а между процессами - тот, кто
+первым взял блокировку cache.add() (атомарна в Redis); остальные ждут, пока
+значение появится в общем кэше, но не дольше CACHE_LOCK_TIMEOUT_SECONDS.
+Без общего кэша (check --deploy предупреждает) каждый процесс вычисляет сам.
+
+Статистика для настройки размеров и сроков: метрики cache_requests
+(hit/miss по кэшу), cache_tier_hits (на каком уровне попадание),
+cache_local_evictions (вытеснение по размеру и истечению) и
+cache_singleflight_waits, а по текущему процессу - TieredCache.stats().
+"""
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.db import transaction
+
+from . import metrics
+
+_MISSING = object()
+
+# Полосы блокировок single-flight: ключ -> одна из LOCK_STRIPES блокировок
+LOCK_STRIPES = 64
+# Пауза между проверками общего кэша при ожидании чужого вычисления
+LOCK_POLL_SECONDS = 0.05
+
+_instances = []
+
+# Бэкенды, которые не общие для процессов: инвалидация и single-flight только внутри процесса
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend in PROCESS_LOCAL_BACKENDS:
+        return [checks.Warning(
+            "The default cache is local to each process: cache invalidation does not reach other workers.",
+            hint="Set CACHE_REDIS_URL (requires the redis package).",
+            id='uibar.W001',
+        )]
+    if backend == 'django.core.cache.backends.filebased.FileBasedCache':
+        return [checks.Warning(
+            "FileBasedCache scans the whole cache directory on every write and its add() is not atomic.",
+            hint="Set CACHE_REDIS_URL (requires the redis package).",
+            id='uibar.W002',
+        )]
+    return []
+
+
+class LocalLRU:
+    """Ограниченный LRU с TTL в памяти процесса."""
+
+    def __init__(self, name, max_entries):
+        self.name = name
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # ключ -> (истекает, значение)
+        self._lock = threading.Lock()
+        self.evictions = {'size': 0, 'expired': 0}
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            expires, value = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                self._evicted('expired')
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._evicted('size')
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _evicted(self, reason):
+        self.evictions[reason] += 1
+        metrics.record_cache_eviction(self.name, reason)
+
+
+class TieredCache:
+    """
+    Кэш name: get_or_set(key, compute, namespace) читает LRU процесса, затем
+    общий кэш, и только при промахе обоих вызывает compute() (single-flight).
+    invalidate(namespace) сбрасывает все ключи пространства имён.
+    """
+
+    def __init__(self, name, local_ttl=None, shared_ttl=None, max_entries=None, alias='default'):
+        self.name = name
+        self.alias = alias
+        self.local_ttl = local_ttl if local_ttl is not None else getattr(settings, 'CACHE_LOCAL_TTL_SECONDS', 30)
+        self.shared_ttl = shared_ttl if shared_ttl is not None else getattr(settings, 'CACHE_SHARED_TTL_SECONDS', 300)
+        self.local = LocalLRU(name, max_entries or getattr(settings, 'CACHE_LOCAL_MAX_ENTRIES', 1000))
+        self._versions = {}  # пространство имён -> (проверить после, версия)
+        self._versions_lock = threading.Lock()
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self.hits = {'local': 0, 'shared': 0}
+        self.misses = 0
+        _instances.append(self)
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def _version_key(self, namespace):
+        return f'{self.name}:version:{namespace}'
+
+    def _version(self, namespace):
+        now = time.monotonic()
+        with self._versions_lock:
+            known = self._versions.get(namespace)
+        if known is not None and known[0] > now:
+            return known[1]
+        key = self._version_key(namespace)
+        version = self.shared.get(key)
+        if version is None:
+            # Новая версия, а не 0: иначе после вытеснения ключа версии читались бы старые записи
+            self.shared.add(key, time.time_ns(), timeout=None)
+            version = self.shared.get(key)
+        self._remember_version(namespace, version)
+        return version
+
+    def _remember_version(self, namespace, version):
+        check_after = time.monotonic() + getattr(settings, 'CACHE_VERSION_CHECK_SECONDS', 1)
+        with self._versions_lock:
+            self._versions[namespace] = (check_after, version)
+
+    def invalidate(self, namespace):
+        """Сбросить ключи namespace во всех процессах после коммита текущей транзакции."""
+        def bump():
+            version = time.time_ns()
+            self.shared.set(self._version_key(namespace), version, timeout=None)
+            self._remember_version(namespace, version)
+        transaction.on_commit(bump)
+
+    def get_or_set(self, key, compute, namespace=None):
+        namespace = namespace or key
+        full_key = f'{self.name}:{self._version(namespace)}:{key}'
+        value = self._lookup(full_key)
+        if value is _MISSING:
+            value = self._compute_once(full_key, compute)
+        return value
+
+    def _lookup(self, full_key):
+        value = self.local.get(full_key)
+        if value is not _MISSING:
+            self._hit('local')
+            return value
+        value = self.shared.get(full_key, _MISSING)
+        if value is not _MISSING:
+            self.local.set(full_key, value, self.local_ttl)
+            self._hit('shared')
+        return value
+
+    def _hit(self, tier):
+        self.hits[tier] += 1
+        metrics.record_cache_access(self.name, True, tier)
+
+    def _compute_once(self, full_key, compute):
+        # Потоки процесса с тем же ключом ждут первого и берут его результат из LRU
+        with self._locks[zlib.crc32(full_key.encode()) % LOCK_STRIPES]:
+            value = self._lookup(full_key)
+            if value is not _MISSING:
+                return value
+            lock_key = f'{full_key}:lock'
+            lock_timeout = getattr(settings, 'CACHE_LOCK_TIMEOUT_SECONDS', 10)
+            deadline = time.monotonic() + lock_timeout
+            locked = self.shared.add(lock_key, 1, timeout=lock_timeout)
+            if not locked:
+                metrics.record_cache_singleflight_wait(self.name)
+            while not locked and time.monotonic() < deadline:
+                # Значение вычисляет другой процесс
+                time.sleep(LOCK_POLL_SECONDS)
+                value = self._lookup(full_key)
+                if value is not _MISSING:
+                    return value
+            self.misses += 1
+            metrics.record_cache_access(self.name, False)
+            try:
+                value = compute()
+                self.shared.set(full_key, value, timeout=self.shared_ttl)
+                self.local.set(full_key, value, self.local_ttl)
+            finally:
+                if locked:
+                    self.shared.delete(lock_key)
+            return value
+
+    def clear_local(self):
+        self.local.clear()
+        with self._versions_lock:
+            self._versions.clear()
+
+    def stats(self):
+        """Счётчики текущего процесса: попадания по уровням, промахи, вытеснения, размер LRU."""
+        requests = self.hits['local'] + self.hits['shared'] + self.misses
+        return {
+            'hits': dict(self.hits),
+            'misses': self.misses,
+            'hit_ratio': (requests - self.misses) / requests if requests else None,
+            'evictions': dict(self.local.evictions),
+            'local_entries': len(self.local),
+            'local_max_entries': self.local.max_entries,
+        }
+
+
+def clear_local():
+    """Очистить уровень процесса всех кэшей (тесты, сброс после восстановления БД)."""
+    for instance in _instances:
+        instance.clear_local()
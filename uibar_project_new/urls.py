@@ -16,10 +16,12 @@ Including another URLconf
 """
 # uibar_project_new/urls.py
 from django.contrib import admin
-from django.urls import path, include # Не забудь добавить include
-# --- Добавляем импорты для медиафайлов ---
+from django.urls import path, re_path, include # Не забудь добавить include
 from django.conf import settings
-from django.conf.urls.static import static
+
+from .batch import BatchView
+from .media import media_view
+from .metrics import metrics_view
 
 
 urlpatterns = [
@@ -29,9 +31,15 @@ urlpatterns = [
     # Все URL из auth_app будут доступны по префиксу /api/auth/
     path('api/auth/', include('auth_app.urls', namespace='auth_app')),
    
+    # Несколько запросов на чтение за один (до include('apartments.urls') с тем же префиксом)
+    path('api/batch/', BatchView.as_view(), name='batch'),
+
     # Префикс /api/ будет добавлен ко всем URL из router (т.е. /api/apartments/ и /api/amenities/)
     path('api/', include('apartments.urls', namespace='apartments')),
+
+    # Метрики Prometheus
+    path(settings.METRICS_PATH, metrics_view, name='metrics'),
+
+    # Медиафайлы с проверкой доступа (на проде отдаёт прокси, см. media.py)
+    re_path(rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>.+)$', media_view, name='media'),
 ]
-# --- Добавляем раздачу медиафайлов в режиме DEBUG ---
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file